@@ -13,11 +13,14 @@
 #     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from typing import Hashable
+
 import bpy
-from mathutils import Vector
+import numpy as np
 
-bound_box_base = [(-1.0, -1.0, -1.0), (-1.0, -1.0, 1.0), (-1.0, 1.0, 1.0), (-1.0, 1.0, -1.0),
-                  (1.0, -1.0, -1.0), (1.0, -1.0, 1.0), (1.0, 1.0, 1.0), (1.0, 1.0, -1.0)]
+from .core.BoxStore import BoxStore
+from .core.cull_util import transformed_box_corners
+from .obj_util import ObjectArrays
 
 
 def valid_bound_box(obj: bpy.types.Object) -> bool:
@@ -31,54 +34,149 @@ def valid_bound_box(obj: bpy.types.Object) -> bool:
     return not all([obj.bound_box[0][0] == obj.bound_box[i][j] for i in range(8) for j in range(3)])
 
 
+def valid_bound_boxes(bound_boxes: np.ndarray) -> np.ndarray:
+    """Returns whether each bounding box is valid, like ``valid_bound_box``.
+
+    :param bound_boxes: local bounding box corners of each object, shape (N, 8, 3)
+    """
+    return ~np.all(bound_boxes == bound_boxes[:, :1, :1], axis=(1, 2))
+
+
+def shared_box_key(obj: bpy.types.Object) -> tuple[str, str]:
+    """Returns the key of an object's local box with a valid bounding box, not instancing a collection:
+    its data's if it has no modifiers, so objects sharing the data share the box, or its own otherwise.
+
+    :param obj: object to key
+    """
+    if obj.data is not None and not obj.modifiers:
+        return 'DATA', obj.data.name_full
+    return 'OBJECT', obj.name_full
+
+
 class BoundBoxCache:
-    """Blender object wrapper to hold cache of bounding boxes."""
+    """Blender object wrapper to hold cache of bounding boxes.
+
+    Boxes are kept in a ``BoxStore``: one local box per mesh (or per object with modifiers),
+    per instanced collection and per minimum box size, plus one world matrix per object,
+    instead of 8 world-space vectors per object.
+    """
 
     def __init__(self):
-        self.collection_cache = {}
-        self.object_cache = {}
+        self.store = BoxStore()
 
-    def bound_box_calc(self, obj: bpy.types.Object, min_box_size: float) -> list[Vector]:
-        """Returns - as a list of corners - an object's existing bounding box,
-        otherwise calculates one based on object type.
+    def invalidate(self, obj_name: str):
+        """Forgets an object's cached bounding box, so it is recalculated on next use.
+
+        :param obj_name: full name of the object
+        """
+        self.store.remove_obj(obj_name)
+        self.store.drop_local(('OBJECT', obj_name))
+
+    def invalidate_collection(self, coll_name: str):
+        """Forgets an instanced collection's cached bounding box, so it is recalculated on next use.
+
+        :param coll_name: name of the collection
+        """
+        self.store.drop_local(('COLLECTION', coll_name))
+
+    def rename(self, old_name: str, new_name: str):
+        """Moves a renamed object's cached bounding box to its new name.
+
+        :param old_name: previous full name of the object
+        :param new_name: current full name of the object
+        """
+        self.store.rename_obj(old_name, new_name)
+        self.store.rename_local(('OBJECT', old_name), ('OBJECT', new_name))
+
+    def cache_local_box(self, obj: bpy.types.Object, min_box_size: float) -> Hashable:
+        """Stores an object's box in local space and returns its key in the store.
 
         If the object is instancing a collection,
         the function recursively calculates an enclosing box around all the instance's objects.
+        Objects without modifiers share the box of their data, objects without a valid box share a box sized
+        by ``min_box_size``.
+
+        :param obj: object whose box is stored
+        :param min_box_size: minimum allowed bounding box size
+        """
+        if obj.is_instancer and obj.instance_type == 'COLLECTION':
+            coll = obj.instance_collection
+            key = ('COLLECTION', coll.name)
+            if self.store.has_local(key):
+                return key
+            # member boxes are relative to the collection, so they can be reused by every instancer
+            member_corners = self.corners(coll.all_objects, min_box_size).reshape(-1, 3)
+            points = np.concatenate((member_corners - np.array(coll.instance_offset), np.array(obj.bound_box)))
+            self.store.set_local(key, points.min(axis=0), points.max(axis=0))
+            return key
+
+        if not valid_bound_box(obj):
+            key = ('MIN_BOX', min_box_size)
+            self.store.set_local(key, (-min_box_size,) * 3, (min_box_size,) * 3)
+            return key
+
+        key = shared_box_key(obj)
+        points = np.array(obj.bound_box)
+        self.store.set_local(key, points.min(axis=0), points.max(axis=0))
+        return key
+
+    def cache(self, obj: bpy.types.Object, min_box_size: float):
+        """Stores an object's bounding box, unless already cached.
+
+        :param obj: object whose box is stored
+        :param min_box_size: minimum allowed bounding box size
+        """
+        if obj.name_full not in self.store:
+            key = self.cache_local_box(obj, min_box_size)
+            self.store.set_obj(obj.name_full, key, obj.matrix_world)
+
+    def cache_arrays(self, objs: list[bpy.types.Object], arrays: ObjectArrays, min_box_size: float) -> np.ndarray:
+        """Stores many objects' bounding boxes from attributes read at once,
+        and returns their world-space corners, shape (N, 8, 3).
+
+        Validity, the minimum box fallback and world-space corners are computed for all objects at once.
+        Objects instancing a collection are cached one by one, since their boxes enclose other objects.
+
+        :param objs: objects whose boxes are stored
+        :param arrays: attributes of ``objs``, in the same order
+        :param min_box_size: minimum allowed bounding box size
+        """
+        instancing = np.zeros(len(objs), dtype=bool)
+        for idx in np.flatnonzero(arrays.is_instancer):
+            instancing[idx] = objs[idx].instance_type == 'COLLECTION'
+        valid = valid_bound_boxes(arrays.bound_boxes)
+        box_min = np.where(valid[:, np.newaxis], arrays.bound_boxes.min(axis=1), -min_box_size)
+        box_max = np.where(valid[:, np.newaxis], arrays.bound_boxes.max(axis=1), min_box_size)
+
+        plain = np.flatnonzero(~instancing)
+        min_box_key = ('MIN_BOX', min_box_size)
+        keys = [shared_box_key(objs[idx]) if valid[idx] else min_box_key for idx in plain]
+        local_rows = self.store.set_locals(keys, box_min[plain], box_max[plain])
+        self.store.set_objs([arrays.names[idx] for idx in plain], local_rows, arrays.matrices[plain])
+
+        corners = np.empty((len(objs), 8, 3))
+        corners[plain] = transformed_box_corners(box_min[plain], box_max[plain], arrays.matrices[plain])
+        instancers = np.flatnonzero(instancing)
+        if len(instancers):
+            corners[instancers] = self.corners([objs[idx] for idx in instancers], min_box_size)
+        return corners
+
+    def corners(self, objs, min_box_size: float) -> np.ndarray:
+        """Returns the world-space corners of objects' bounding boxes, shape (N, 8, 3),
+        calculating those not cached yet.
+
+        :param objs: objects whose boxes are returned
+        :param min_box_size: minimum allowed bounding box size
+        """
+        for obj in objs:
+            self.cache(obj, min_box_size)
+        return self.store.world_corners([obj.name_full for obj in objs])
+
+    def bound_box_calc(self, obj: bpy.types.Object, min_box_size: float) -> np.ndarray:
+        """Returns - as an array of 8 corners - an object's existing bounding box,
+        otherwise calculates one based on object type.
 
         :param obj:
         :param min_box_size:
         """
-        if obj.name_full in self.object_cache:
-            return self.object_cache[obj.name_full]
-
-        # coalesce bound box based on collection
-        # cannot cache with matrix_world, so that will need to be calculated each time
-        if obj.is_instancer and obj.instance_type == 'COLLECTION':
-            coll_name = obj.instance_collection.name
-            if coll_name in self.collection_cache:
-                coalesced_bb = self.collection_cache[obj.instance_collection.name]
-                return [obj.matrix_world @ v for v in coalesced_bb]
-            coll_instance_offset = Vector(obj.instance_collection.instance_offset)
-            coll_instance_offset.negate()
-            bound_boxes = [
-                              [v + coll_instance_offset for v in
-                               self.bound_box_calc(coll_obj, min_box_size)]
-                              for coll_obj
-                              in obj.instance_collection.all_objects] + [obj.bound_box]
-            x1, x2 = min((x for b in bound_boxes for x, _, _ in b)), max((x for b in bound_boxes for x, _, _ in b))
-            y1, y2 = min((y for b in bound_boxes for _, y, _ in b)), max((y for b in bound_boxes for _, y, _ in b))
-            z1, z2 = min((z for b in bound_boxes for _, _, z in b)), max((z for b in bound_boxes for _, _, z in b))
-            coalesced_bb = [Vector((x1, y1, z1)), Vector((x1, y1, z2)), Vector((x1, y2, z2)), Vector((x1, y2, z1)),
-                            Vector((x2, y1, z1)), Vector((x2, y1, z2)), Vector((x2, y2, z2)), Vector((x2, y2, z1))]
-            self.collection_cache[coll_name] = coalesced_bb
-            obj_box = [obj.matrix_world @ v for v in coalesced_bb]
-            self.object_cache[obj.name_full] = obj_box
-            return obj_box
-
-        if valid_bound_box(obj):
-            obj_box = [obj.matrix_world @ Vector((v[0], v[1], v[2])) for v in obj.bound_box]
-        else:
-            obj_box = [obj.matrix_world @ Vector((x * min_box_size, y * min_box_size, z * min_box_size))
-                       for x, y, z in bound_box_base]
-        self.object_cache[obj.name_full] = obj_box
-        return obj_box
+        return self.corners([obj], min_box_size)[0]
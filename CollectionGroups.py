@@ -0,0 +1,105 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Iterator, Optional
+
+import bpy
+import numpy as np
+
+min_group_size = 8
+"""Fewest objects a collection must hold to be hidden as a whole."""
+
+
+def iter_visible_layer_collections(layer_coll: bpy.types.LayerCollection) -> Iterator[bpy.types.LayerCollection]:
+    """Returns an iterator of a layer collection's descendants that are neither excluded nor hidden,
+    skipping the descendants of those that are.
+
+    :param layer_coll: layer collection whose descendants are visited
+    """
+    for child in layer_coll.children:
+        if child.exclude or child.hide_viewport:
+            continue
+        yield child
+        yield from iter_visible_layer_collections(child)
+
+
+class CollectionGroups:
+    """Collections whose objects can all be hidden at once through their layer collection's ``hide_viewport``,
+    instead of one ``hide_set`` call per object.
+
+    Only collections without child collections qualify, whose objects are all viable and in no other collection,
+    so hiding the collection hides exactly those objects and nothing else.
+    """
+
+    def __init__(self, view_layer: Optional[bpy.types.ViewLayer] = None,
+                 obj_indices: Optional[dict[int, int]] = None, obj_count: int = 0):
+        """
+        :param view_layer: view layer whose layer collections are hidden, no groups are made if not given
+        :param obj_indices: index of each viable object, keyed by its pointer
+        :param obj_count: number of viable objects
+        """
+        self.layer_colls = []
+        """Layer collection of each group."""
+        member_lists = []
+        if view_layer is not None:
+            for layer_coll in iter_visible_layer_collections(view_layer.layer_collection):
+                coll = layer_coll.collection
+                if coll.children or len(coll.objects) < min_group_size:
+                    continue
+                if any(len(o.users_collection) != 1 for o in coll.objects):
+                    continue
+                members = [obj_indices.get(o.as_pointer()) for o in coll.objects]
+                if None in members:
+                    continue
+                self.layer_colls.append(layer_coll)
+                member_lists.append(members)
+
+        sizes = [len(members) for members in member_lists]
+        self.members = np.array([idx for members in member_lists for idx in members], dtype=np.int64)
+        """Indices of the viable objects of every group, one group after another."""
+        self.offsets = np.cumsum([0] + sizes, dtype=np.int64)[:-1]
+        """Start of each group in ``members``."""
+        self.group_ids = np.full(obj_count, -1, dtype=np.int32)
+        """Group of each viable object, or -1 if it is in none."""
+        self.group_ids[self.members] = np.repeat(np.arange(len(sizes), dtype=np.int32), sizes)
+        self.hidden = np.zeros(len(sizes), dtype=bool)
+        """Whether each group's layer collection was hidden as a whole."""
+
+    def __len__(self) -> int:
+        return len(self.layer_colls)
+
+    def group_members(self, group_idx: int) -> np.ndarray:
+        """Returns indices of a group's viable objects.
+
+        :param group_idx: index of the group
+        """
+        end = self.offsets[group_idx + 1] if group_idx + 1 < len(self.offsets) else len(self.members)
+        return self.members[self.offsets[group_idx]:end]
+
+    def any_visible(self, visible: np.ndarray) -> np.ndarray:
+        """Returns whether any object of each group should be visible.
+
+        :param visible: desired visibility of each viable object
+        """
+        if len(self) == 0:
+            return np.zeros(0, dtype=bool)
+        return np.logical_or.reduceat(visible[self.members], self.offsets)
+
+    def free_mask(self) -> np.ndarray:
+        """Returns whether each viable object is controlled on its own, i.e. not in a hidden group."""
+        free = np.ones(len(self.group_ids), dtype=bool)
+        in_group = self.group_ids >= 0
+        free[in_group] = ~self.hidden[self.group_ids[in_group]]
+        return free
@@ -0,0 +1,475 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Iterator, Optional
+
+import bpy
+import numpy as np
+
+from .budget import budget_factory, BaseBudget, MeshStatsCache, disk_cache_path
+from .coll_util import find_instanced_objs_in_colls
+from .core.BoundBoxBVH import BoundBoxBVH
+from .BoundBoxCache import BoundBoxCache
+from .CollectionGroups import CollectionGroups
+from .obj_util import ObjectArrays, object_arrays
+
+
+def build_obj_budget_cost_cache(all_objs: list[bpy.types.Object], context: bpy.types.Context, min_box_size: float,
+                                budgeter: BaseBudget = None,
+                                bb_cache_calculator: BoundBoxCache = None) -> tuple[dict, np.ndarray]:
+    """Returns a tuple of (budget cache, bounding box corners), where the budget cache keys are object names
+    and the corners have shape (N, 8, 3), in the order of ``all_objs``.
+
+    :param all_objs: all objects in the scene.
+    :param context: Blender context.
+    :param min_box_size: minimum allowed bounding box size per object.
+    :param budgeter: budget manager calculating costs, chosen from context if not given.
+    :param bb_cache_calculator: bounding box calculator, a new one is created if not given.
+    """
+    if budgeter is None:
+        budgeter = budget_factory(context)()
+    budget_cache = {obj.name_full: budgeter.budget_cost(context, obj) for obj in all_objs}
+    if bb_cache_calculator is None:
+        bb_cache_calculator = BoundBoxCache()
+    return budget_cache, bb_cache_calculator.corners(all_objs, min_box_size)
+
+
+class SceneCache:
+    """Viable objects of a scene, with their budget costs and bounding boxes.
+
+    ``viable_objs``, ``obj_names``, ``shown``, ``hide_flags``, ``revealed_times``, ``degraded``, ``corners``,
+    ``costs``, ``degraded_costs`` and ``origins`` share the same order,
+    so the arrays can be handed to the culling core as they are.
+    Entries are patched from depsgraph updates, so moving, editing, adding, removing or renaming objects
+    does not require rebuilding the whole cache.
+    """
+
+    def __init__(self, valid_obj_types: set[str], exclude_objs_in_instances: bool, min_box_size: float):
+        """
+        :param valid_obj_types: object types that can be hidden or revealed.
+        :param exclude_objs_in_instances: whether to omit objects in instanced collections.
+        :param min_box_size: minimum allowed bounding box size per object.
+        """
+        self.valid_obj_types = valid_obj_types
+        self.exclude_objs_in_instances = exclude_objs_in_instances
+        self.min_box_size = min_box_size
+
+        self.scene_name = ''
+        self.excluded_objs = set()
+        self.scene_obj_count = 0
+        self.budgeter = BaseBudget()
+        self.bb_calculator = BoundBoxCache()
+        self.cost_cache = {}
+        self.degrade_action = 'HIDE'
+        """One of ``obj_config.over_budget_actions``, which ``degraded_costs`` are calculated for."""
+        self.degraded_cost_cache = {}
+
+        self.viable_objs = []
+        """Objects that can be potentially revealed or hidden in the viewport."""
+        self.obj_names = []
+        """Names of ``viable_objs`` when they were cached, used to detect renames."""
+        self.obj_indices = {}
+        """Index of each viable object, keyed by its pointer."""
+        self.instancer_indices = {}
+        """Indices of viable objects instancing a collection, keyed by collection name."""
+        self.shown = np.zeros(0, dtype=bool)
+        """Visibility last applied to each viable object."""
+        self.hide_flags = np.zeros(0, dtype=bool)
+        """Whether each viable object is hidden on its own with ``hide_set``,
+        which differs from ``shown`` while its collection is hidden as a whole."""
+        self.groups = CollectionGroups()
+        """Collections of viable objects that can be hidden as a whole."""
+        self.revealed_times = np.zeros(0)
+        """Time each viable object was last revealed, or negative infinity if never."""
+        self.degraded = np.zeros(0, dtype=np.int8)
+        """Index in ``obj_config.over_budget_actions`` of the reduced detail last applied to each viable object,
+        or 0 if shown with its own display settings."""
+        self.display_originals = {}
+        """Tuples of (object, display settings before it was degraded), keyed by object pointer."""
+        self.corners = np.zeros((0, 8, 3))
+        """Bounding box corners of each viable object, shape (N, 8, 3)."""
+        self.costs = np.zeros(0)
+        """Budget cost of each viable object."""
+        self.degraded_costs = np.zeros(0)
+        """Budget cost of each viable object shown with reduced detail."""
+        self.origins = np.zeros((0, 3))
+        """World location of each viable object's origin, shape (N, 3)."""
+        self.bvh = BoundBoxBVH(self.corners)
+        self.bvh_dirty = False
+        self.is_building = False
+        self.toggled = set()
+        """Pointers of objects whose visibility changed since the last depsgraph update."""
+        self.visible_count = None
+        """Number of visible objects in the view layer at the last scene update, None if not counted yet."""
+        self.visibility_version = 0
+        """Incremented whenever visibility is applied by a live pass or re-read after outside changes,
+        so baked playback knows its own record of the visibility is stale."""
+
+    def is_viable(self, obj: bpy.types.Object) -> bool:
+        """Returns True if the object can be hidden or revealed, False otherwise.
+
+        :param obj: object to be checked
+        """
+        return (obj.type in self.valid_obj_types
+                and obj.name_full not in self.excluded_objs
+                and not obj.hide_viewport)
+
+    def viable_mask(self, arrays: ObjectArrays) -> np.ndarray:
+        """Returns whether each object can be hidden or revealed, like ``is_viable``.
+
+        :param arrays: attributes of the objects to be checked
+        """
+        return (np.isin(arrays.types, list(self.valid_obj_types))
+                & np.array([name not in self.excluded_objs for name in arrays.names], dtype=bool)
+                & ~arrays.hide_viewport)
+
+    def build(self, context: bpy.types.Context):
+        """Rebuilds all caches for the scene's objects at once.
+
+        :param context: Blender context
+        """
+        for _ in self.iter_build(context):
+            pass
+
+    def iter_build(self, context: bpy.types.Context, chunk_size: int = 64) -> Iterator[tuple[int, int]]:
+        """Rebuilds all caches for the scene's objects, one chunk of objects at a time.
+
+        After each chunk, yields the number of objects cached so far and the total number of viable objects.
+        Cached objects are added to ``viable_objs`` right away, so culling can start on them.
+        The tree is only built after the last chunk, see ``ensure_bvh``.
+        Bounding boxes and origins of all objects are read and computed at once before the first chunk,
+        so only budget costs and visibility are read chunk by chunk.
+
+        :param context: Blender context, which must stay valid between chunks (e.g. ``bpy.context``)
+        :param chunk_size: number of objects cached per chunk
+        """
+        scene = context.scene
+        self.scene_name = scene.name
+        self.excluded_objs = set()
+        if self.exclude_objs_in_instances:
+            self.excluded_objs = {o.name_full for o in find_instanced_objs_in_colls(scene.collection)}
+
+        arrays = object_arrays(scene.objects)
+        viable = np.flatnonzero(self.viable_mask(arrays))
+        scene_objs = list(scene.objects)
+        objs = [scene_objs[idx] for idx in viable]
+        arrays = arrays.subset(viable)
+        self.scene_obj_count = len(scene_objs)
+
+        cache_path = disk_cache_path(context)
+        self.budgeter = budget_factory(context)(MeshStatsCache(cache_path) if cache_path else None)
+        self.bb_calculator = BoundBoxCache()
+        self.cost_cache = {}
+        self.degrade_action = context.window_manager.nl_over_budget_action
+        self.degraded_cost_cache = {}
+
+        self.is_building = True
+        self.bvh = None
+        self.index_objs([], reset=True)
+        corners = self.bb_calculator.cache_arrays(objs, arrays, self.min_box_size)
+        costs = np.empty(len(objs))
+        degraded_costs = np.empty(len(objs))
+        origins = arrays.matrices[:, :3, 3].copy()
+        shown = np.empty(len(objs), dtype=bool)
+        revealed_times = np.full(len(objs), -np.inf)
+        degraded = np.zeros(len(objs), dtype=np.int8)
+        for start in range(0, len(objs), chunk_size):
+            chunk = objs[start:start + chunk_size]
+            end = start + len(chunk)
+            chunk_names = arrays.names[start:end]
+            chunk_costs = [self.budgeter.budget_cost(context, o) for o in chunk]
+            self.cost_cache.update(zip(chunk_names, chunk_costs))
+            costs[start:end] = chunk_costs
+            degraded_costs[start:end] = [self.cache_degraded_cost(context, o) for o in chunk]
+            shown[start:end] = [not o.hide_get() for o in chunk]
+
+            self.index_objs(chunk, chunk_names)
+            self.corners, self.costs, self.origins = corners[:end], costs[:end], origins[:end]
+            self.degraded_costs = degraded_costs[:end]
+            self.shown, self.revealed_times, self.degraded = shown[:end], revealed_times[:end], degraded[:end]
+            self.hide_flags = ~self.shown
+            self.groups = CollectionGroups(obj_count=end)
+            yield end, len(objs)
+
+        self.save_mesh_stats()
+        self.corners, self.costs, self.origins = corners, costs, origins
+        self.degraded_costs = degraded_costs
+        self.shown, self.revealed_times, self.degraded = shown, revealed_times, degraded
+        self.hide_flags = ~shown
+        self.groups = CollectionGroups(context.view_layer, self.obj_indices, len(objs))
+        self.bvh = BoundBoxBVH(self.corners)
+        self.bvh_dirty = False
+        self.is_building = False
+
+    def cache_degraded_cost(self, context: bpy.types.Context, obj: bpy.types.Object) -> int:
+        """Calculates, caches and returns an object's cost shown with reduced detail for the current action.
+
+        :param context: Blender context
+        :param obj: viable object
+        """
+        cost = 0
+        if self.degrade_action != 'HIDE':
+            cost = self.budgeter.degraded_cost(context, obj, self.degrade_action)
+        self.degraded_cost_cache[obj.name_full] = cost
+        return cost
+
+    def set_degrade_action(self, context: bpy.types.Context, action: str):
+        """Recalculates the costs of viable objects shown with reduced detail, if the action changed.
+
+        :param context: Blender context
+        :param action: one of ``obj_config.over_budget_actions``
+        """
+        if action == self.degrade_action:
+            return
+        self.degrade_action = action
+        self.degraded_cost_cache = {}
+        self.degraded_costs = np.array([self.cache_degraded_cost(context, o) for o in self.viable_objs],
+                                       dtype=np.float64)
+
+    def save_mesh_stats(self):
+        """Writes the persistent mesh statistics cache, if enabled."""
+        if self.budgeter.mesh_stats is not None:
+            self.budgeter.mesh_stats.save()
+
+    def index_objs(self, objs: list[bpy.types.Object], names: Optional[list[str]] = None, reset: bool = False):
+        """Appends objects to ``viable_objs`` and indexes them.
+
+        :param objs: objects that can be potentially revealed or hidden in the viewport.
+        :param names: full name of each of ``objs``, read from the objects if not given
+        :param reset: whether to clear ``viable_objs`` first
+        """
+        if reset:
+            self.viable_objs, self.obj_names, self.obj_indices, self.instancer_indices = [], [], {}, {}
+
+        if names is None:
+            names = [o.name_full for o in objs]
+        self.viable_objs.extend(objs)
+        self.obj_names.extend(names)
+        for idx, o in enumerate(objs, len(self.viable_objs) - len(objs)):
+            self.obj_indices[o.as_pointer()] = idx
+            if o.is_instancer and o.instance_type == 'COLLECTION' and o.instance_collection is not None:
+                self.instancer_indices.setdefault(o.instance_collection.name, []).append(idx)
+
+    def set_objs(self, objs: list[bpy.types.Object], shown: np.ndarray, revealed_times: np.ndarray = None,
+                 degraded: np.ndarray = None, view_layer: bpy.types.ViewLayer = None):
+        """Replaces the viable objects, whose costs and boxes must already be cached, and rebuilds the tree.
+
+        No collection may be hidden as a whole when called, see ``release_groups``.
+
+        :param objs: objects that can be potentially revealed or hidden in the viewport.
+        :param shown: visibility last applied to each of ``objs``.
+        :param revealed_times: time each of ``objs`` was last revealed, never if not given.
+        :param degraded: reduced detail last applied to each of ``objs``, none if not given.
+        :param view_layer: view layer whose collections can be hidden as a whole, none if not given.
+        """
+        self.index_objs(objs, reset=True)
+        self.shown = shown
+        self.hide_flags = ~shown
+        self.groups = CollectionGroups(view_layer, self.obj_indices, len(objs))
+        self.revealed_times = np.full(len(objs), -np.inf) if revealed_times is None else revealed_times
+        self.degraded = np.zeros(len(objs), dtype=np.int8) if degraded is None else degraded
+        self.corners = self.bb_calculator.store.world_corners(self.obj_names)
+        self.costs = np.array([self.cost_cache.get(name, 0) for name in self.obj_names], dtype=np.float64)
+        self.degraded_costs = np.array([self.degraded_cost_cache.get(name, 0) for name in self.obj_names],
+                                       dtype=np.float64)
+        self.origins = np.array([o.matrix_world.translation for o in objs], dtype=np.float64).reshape(-1, 3)
+        self.bvh = BoundBoxBVH(self.corners)
+        self.bvh_dirty = False
+
+    def release_groups(self):
+        """Reveals every collection hidden as a whole, hiding its objects one by one first,
+        so the visibility of each object stays the same."""
+        for group_idx in np.flatnonzero(self.groups.hidden):
+            members = self.groups.group_members(group_idx)
+            for idx in members[~self.hide_flags[members]]:
+                o = self.viable_objs[idx]
+                try:
+                    o.hide_set(True)
+                except ReferenceError:
+                    continue
+                except Exception as e:
+                    print('Could not hide {}: {}'.format(o.name, e))
+                    continue
+                self.hide_flags[idx] = True
+                self.toggled.add(o.as_pointer())
+            try:
+                self.groups.layer_colls[group_idx].hide_viewport = False
+            except Exception as e:
+                print('Could not unhide collection: {}'.format(e))
+            self.groups.hidden[group_idx] = False
+        self.shown &= ~self.hide_flags
+
+    def is_visibility_changed(self, context: bpy.types.Context) -> bool:
+        """Returns True if the number of visible objects changed since the last scene update, False otherwise.
+
+        Hiding or revealing objects tags the scene (e.g. the "Show Hidden" operator), but so do selection changes,
+        property edits and frame changes, so the count is compared before re-reading every object's hide flag.
+
+        :param context: Blender context
+        """
+        visible_objs = getattr(context, 'visible_objects', None)
+        if visible_objs is None:
+            return True
+        visible_count, self.visible_count = self.visible_count, len(visible_objs)
+        return visible_count != self.visible_count
+
+    def sync_hide_flags(self):
+        """Re-reads each viable object's hide flag into ``hide_flags`` and ``shown``,
+        after visibility was changed by something else than the modal."""
+        hide_flags = self.hide_flags.copy()
+        for idx, o in enumerate(self.viable_objs):
+            try:
+                hide_flags[idx] = o.hide_get()
+            except ReferenceError:
+                pass
+        self.hide_flags = hide_flags
+        self.shown = self.groups.free_mask() & ~hide_flags
+        self.visibility_version += 1
+
+    def ensure_bvh(self) -> Optional[BoundBoxBVH]:
+        """Returns the tree, refitted first if any box moved since it was last used,
+        or None while the caches are still being built."""
+        if self.bvh is not None and self.bvh_dirty:
+            self.bvh.refit()
+            self.bvh_dirty = False
+        return self.bvh
+
+    def recache(self, context: bpy.types.Context, idx: int, update_cost: bool):
+        """Recalculates a viable object's bounding box and, optionally, its budget cost.
+
+        :param context: Blender context
+        :param idx: index of the object in ``viable_objs``
+        :param update_cost: whether the object's cost may have changed as well
+        """
+        obj = self.viable_objs[idx]
+        name = obj.name_full
+        self.bb_calculator.invalidate(name)
+        if update_cost:
+            self.cost_cache[name] = self.budgeter.budget_cost(context, obj)
+            self.costs[idx] = self.cost_cache[name]
+            self.degraded_costs[idx] = self.cache_degraded_cost(context, obj)
+        self.corners[idx] = self.bb_calculator.bound_box_calc(obj, self.min_box_size)
+        self.origins[idx] = obj.matrix_world.translation
+        self.bvh_dirty = True
+
+    def rename(self, idx: int):
+        """Moves a renamed viable object's cache entries to its new name.
+
+        :param idx: index of the object in ``viable_objs``
+        """
+        old_name, new_name = self.obj_names[idx], self.viable_objs[idx].name_full
+        self.bb_calculator.rename(old_name, new_name)
+        self.cost_cache[new_name] = self.cost_cache.pop(old_name, 0)
+        self.degraded_cost_cache[new_name] = self.degraded_cost_cache.pop(old_name, 0)
+        self.obj_names[idx] = new_name
+
+    def affected_instancers(self, obj: bpy.types.Object) -> set[int]:
+        """Invalidates cached instanced collections containing the object
+        and returns indices of the viable objects instancing them.
+
+        :param obj: updated object
+        """
+        indices = set()
+        for coll_name, instancer_idxs in self.instancer_indices.items():
+            coll = bpy.data.collections.get(coll_name)
+            if coll is not None and obj.name in coll.all_objects:
+                self.bb_calculator.invalidate_collection(coll_name)
+                self.budgeter.invalidate_collection(coll_name)
+                indices.update(instancer_idxs)
+        return indices
+
+    def removed_indices(self, scene: bpy.types.Scene) -> list[int]:
+        """Returns indices of viable objects that were deleted or unlinked from the scene.
+
+        :param scene: scene the caches were built for
+        """
+        removed = []
+        for idx, o in enumerate(self.viable_objs):
+            try:
+                if scene.objects.get(o.name) != o:
+                    removed.append(idx)
+            except ReferenceError:
+                removed.append(idx)
+        return removed
+
+    def patch(self, context: bpy.types.Context, depsgraph: bpy.types.Depsgraph):
+        """Patches only the cache entries affected by a depsgraph update.
+
+        :param context: Blender context
+        :param depsgraph: dependency graph that was just updated
+        """
+        scene = depsgraph.scene
+        if scene.name != self.scene_name or self.is_building:
+            return
+        toggled, self.toggled = self.toggled, set()
+
+        added, moved, edited = [], set(), set()
+        is_scene_updated = False
+        for update in depsgraph.updates:
+            if isinstance(update.id, bpy.types.Scene):
+                is_scene_updated = True
+            if not isinstance(update.id, bpy.types.Object):
+                continue
+            obj = update.id.original
+            pointer = obj.as_pointer()
+            idx = self.obj_indices.get(pointer)
+            is_geometry = update.is_updated_geometry and pointer not in toggled
+
+            if idx is None:
+                if self.is_viable(obj) and scene.objects.get(obj.name) == obj:
+                    added.append(obj)
+            elif obj.name_full != self.obj_names[idx]:
+                self.rename(idx)
+
+            if is_geometry and obj.type == 'MESH':
+                self.budgeter.invalidate_mesh(obj.data.name_full)
+            if is_geometry or update.is_updated_transform:
+                if self.instancer_indices:
+                    edited.update(self.affected_instancers(obj))
+                if idx is not None:
+                    (edited if is_geometry else moved).add(idx)
+
+        if is_scene_updated and self.is_visibility_changed(context) and not toggled:
+            self.sync_hide_flags()
+        for idx in edited:
+            self.recache(context, idx, update_cost=True)
+        for idx in moved - edited:
+            self.recache(context, idx, update_cost=False)
+
+        # an object added and another deleted between two updates leave the object count unchanged
+        removed = self.removed_indices(scene) if added or len(scene.objects) != self.scene_obj_count else []
+        self.scene_obj_count = len(scene.objects)
+        if not added and not removed:
+            return
+
+        self.release_groups()
+
+        for idx in removed:
+            self.bb_calculator.invalidate(self.obj_names[idx])
+            self.cost_cache.pop(self.obj_names[idx], None)
+            self.degraded_cost_cache.pop(self.obj_names[idx], None)
+        kept = np.setdiff1d(np.arange(len(self.viable_objs)), removed)
+
+        added_costs, _ = build_obj_budget_cost_cache(added, context, self.min_box_size,
+                                                     self.budgeter, self.bb_calculator)
+        self.cost_cache.update(added_costs)
+        for o in added:
+            self.cache_degraded_cost(context, o)
+
+        objs = [self.viable_objs[idx] for idx in kept] + added
+        shown = np.concatenate((self.shown[kept], np.array([not o.hide_get() for o in added], dtype=bool)))
+        revealed_times = np.concatenate((self.revealed_times[kept], np.full(len(added), -np.inf)))
+        degraded = np.concatenate((self.degraded[kept], np.zeros(len(added), dtype=np.int8)))
+        self.set_objs(objs, shown, revealed_times, degraded, context.view_layer)
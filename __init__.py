@@ -16,8 +16,9 @@
 import bpy
 
 from .ObjType import ObjType
-from .handler_operators import NL_OT_ViewportLive
-from .nview_live_panel import NL_PT_NViewLive, NL_PT_Budgeting
+from .handler_operators import NL_OT_ViewportLive, NL_OT_ExportProfile, NL_OT_BakeVisibility, NL_OT_ClearBake
+from .nview_live_panel import NL_PT_NViewLive, NL_PT_Budgeting, NL_PT_Stability, NL_PT_Profiling, NL_PT_Render
+from .render_handler import add_render_handlers, remove_render_handlers
 
 bl_info = {
     "name": 'nView Live',
@@ -32,7 +33,8 @@ bl_info = {
     "tracker_url": 'https://github.com/semagnum/nview-live/issues',
 }
 
-classes = [ObjType, NL_OT_ViewportLive, NL_PT_NViewLive, NL_PT_Budgeting]
+classes = [ObjType, NL_OT_ViewportLive, NL_OT_ExportProfile, NL_OT_BakeVisibility, NL_OT_ClearBake,
+           NL_PT_NViewLive, NL_PT_Budgeting, NL_PT_Stability, NL_PT_Profiling, NL_PT_Render]
 properties = [
     ('nl_max_distance', bpy.props.FloatProperty(name='Max Distance',
                                                 description='Maximum distance of objects allowed to test visibility',
@@ -65,8 +67,31 @@ properties = [
                                                            ('descending', 'Descending',
                                                             'Objects prioritized from lowest to highest budget cost',
                                                             'TRIA_DOWN', 1),
+                                                           ('value', 'Value per cost',
+                                                            'Objects prioritized by screen coverage per budget cost, '
+                                                            'skipping objects that do not fit in the budget',
+                                                            'SORTSIZE', 2),
                                                            ],
                                                     default='descending')),
+    ('nl_over_budget_action', bpy.props.EnumProperty(name='Over Budget',
+                                                     description='What to do with objects in view '
+                                                                 'that do not fit in the budget',
+                                                     items=[('HIDE', 'Hide', 'Hide them', 'HIDE_ON', 0),
+                                                            ('BOUNDS', 'Bounds',
+                                                             'Display them as bounding boxes, '
+                                                             'as long as the remaining budget allows',
+                                                             'SHADING_BBOX', 1),
+                                                            ('WIRE', 'Wire',
+                                                             'Display them as wireframes, '
+                                                             'as long as the remaining budget allows',
+                                                             'SHADING_WIRE', 2),
+                                                            ('MODIFIERS', 'Disable Modifiers',
+                                                             'Turn off their subdivision, array, geometry nodes '
+                                                             'and other heavy modifiers in the viewport, '
+                                                             'as long as the remaining budget allows',
+                                                             'MODIFIER_OFF', 3),
+                                                            ],
+                                                     default='HIDE')),
     ('nl_run_delay', bpy.props.FloatProperty(name='Update delay',
                                              description='Delay before the visibility update'
                                                          'after viewport refresh change (in seconds)',
@@ -76,8 +101,115 @@ properties = [
     ('nl_max_objects', bpy.props.IntProperty(name='Max objects',
                                              description='Max number of viable objects to show at a time',
                                              default=100, min=1, soft_min=10, soft_max=10000)),
+    ('nl_use_all_views', bpy.props.BoolProperty(name='All 3D views',
+                                                description='Show objects visible from any open 3D view, '
+                                                            'including quad views and other windows, '
+                                                            'sharing one budget',
+                                                default=True)),
+    ('nl_use_collection_hiding', bpy.props.BoolProperty(name='Hide whole collections',
+                                                        description='Hide collections whose objects are all hidden '
+                                                                    'in one step, instead of each object. '
+                                                                    'Collections are revealed when canceled. '
+                                                                    'Changes the collections\' viewport visibility, '
+                                                                    'which is saved with the file',
+                                                        default=False)),
+    ('nl_use_occlusion', bpy.props.BoolProperty(name='Occlusion culling',
+                                                description='Hide objects behind the largest objects in view. '
+                                                            'Assumes those objects are mostly solid, '
+                                                            'like walls and buildings',
+                                                default=False)),
+    ('nl_occluder_count', bpy.props.IntProperty(name='Occluders',
+                                                description='Maximum number of the largest objects in view '
+                                                            'tested as occluders',
+                                                default=16, min=1, soft_max=128)),
+    ('nl_use_screen_size', bpy.props.BoolProperty(name='Screen size culling',
+                                                  description='Hide objects too small on screen to be worth drawing',
+                                                  default=False)),
+    ('nl_min_screen_size', bpy.props.FloatProperty(name='Min Size',
+                                                   description='Minimum radius in pixels of an object\'s '
+                                                               'bounding sphere on screen',
+                                                   default=4.0, min=0.0, soft_min=1.0, soft_max=64.0,
+                                                   subtype='PIXEL')),
+    ('nl_sort_by_screen_size', bpy.props.BoolProperty(name='Prioritize screen size',
+                                                      description='Give budget to the objects covering the most '
+                                                                  'of the view first, instead of by cost or distance',
+                                                      default=False)),
+    ('nl_use_hysteresis', bpy.props.BoolProperty(name='Stabilize',
+                                                 description='Keep objects near the distance, view and budget '
+                                                             'limits in their current state, '
+                                                             'instead of hiding and revealing them on every update',
+                                                 default=False)),
+    ('nl_distance_enter_margin', bpy.props.FloatProperty(name='Distance Enter',
+                                                         description='How much closer than the max distance '
+                                                                     'hidden objects must be to be revealed',
+                                                         default=0.0, min=0.0, soft_max=10.0,
+                                                         unit='LENGTH', subtype='DISTANCE')),
+    ('nl_distance_exit_margin', bpy.props.FloatProperty(name='Distance Exit',
+                                                        description='How much farther than the max distance '
+                                                                    'visible objects must be to be hidden',
+                                                        default=2.0, min=0.0, soft_max=10.0,
+                                                        unit='LENGTH', subtype='DISTANCE')),
+    ('nl_frustum_enter_margin', bpy.props.FloatProperty(name='View Enter',
+                                                        description='How far inside the view (in pixels) '
+                                                                    'hidden objects must reach to be revealed',
+                                                        default=0.0, min=0.0, soft_max=200.0, subtype='PIXEL')),
+    ('nl_frustum_exit_margin', bpy.props.FloatProperty(name='View Exit',
+                                                       description='How far outside the view (in pixels) '
+                                                                   'visible objects must be to be hidden',
+                                                       default=50.0, min=0.0, soft_max=200.0, subtype='PIXEL')),
+    ('nl_min_visible_time', bpy.props.FloatProperty(name='Min Visible Time',
+                                                    description='Minimum time revealed objects stay visible',
+                                                    default=0.5, min=0.0, soft_max=5.0,
+                                                    subtype='TIME', unit='TIME')),
+    ('nl_budget_dead_band', bpy.props.FloatProperty(name='Budget Dead Band',
+                                                    description='How far over the budget visible objects can go '
+                                                                'before being hidden',
+                                                    default=0.05, min=0.0, max=1.0, subtype='FACTOR')),
+    ('nl_use_prediction', bpy.props.BoolProperty(name='Predict motion',
+                                                 description='Also reveal objects the viewport is moving towards, '
+                                                             'so they are already visible when it gets there',
+                                                 default=False)),
+    ('nl_prediction_time', bpy.props.FloatProperty(name='Look Ahead',
+                                                   description='How far ahead in time to extrapolate '
+                                                               'the viewport\'s motion',
+                                                   default=0.5, min=0.0, soft_max=2.0,
+                                                   subtype='TIME', unit='TIME')),
+    ('nl_use_disk_cache', bpy.props.BoolProperty(name='Cache to disk',
+                                                 description='Save evaluated mesh statistics to disk, '
+                                                             'so unchanged meshes are not evaluated again '
+                                                             'the next time nView Live starts',
+                                                 default=False)),
+    ('nl_cache_dir', bpy.props.StringProperty(name='Cache directory',
+                                              description='Directory of the mesh statistics cache '
+                                                          '(next to the .blend file if empty)',
+                                              default='', subtype='DIR_PATH')),
+    ('nl_profile', bpy.props.BoolProperty(name='Profile updates',
+                                          description='Record the time spent in each stage of every visibility update',
+                                          default=False)),
+    ('nl_profile_overlay', bpy.props.BoolProperty(name='Show in viewport',
+                                                  description='Draw timings of the last visibility update '
+                                                              'in the 3D view',
+                                                  default=False)),
     ('nl_is_running', bpy.props.BoolProperty(options={'HIDDEN'}, default=False))
 ]
+scene_properties = [
+    ('nl_render_cull', bpy.props.BoolProperty(name='Cull renders',
+                                              description='Exclude objects the scene camera cannot see from renders '
+                                                          'while each frame renders, including background renders. '
+                                                          'Excluded objects no longer cast shadows or reflections',
+                                              default=False)),
+    ('nl_render_max_distance', bpy.props.FloatProperty(name='Max Distance',
+                                                       description='Maximum distance from the camera of objects '
+                                                                   'included in renders (0 for no limit)',
+                                                       default=0.0, min=0.0, soft_max=10000.0,
+                                                       unit='LENGTH', subtype='DISTANCE')),
+    ('nl_render_overscan', bpy.props.FloatProperty(name='Overscan',
+                                                   description='Margin around the camera frame, as a fraction of '
+                                                               'its larger side, within which objects are still '
+                                                               'included in renders',
+                                                   default=0.1, min=0.0, soft_max=1.0, subtype='FACTOR')),
+]
+"""Render culling settings, saved with each scene so background renders use them."""
 
 
 def register():
@@ -88,9 +220,15 @@ def register():
 
     for name, prop in properties:
         setattr(window_manager, name, prop)
+    for name, prop in scene_properties:
+        setattr(bpy.types.Scene, name, prop)
+
+    add_render_handlers()
 
 
 def unregister():
+    remove_render_handlers()
+
     for cls in classes[::-1]:
         bpy.utils.unregister_class(cls)
 
@@ -100,6 +238,11 @@ def unregister():
             delattr(window_manager, name)
         except AttributeError:
             pass
+    for name, _ in scene_properties[::-1]:
+        try:
+            delattr(bpy.types.Scene, name)
+        except AttributeError:
+            pass
 
 
 if __name__ == '__main__':
@@ -0,0 +1,223 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Callable, Optional
+
+import bpy
+import functools
+import numpy as np
+
+from .budget import budget_factory
+from .core.select_util import select_visible
+from .core.VisibilityBake import VisibilityBake
+from .frame_handler import budget_sort_order, camera_view, hysteresis_settings
+from .SceneCache import SceneCache
+
+
+class BakedVisibility:
+    """Visibility baked for a scene's objects, and the visibility last applied from it during playback."""
+
+    def __init__(self, objs: list[bpy.types.Object], bake: VisibilityBake):
+        """
+        :param objs: baked objects, in the bake's order
+        :param bake: per-frame visibility changes of ``objs``
+        """
+        self.objs = objs
+        self.pointers = [o.as_pointer() for o in objs]
+        self.bake = bake
+        self.shown = None
+        """Baked visibility of the frame last applied, or None if nothing was applied yet."""
+        self.applied_frame = None
+        self.cache_version = None
+        """``SceneCache.visibility_version`` of the modal's cache when a frame was last applied."""
+
+    def reset(self):
+        """Forgets the visibility last applied, so the next frame is compared with the objects' actual visibility."""
+        self.shown, self.applied_frame = None, None
+
+    def sync_shown(self, scene_cache: SceneCache):
+        """Copies the visibility of the baked objects from a modal's cache into ``shown``,
+        after live passes or changes outside the modal made it stale.
+
+        :param scene_cache: cache of a running modal
+        """
+        cache_indices = np.fromiter((scene_cache.obj_indices.get(pointer, -1) for pointer in self.pointers),
+                                    dtype=np.int64, count=len(self.pointers))
+        cached = np.flatnonzero((cache_indices >= 0) & (cache_indices < len(scene_cache.shown)))
+        self.shown[cached] = scene_cache.shown[cache_indices[cached]]
+
+    def apply(self, frame: int, scene_cache: Optional[SceneCache] = None) -> int:
+        """Reveals or hides objects to match a baked frame and returns the number of objects changed.
+
+        Stepping forward one frame only touches the objects whose visibility changed on that frame,
+        any other jump compares every object. So does the first frame after the modal culled live
+        or visibility changed outside of it, once ``shown`` is synced from the modal's cache.
+
+        :param frame: baked frame number
+        :param scene_cache: cache of a running modal, whose applied visibility is kept in sync
+        """
+        is_stale = (scene_cache is not None and self.shown is not None
+                    and scene_cache.visibility_version != self.cache_version)
+        if is_stale:
+            self.sync_shown(scene_cache)
+
+        if self.shown is None:
+            self.shown = np.array([is_obj_visible(o) for o in self.objs], dtype=bool)
+            changed = np.flatnonzero(self.bake.visible_at(frame) != self.shown)
+        elif frame == self.applied_frame + 1 and not is_stale:
+            changed = self.bake.changed(frame)
+        else:
+            changed = np.flatnonzero(self.bake.visible_at(frame) != self.shown)
+        self.shown[changed] = ~self.shown[changed]
+        self.applied_frame = frame
+        if scene_cache is not None:
+            self.cache_version = scene_cache.visibility_version
+
+        for idx in changed:
+            o, visible = self.objs[idx], bool(self.shown[idx])
+            try:
+                o.hide_set(not visible)
+            except Exception as e:
+                print('Could not {} baked object: {}'.format('unhide' if visible else 'hide', e))
+                continue
+            if scene_cache is not None:
+                cache_idx = scene_cache.obj_indices.get(self.pointers[idx])
+                if cache_idx is not None and cache_idx < len(scene_cache.shown):
+                    scene_cache.shown[cache_idx] = visible
+                    scene_cache.hide_flags[cache_idx] = not visible
+                    scene_cache.toggled.add(self.pointers[idx])
+        return len(changed)
+
+
+visibility_bakes: dict[str, BakedVisibility] = {}
+"""Baked visibility of each scene, keyed by scene name."""
+
+
+def is_obj_visible(obj: bpy.types.Object) -> bool:
+    """Returns True if the object is not hidden in the viewport, False if it is or was deleted.
+
+    :param obj: object to check
+    """
+    try:
+        return not obj.hide_get()
+    except ReferenceError:
+        return False
+
+
+def refresh_moved_objs(context: bpy.types.Context, scene_cache: SceneCache, matrices: list):
+    """Recalculates the bounding boxes of objects that moved since their matrices were recorded.
+
+    :param context: Blender context
+    :param scene_cache: cache of viable objects
+    :param matrices: world matrix of each viable object when last cached, updated in place
+    """
+    for idx, o in enumerate(scene_cache.viable_objs):
+        if o.matrix_world != matrices[idx]:
+            matrices[idx] = o.matrix_world.copy()
+            scene_cache.recache(context, idx, update_cost=False)
+
+
+def bake_visibility(context: bpy.types.Context, scene_cache: SceneCache, frame_start: int, frame_end: int,
+                    progress: Callable[[int], None] = None) -> VisibilityBake:
+    """Culls the cached objects against the scene camera on every frame of a range and returns the changes.
+
+    Uses the same distance, screen size, occlusion, budget and stabilizing settings as the viewport.
+    Animated objects and cameras are followed, and the current frame is restored afterwards.
+
+    :param context: Blender context
+    :param scene_cache: cache of viable objects, which must already be built
+    :param frame_start: first frame to bake
+    :param frame_end: last frame to bake, inclusive
+    :param progress: called with each frame number once baked
+    """
+    wm = context.window_manager
+    scene = context.scene
+    sort_order = budget_sort_order(wm)
+    budget_limit = budget_factory(context)().budget_limit(context)
+    fps = scene.render.fps / scene.render.fps_base
+
+    bake = VisibilityBake(frame_start, len(scene_cache.viable_objs))
+    matrices = [o.matrix_world.copy() for o in scene_cache.viable_objs]
+    shown = np.zeros(len(scene_cache.viable_objs), dtype=bool)
+    revealed_times = np.full(len(scene_cache.viable_objs), -np.inf)
+    original_frame = scene.frame_current
+    try:
+        for frame in range(frame_start, frame_end + 1):
+            scene.frame_set(frame)
+            refresh_moved_objs(context, scene_cache, matrices)
+
+            camera_location, perspective_matrix, width, height = camera_view(context.evaluated_depsgraph_get(),
+                                                                             scene.camera)
+            hysteresis = hysteresis_settings(wm, shown, revealed_times, frame / fps)
+            selection = select_visible(scene_cache.corners, scene_cache.costs, scene_cache.origins,
+                                       camera_location, wm.nl_max_distance, perspective_matrix,
+                                       width, height, budget_limit, sort_order, scene_cache.ensure_bvh(),
+                                       wm.nl_occluder_count if wm.nl_use_occlusion else 0,
+                                       wm.nl_min_screen_size if wm.nl_use_screen_size else 0.0, hysteresis)
+
+            visible = np.zeros(len(scene_cache.viable_objs), dtype=bool)
+            visible[selection.shown] = True
+            revealed_times[visible & ~shown] = frame / fps
+            shown = visible
+            bake.add_frame(visible)
+            if progress is not None:
+                progress(frame)
+    finally:
+        scene.frame_set(original_frame)
+    return bake
+
+
+def frame_change_handler(self: bpy.types.Operator, scene: bpy.types.Scene, *_args):
+    """Blender handler that runs before every frame change, applying the scene's baked visibility if any.
+
+    :param self: Blender modal operator owning the caches
+    :param scene: scene whose frame changed
+    """
+    baked = visibility_bakes.get(scene.name_full)
+    if baked is None or not baked.bake.covers(scene.frame_current):
+        return
+    try:
+        self.scene_cache.release_groups()
+        baked.apply(scene.frame_current, self.scene_cache)
+    except Exception as e:
+        print('Could not apply baked visibility: {}'.format(e))
+
+
+def add_frame_change_handler(self: bpy.types.Operator):
+    """Adds frame change handler and returns it.
+
+    :param self: modal operator owning the caches.
+    """
+    handler = functools.partial(frame_change_handler, self)
+    bpy.app.handlers.frame_change_pre.append(handler)
+    return handler
+
+
+def remove_frame_change_handler(handler):
+    """Removes frame change handler.
+
+    :param handler: handler to be removed.
+    """
+    if handler in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(handler)
+
+
+def is_frame_baked(scene: bpy.types.Scene) -> bool:
+    """Returns True if the scene's current frame has baked visibility, False otherwise.
+
+    :param scene: scene to check
+    """
+    baked = visibility_bakes.get(scene.name_full)
+    return baked is not None and baked.bake.covers(scene.frame_current)
@@ -0,0 +1,82 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compares two benchmark result files and fails if any timing regressed beyond a threshold.
+
+Runs with plain Python::
+
+    python benchmark/compare_results.py baseline.json results.json --threshold 1.2
+"""
+
+
+import argparse
+import json
+import sys
+
+compared_timings = (
+    ('update_caches_s', lambda result: result['update_caches_s']),
+    ('build_obj_budget_cost_cache_s', lambda result: result['build_obj_budget_cost_cache_s']),
+    ('viewport_handler_median_ms', lambda result: result['viewport_handler_ms']['median']),
+)
+"""Names of compared timings, with how to read each one from a result."""
+
+
+def load_results(filepath: str) -> dict:
+    """Returns results of a benchmark file, keyed by (scene size, budget type).
+
+    :param filepath: path of the JSON results file
+    """
+    with open(filepath) as f:
+        report = json.load(f)
+    return {(result['size'], result['budget']): result for result in report['results']}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Prints the ratio of every timing found in both results and returns descriptions of regressions.
+
+    :param baseline: results to compare against
+    :param current: new results
+    :param threshold: ratio of current to baseline time above which a timing regressed
+    """
+    regressions = []
+    for key in sorted(baseline.keys() & current.keys()):
+        for name, get_timing in compared_timings:
+            old, new = get_timing(baseline[key]), get_timing(current[key])
+            ratio = new / old if old > 0.0 else 1.0
+            line = '{:>7} objects, {:>7} budget, {:<30} {:10.3f} -> {:10.3f} ({:.2f}x)'.format(
+                key[0], key[1], name, old, new, ratio)
+            print(line)
+            if ratio > threshold:
+                regressions.append(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares two nView Live benchmark result files.')
+    parser.add_argument('baseline', help='results of the previous version')
+    parser.add_argument('current', help='results of the new version')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='slowdown ratio above which a timing counts as a regression')
+    args = parser.parse_args()
+
+    regressions = compare(load_results(args.baseline), load_results(args.current), args.threshold)
+    if regressions:
+        print('\n{} timings regressed by more than {:.2f}x:'.format(len(regressions), args.threshold))
+        for line in regressions:
+            print(line)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Headless scene-scale benchmarks for nView Live.
+
+Generates synthetic scenes of meshes, linked duplicates, nested collection instances and lights,
+then times cache building and visibility updates from a fixed set of views for each budget type.
+
+Usage::
+
+    blender --background --factory-startup --python benchmark/run_benchmarks.py -- \\
+        --sizes 1000 10000 100000 --output results.json
+"""
+
+
+import argparse
+import importlib.util
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+import bmesh
+import bpy
+from mathutils import Matrix, Vector
+
+addon_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+addon_name = 'nviewlive'
+
+budget_options = ('none', 'objects', 'verts', 'tris')
+"""Budget types benchmarked, where ``none`` disables budgeting."""
+view_count = 8
+"""Number of views orbiting each scene."""
+region_size = (1920, 1080)
+obj_spacing = 4.0
+"""Average distance between neighboring objects."""
+base_mesh_count = 16
+"""Number of mesh datablocks shared by linked duplicates."""
+
+
+def load_addon():
+    """Imports and registers the add-on from this repository, returning its module."""
+    spec = importlib.util.spec_from_file_location(addon_name, os.path.join(addon_dir, '__init__.py'),
+                                                  submodule_search_locations=[addon_dir])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[addon_name] = module
+    spec.loader.exec_module(module)
+    module.register()
+    return module
+
+
+def new_sphere_mesh(name: str, segments: int) -> bpy.types.Mesh:
+    """Returns a new UV sphere mesh.
+
+    :param name: mesh name
+    :param segments: number of segments, the sphere has half as many rings
+    """
+    mesh = bpy.data.meshes.new(name)
+    bm = bmesh.new()
+    bmesh.ops.create_uvsphere(bm, u_segments=segments, v_segments=segments // 2, radius=1.0)
+    bm.to_mesh(mesh)
+    bm.free()
+    return mesh
+
+
+def clear_scene():
+    """Removes all objects, meshes, lights and collections from the current file."""
+    for data in (bpy.data.objects, bpy.data.meshes, bpy.data.lights, bpy.data.collections):
+        for block in list(data):
+            data.remove(block)
+
+
+def generate_scene(size: int, seed: int) -> bpy.types.Scene:
+    """Fills the scene with a reproducible mix of objects and returns it.
+
+    About 70% are linked duplicates of a few shared meshes, 10% have their own mesh,
+    5% of those carry a subdivision modifier, 10% instance nested collections and 10% are lights.
+
+    :param size: number of objects in the scene
+    :param seed: random seed
+    """
+    rng = random.Random(seed)
+    clear_scene()
+    scene = bpy.context.scene
+
+    base_meshes = [new_sphere_mesh('Base {}'.format(i), 8 + 4 * (i % 8)) for i in range(base_mesh_count)]
+
+    # nested instances: scene empties instance an outer collection, which instances an inner one
+    inner = bpy.data.collections.new('Instance Inner')
+    for i in range(4):
+        obj = bpy.data.objects.new('Inner {}'.format(i), base_meshes[i])
+        obj.location = (i * 1.5, 0.0, 0.0)
+        inner.objects.link(obj)
+    outer = bpy.data.collections.new('Instance Outer')
+    for i in range(3):
+        empty = bpy.data.objects.new('Outer Instancer {}'.format(i), None)
+        empty.instance_type = 'COLLECTION'
+        empty.instance_collection = inner
+        empty.location = (0.0, i * 2.0, 0.0)
+        outer.objects.link(empty)
+    outer.objects.link(bpy.data.objects.new('Outer Mesh', base_meshes[-1]))
+
+    extent = obj_spacing * size ** (1.0 / 3.0)
+    scene_objs = scene.collection.objects
+    for i in range(size):
+        roll = rng.random()
+        name = 'Bench {}'.format(i)
+        if roll < 0.7:
+            obj = bpy.data.objects.new(name, rng.choice(base_meshes))
+        elif roll < 0.8:
+            obj = bpy.data.objects.new(name, rng.choice(base_meshes).copy())
+            if roll < 0.705:
+                mod = obj.modifiers.new('Subdivision', 'SUBSURF')
+                mod.levels = 1
+        elif roll < 0.9:
+            obj = bpy.data.objects.new(name, None)
+            obj.instance_type = 'COLLECTION'
+            obj.instance_collection = outer
+        else:
+            light = bpy.data.lights.new(name, rng.choice(('POINT', 'SPOT', 'AREA')))
+            obj = bpy.data.objects.new(name, light)
+        obj.location = (rng.uniform(0.0, extent), rng.uniform(0.0, extent), rng.uniform(0.0, extent))
+        obj.rotation_euler = (rng.uniform(0.0, math.tau), rng.uniform(0.0, math.tau), rng.uniform(0.0, math.tau))
+        scene_objs.link(obj)
+
+    bpy.context.view_layer.update()
+    return scene
+
+
+def view_regions(size: int) -> list[SimpleNamespace]:
+    """Returns stand-ins for 3D view regions, orbiting the scene's center at different heights.
+
+    :param size: number of objects in the scene, which sets its extent
+    """
+    # the add-on is imported by load_addon, so its projection helper is only importable from here on
+    from nviewlive.core.StandInScene import perspective_projection
+
+    extent = obj_spacing * size ** (1.0 / 3.0)
+    center = Vector((extent / 2.0,) * 3)
+    width, height = region_size
+    projection = Matrix(perspective_projection(math.radians(60.0), width / height, 0.1, 10.0 * extent).tolist())
+
+    regions = []
+    for i in range(view_count):
+        angle = math.tau * i / view_count
+        eye = center + Vector((math.cos(angle), math.sin(angle), 0.5 * math.sin(2.0 * angle))) * extent
+        rotation = (center - eye).to_track_quat('-Z', 'Y').to_matrix().to_4x4()
+        view_matrix = (Matrix.Translation(eye) @ rotation).inverted()
+        regions.append(SimpleNamespace(view_matrix=view_matrix, window_matrix=projection,
+                                       perspective_matrix=projection @ view_matrix))
+    return regions
+
+
+def view_context(region_3d: SimpleNamespace) -> SimpleNamespace:
+    """Returns a stand-in for a 3D view context, since background mode has no windows.
+
+    :param region_3d: stand-in 3D region with view and perspective matrices
+    """
+    context = bpy.context
+    width, height = region_size
+    return SimpleNamespace(window_manager=context.window_manager, scene=context.scene,
+                           view_layer=context.view_layer, preferences=context.preferences,
+                           evaluated_depsgraph_get=context.evaluated_depsgraph_get,
+                           region=SimpleNamespace(width=width, height=height),
+                           region_data=region_3d, space_data=SimpleNamespace(region_3d=region_3d))
+
+
+def timed(func, *args, **kwargs) -> tuple[float, object]:
+    """Returns a tuple of (elapsed seconds, result) of calling a function."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def reset_visibility(scene: bpy.types.Scene):
+    """Reveals every object, so each budget type starts from the same state."""
+    for obj in scene.objects:
+        if obj.hide_get():
+            obj.hide_set(False)
+
+
+def benchmark_budget(addon, scene: bpy.types.Scene, budget_option: str, repeat: int) -> dict:
+    """Times cache building and visibility updates with one budget type.
+
+    :param addon: registered add-on module
+    :param scene: generated scene
+    :param budget_option: budget type, or ``none`` to disable budgeting
+    :param repeat: number of visibility updates per view
+    """
+    wm = bpy.context.window_manager
+    wm.nl_use_budget = budget_option != 'none'
+    if budget_option != 'none':
+        wm.nl_budget_option = budget_option
+    wm.nl_use_disk_cache = False
+    # background mode has no windows, each stand-in view is timed on its own
+    wm.nl_use_all_views = False
+    reset_visibility(scene)
+
+    valid_obj_types = {obj_type for obj_type, *_ in addon.obj_config.obj_types}
+    context = view_context(view_regions(len(scene.objects))[0])
+
+    scene_cache = addon.SceneCache.SceneCache(valid_obj_types, True, 0.1)
+    build_time, _ = timed(scene_cache.build, context)
+    cost_cache_time, _ = timed(addon.SceneCache.build_obj_budget_cost_cache,
+                               scene_cache.viable_objs, context, 0.1)
+
+    pass_times, stage_times = [], {stage: [] for stage in addon.core.pass_profile.pass_stages}
+    for region_3d in view_regions(len(scene.objects)):
+        context = view_context(region_3d)
+        for _ in range(repeat):
+            profile = addon.core.pass_profile.PassProfile()
+            addon.frame_handler.viewport_handler(context, scene_cache, profile)
+            profile.finish()
+            pass_times.append(profile.total_time)
+            for stage, stage_time in profile.stage_times.items():
+                stage_times[stage].append(stage_time)
+    reset_visibility(scene)
+
+    return {
+        'budget': budget_option,
+        'viable_objects': len(scene_cache.viable_objs),
+        'update_caches_s': build_time,
+        'build_obj_budget_cost_cache_s': cost_cache_time,
+        'mesh_cost_hits': scene_cache.budgeter.mesh_cache_hits,
+        'mesh_cost_misses': scene_cache.budgeter.mesh_cache_misses,
+        'viewport_handler_ms': {
+            'min': min(pass_times) * 1000.0,
+            'median': statistics.median(pass_times) * 1000.0,
+            'max': max(pass_times) * 1000.0,
+        },
+        'stage_median_ms': {stage: statistics.median(times) * 1000.0 for stage, times in stage_times.items()},
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    """Parses arguments given after ``--`` on Blender's command line."""
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(description='Benchmarks nView Live on generated scenes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='number of objects of each generated scene')
+    parser.add_argument('--budgets', nargs='+', choices=budget_options, default=list(budget_options),
+                        help='budget types to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='visibility updates per view')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the generated scenes')
+    parser.add_argument('--output', default='benchmark_results.json', help='path of the JSON results file')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    addon = load_addon()
+
+    results = []
+    for size in args.sizes:
+        generate_time, scene = timed(generate_scene, size, args.seed)
+        print('Generated {} objects in {:.1f}s'.format(size, generate_time))
+        for budget_option in args.budgets:
+            result = benchmark_budget(addon, scene, budget_option, args.repeat)
+            result['size'] = size
+            result['scene_objects'] = len(scene.objects)
+            results.append(result)
+            print('{:>7} objects, {:>7} budget: caches {:.2f}s, update median {:.2f}ms'.format(
+                size, budget_option, result['update_caches_s'], result['viewport_handler_ms']['median']))
+
+    report = {
+        'addon_version': list(addon.bl_info['version']),
+        'blender_version': bpy.app.version_string,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'timestamp': time.time(),
+        'args': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Saved results to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
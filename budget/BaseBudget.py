@@ -13,12 +13,54 @@
 #     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from typing import Callable, Hashable, Optional
+
 import bpy
 
+from .MeshStatsCache import MeshStatsCache
+
 
 class BaseBudget:
     """Abstract class for budget managers."""
 
+    def __init__(self, mesh_stats: MeshStatsCache = None):
+        """
+        :param mesh_stats: persistent cache of evaluated mesh statistics, if enabled.
+        """
+        self.mesh_stats = mesh_stats
+        self.mesh_cache = {}
+        """Costs shared by objects using the same mesh, keyed by mesh name, then by what else they depend on."""
+        self.mesh_cache_hits = 0
+        self.mesh_cache_misses = 0
+
+    def shared_mesh_cost(self, obj: bpy.types.Object, key: Optional[Hashable], cost_calc: Callable[[], int]) -> int:
+        """Returns a mesh object's cost, calculated once per mesh datablock and key.
+
+        Objects sharing a mesh (e.g. linked duplicates) and the same key share the cost.
+
+        :param obj: mesh object whose cost is returned
+        :param key: what the cost depends on besides the mesh, or None if the cost cannot be shared
+        :param cost_calc: calculates the object's cost on a cache miss
+        """
+        if key is None:
+            self.mesh_cache_misses += 1
+            return cost_calc()
+
+        mesh_costs = self.mesh_cache.setdefault(obj.data.name_full, {})
+        if key in mesh_costs:
+            self.mesh_cache_hits += 1
+        else:
+            self.mesh_cache_misses += 1
+            mesh_costs[key] = cost_calc()
+        return mesh_costs[key]
+
+    def invalidate_mesh(self, mesh_name: str):
+        """Forgets the cached costs of a mesh datablock.
+
+        :param mesh_name: full name of the mesh
+        """
+        self.mesh_cache.pop(mesh_name, None)
+
     def budget_cost(self, _context: bpy.types.Context, _obj: bpy.types.Object) -> int:
         """Calculates and returns the cost of an object to be visible in the scene.
 
@@ -27,6 +69,15 @@ class BaseBudget:
         """
         return 0
 
+    def degraded_cost(self, _context: bpy.types.Context, _obj: bpy.types.Object, _action: str) -> int:
+        """Calculates and returns the cost of an object shown with reduced detail instead of being hidden.
+
+        :param _context: Blender context
+        :param _obj: Blender object's cost to be counted
+        :param _action: one of ``obj_config.over_budget_actions`` besides ``HIDE``
+        """
+        return 0
+
     def budget_limit(self, _context: bpy.types.Context) -> int:
         """Returns the user-specified budget (e.g. 300 objects).
 
@@ -34,6 +85,12 @@ class BaseBudget:
         """
         return 0
 
+    def invalidate_collection(self, _collection_name: str):
+        """Forgets the cached cost of an instanced collection, if any.
+
+        :param _collection_name: name of the collection
+        """
+
     def draw(self, _context: bpy.types.Context, layout: bpy.types.UILayout):
         """Draws budget parameters in panel.
 
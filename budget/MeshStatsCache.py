@@ -0,0 +1,255 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import os
+import struct
+from typing import NamedTuple, Optional
+
+import bpy
+import numpy as np
+
+cache_magic = b'NLMS'
+cache_version = 3
+header_format = struct.Struct('<4sHI')
+"""File header: magic, version, record count."""
+record_format = struct.Struct('<H16sQQ6d')
+"""Record: mesh name length, fingerprint, triangle count, vertex count, local bounding box min and max.
+The mesh name follows each record as UTF-8."""
+weight_layers = ('bevel_weight_vert', 'bevel_weight_edge', 'crease_vert', 'crease_edge')
+"""Mesh attributes that modifiers read to decide their output, e.g. Bevel's weight limit or Subdivision's creases."""
+
+
+class MeshStats(NamedTuple):
+    """Statistics of an evaluated mesh."""
+    tri_count: int
+    vert_count: int
+    box_min: tuple[float, float, float]
+    box_max: tuple[float, float, float]
+
+
+def mesh_tri_count(mesh: bpy.types.Mesh) -> int:
+    """Returns the number of triangles a mesh's faces are split into.
+
+    Every face of n corners becomes n - 2 triangles, and every loop belongs to exactly one face,
+    so the total is the number of loops minus twice the number of faces, without triangulating anything.
+
+    :param mesh: mesh whose triangles are counted
+    """
+    return len(mesh.loops) - 2 * len(mesh.polygons)
+
+
+def modifier_signature(obj: bpy.types.Object) -> str:
+    """Returns a string describing the settings of every modifier enabled in the viewport.
+
+    :param obj: object whose modifier stack is described
+    """
+    mod_settings = []
+    for mod in obj.modifiers:
+        if not mod.show_viewport:
+            continue
+        for prop in mod.bl_rna.properties:
+            if prop.identifier == 'rna_type' or prop.type == 'COLLECTION':
+                continue
+            value = getattr(mod, prop.identifier)
+            if prop.type == 'POINTER':
+                value = getattr(value, 'name_full', None)
+            elif isinstance(value, set):
+                value = tuple(sorted(value))
+            elif getattr(prop, 'is_array', False):
+                value = tuple(value)
+            mod_settings.append('{}={!r}'.format(prop.identifier, value))
+    return ';'.join(mod_settings)
+
+
+def reads_vertex_groups(obj: bpy.types.Object) -> bool:
+    """Returns True if any modifier enabled in the viewport reads a vertex group, False otherwise.
+
+    Vertex group weights cannot be read in bulk, so they are left out of ``mesh_fingerprint``,
+    and such objects must not be cached on disk.
+
+    :param obj: mesh object
+    """
+    return any(prop.type == 'STRING' and prop.identifier.startswith('vertex_group') and getattr(mod, prop.identifier)
+               for mod in obj.modifiers if mod.show_viewport for prop in mod.bl_rna.properties)
+
+
+def weight_arrays(mesh: bpy.types.Mesh) -> list[np.ndarray]:
+    """Returns the bevel weights and creases of a mesh's vertices and edges, for the layers it has.
+
+    :param mesh: mesh whose weights are read
+    """
+    if bpy.app.version < (4, 0, 0):
+        layers = [(mesh.vertices, 'bevel_weight'), (mesh.edges, 'bevel_weight'), (mesh.edges, 'crease')]
+        if mesh.vertex_creases:
+            layers.append((mesh.vertex_creases[0].data, 'value'))
+    else:
+        layers = [(mesh.attributes[name].data, 'value') for name in weight_layers if name in mesh.attributes]
+
+    arrays = []
+    for elements, attr in layers:
+        values = np.empty(len(elements), dtype=np.float32)
+        elements.foreach_get(attr, values)
+        arrays.append(values)
+    return arrays
+
+
+def mesh_fingerprint(obj: bpy.types.Object) -> bytes:
+    """Returns a 16-byte hash of a mesh object's original geometry, its bevel weights and creases,
+    and its modifier settings.
+
+    Much cheaper than evaluating the mesh: only the original vertex positions, topology and weights are read.
+    Vertex groups are not, see ``reads_vertex_groups``.
+
+    :param obj: mesh object
+    """
+    mesh = obj.data
+    vert_co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', vert_co)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    loop_verts = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get('vertex_index', loop_verts)
+
+    fingerprint = hashlib.blake2b(digest_size=16)
+    for data in [vert_co, loop_totals, loop_verts] + weight_arrays(mesh):
+        fingerprint.update(len(data).to_bytes(8, 'little'))
+        fingerprint.update(data.tobytes())
+    fingerprint.update(modifier_signature(obj).encode())
+    return fingerprint.digest()
+
+
+def evaluated_mesh_stats(obj: bpy.types.Object, depsgraph: bpy.types.Depsgraph) -> MeshStats:
+    """Evaluates a mesh object and returns its statistics.
+
+    :param obj: mesh object
+    :param depsgraph: current scene's dependency graph
+    """
+    obj_eval = obj.evaluated_get(depsgraph)
+    mesh = obj_eval.to_mesh()
+    try:
+        tri_count = mesh_tri_count(mesh)
+        vert_co = np.empty((len(mesh.vertices), 3), dtype=np.float32)
+        mesh.vertices.foreach_get('co', vert_co.ravel())
+    finally:
+        obj_eval.to_mesh_clear()
+
+    if len(vert_co) == 0:
+        return MeshStats(tri_count, 0, (0.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+    return MeshStats(tri_count, len(vert_co),
+                     tuple(vert_co.min(axis=0).tolist()), tuple(vert_co.max(axis=0).tolist()))
+
+
+def disk_cache_path(context: bpy.types.Context) -> Optional[str]:
+    """Returns the path of the mesh statistics cache file for the current .blend file,
+    or None if caching to disk is disabled or the file has never been saved.
+
+    The cache is stored next to the .blend file, unless a cache directory is set.
+
+    :param context: Blender context
+    """
+    wm = context.window_manager
+    if not wm.nl_use_disk_cache or not bpy.data.filepath:
+        return None
+    blend_dir, blend_name = os.path.split(bpy.data.filepath)
+    cache_dir = bpy.path.abspath(wm.nl_cache_dir) if wm.nl_cache_dir else blend_dir
+    return os.path.join(cache_dir, os.path.splitext(blend_name)[0] + '.nlcache')
+
+
+class MeshStatsCache:
+    """Persistent cache of evaluated mesh statistics.
+
+    Entries are keyed by mesh datablock name and a fingerprint of its geometry and the object's modifiers,
+    so only meshes that changed since the cache was saved are evaluated again.
+    """
+
+    def __init__(self, filepath: str):
+        """Loads the cache file, if it exists.
+
+        :param filepath: path of the cache file
+        """
+        self.filepath = filepath
+        self.entries = {}
+        """Mesh statistics keyed by (mesh name, fingerprint)."""
+        self.used_keys = set()
+        self.is_modified = False
+
+        if os.path.isfile(filepath):
+            try:
+                self.load()
+            except (OSError, ValueError, struct.error) as e:
+                print('Could not read mesh cache {}: {}'.format(filepath, e))
+                self.entries = {}
+
+    def load(self):
+        """Reads all entries from the cache file."""
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+
+        magic, version, count = header_format.unpack_from(data, 0)
+        if magic != cache_magic or version != cache_version:
+            raise ValueError('unknown cache format')
+
+        offset = header_format.size
+        for _ in range(count):
+            name_len, fingerprint, tri_count, vert_count, *box = record_format.unpack_from(data, offset)
+            offset += record_format.size
+            name = data[offset:offset + name_len].decode()
+            offset += name_len
+            self.entries[(name, fingerprint)] = MeshStats(tri_count, vert_count, tuple(box[:3]), tuple(box[3:]))
+
+    def save(self):
+        """Writes the cache file if any entry was added.
+
+        Outdated entries of meshes used since loading are dropped.
+        """
+        if not self.is_modified:
+            return
+
+        used_meshes = {name for name, _ in self.used_keys}
+        entries = [(key, stats) for key, stats in self.entries.items()
+                   if key in self.used_keys or key[0] not in used_meshes]
+
+        chunks = [header_format.pack(cache_magic, cache_version, len(entries))]
+        for (name, fingerprint), stats in entries:
+            encoded_name = name.encode()
+            chunks.append(record_format.pack(len(encoded_name), fingerprint, stats.tri_count, stats.vert_count,
+                                             *stats.box_min, *stats.box_max))
+            chunks.append(encoded_name)
+
+        try:
+            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+            with open(self.filepath, 'wb') as f:
+                f.write(b''.join(chunks))
+            self.is_modified = False
+        except OSError as e:
+            print('Could not write mesh cache {}: {}'.format(self.filepath, e))
+
+    def stats(self, obj: bpy.types.Object, depsgraph: bpy.types.Depsgraph) -> MeshStats:
+        """Returns a mesh object's statistics, evaluating it only if it changed since it was cached.
+
+        Only objects whose modifiers depend on nothing besides the mesh and their own settings may be cached,
+        see ``TriBudget.shared_modifier_key``, and whose modifiers read no vertex group, see ``reads_vertex_groups``,
+        since the fingerprint cannot describe anything else.
+
+        :param obj: mesh object
+        :param depsgraph: current scene's dependency graph
+        """
+        key = (obj.data.name_full, mesh_fingerprint(obj))
+        self.used_keys.add(key)
+        if key not in self.entries:
+            self.entries[key] = evaluated_mesh_stats(obj, depsgraph)
+            self.is_modified = True
+        return self.entries[key]
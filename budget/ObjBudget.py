@@ -30,6 +30,17 @@ class ObjBudget(BaseBudget):
         """
         return 1
 
+    def degraded_cost(self, _context: bpy.types.Context, _obj: bpy.types.Object, action: str) -> int:
+        """Calculates and returns the cost of an object shown with reduced detail instead of being hidden.
+
+        Bounding boxes are not counted, objects shown any other way still are.
+
+        :param _context: Blender context
+        :param _obj: Blender object's cost to be counted
+        :param action: one of ``obj_config.over_budget_actions`` besides ``HIDE``
+        """
+        return 0 if action == 'BOUNDS' else 1
+
     def budget_limit(self, context: bpy.types.Context) -> int:
         """Returns the user-specified upper limit of objects for the scene.
 
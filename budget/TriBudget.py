@@ -13,54 +13,74 @@
 #     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from typing import Optional
+
 from .BaseBudget import BaseBudget
 import bpy
-import bmesh
 
+from .MeshStatsCache import MeshStatsCache, mesh_tri_count, modifier_signature, reads_vertex_groups
 from .stat_format_util import format_num
 
 
-def get_bmesh_data(obj: bpy.types.Object, depsgraph: bpy.types.Depsgraph) -> int:
-    """Gets bmesh statistics for a given mesh object.
-
-    Currently only returns the evaluated triangle count, but evaluated face and vertex counts could also be retrieved.
+def get_evaluated_tri_count(obj: bpy.types.Object, depsgraph: bpy.types.Depsgraph) -> int:
+    """Returns the evaluated triangle count for a given mesh object.
 
-    These calculations can be `very` costly, so it's best to use unevaluated data for quicker access.
+    The evaluated mesh is freed as soon as its triangles are counted.
+    Evaluating can still be `very` costly, so it's best to use unevaluated data for quicker access.
 
     :param obj: object to retrieve triangle data from
     :param depsgraph: current scene's dependency graph
     """
-    blender_mesh = obj.evaluated_get(depsgraph).to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
+    obj_eval = obj.evaluated_get(depsgraph)
+    try:
+        return mesh_tri_count(obj_eval.to_mesh())
+    finally:
+        obj_eval.to_mesh_clear()
 
-    bm = bmesh.new()
-    bm.from_mesh(blender_mesh)
-    bm.faces.ensure_lookup_table()
 
-    tris_count = len(bm.calc_loop_triangles())
+def shared_modifier_key(obj: bpy.types.Object) -> Optional[str]:
+    """Returns the key under which a mesh object's evaluated triangle count can be shared with other users
+    of its mesh, or None if its modifiers may depend on anything besides the mesh and their own settings.
 
-    bm.free()
+    Geometry nodes and modifiers referencing other objects (booleans, armatures, etc.) depend on other objects'
+    data or placement, so their results cannot be shared.
 
-    return tris_count
+    :param obj: mesh object
+    """
+    for mod in obj.modifiers:
+        if not mod.show_viewport:
+            continue
+        if mod.type == 'NODES' or any(isinstance(getattr(mod, prop.identifier), bpy.types.Object)
+                                      for prop in mod.bl_rna.properties if prop.type == 'POINTER'):
+            return None
+    return modifier_signature(obj)
 
 
 class TriBudget(BaseBudget):
     """Budget manager by setting an upper limit of evaluated triangles visible in the scene."""
 
-    def __init__(self):
+    def __init__(self, mesh_stats: MeshStatsCache = None):
+        super().__init__(mesh_stats)
         self.collection_cache = {}
 
     def get_tri_count(self, obj: bpy.types.Object, depsgraph: bpy.types.Depsgraph) -> int:
         """Retrieves triangle count for any given object.
 
-        Uses ``get_bmesh_data`` for mesh objects.
+        Uses ``get_evaluated_tri_count`` for mesh objects, or the persistent mesh statistics cache if enabled
+        and the object's modifiers only depend on the mesh and their own settings, and read no vertex group.
         For instanced collections, it will recursively sum up all child mesh object triangle counts.
         Uses caching in case the same collection is referenced multiple times.
+        Mesh objects with the same mesh and modifier settings (e.g. linked duplicates) are only evaluated once.
 
         :param obj: object to retrieve triangle data from
         :param depsgraph: current scene's dependency graph
         """
         if obj.type == 'MESH':
-            return get_bmesh_data(obj, depsgraph)
+            modifier_key = shared_modifier_key(obj)
+            if self.mesh_stats is not None and modifier_key is not None and not reads_vertex_groups(obj):
+                return self.shared_mesh_cost(obj, modifier_key,
+                                             lambda: self.mesh_stats.stats(obj, depsgraph).tri_count)
+            return self.shared_mesh_cost(obj, modifier_key, lambda: get_evaluated_tri_count(obj, depsgraph))
         elif obj.type == 'EMPTY' and obj.is_instancer and obj.instance_type == 'COLLECTION':
             col_name = obj.instance_collection.name
             if col_name in self.collection_cache:
@@ -70,6 +90,13 @@ class TriBudget(BaseBudget):
             return instance_cost
         return 0
 
+    def invalidate_collection(self, collection_name: str):
+        """Forgets the cached cost of an instanced collection, if any.
+
+        :param collection_name: name of the collection
+        """
+        self.collection_cache.pop(collection_name, None)
+
     def budget_limit(self, context: bpy.types.Context) -> int:
         """Returns the user-specified upper limit of objects for the scene.
 
@@ -85,6 +112,22 @@ class TriBudget(BaseBudget):
         """
         return self.get_tri_count(obj, context.evaluated_depsgraph_get())
 
+    def degraded_cost(self, context: bpy.types.Context, obj: bpy.types.Object, action: str) -> int:
+        """Calculates and returns the cost of an object shown with reduced detail instead of being hidden.
+
+        Bounding boxes and wireframes draw no triangles.
+        Mesh objects without their heavy modifiers are counted as their unevaluated mesh.
+
+        :param context: Blender context
+        :param obj: Blender object's cost to be counted
+        :param action: one of ``obj_config.over_budget_actions`` besides ``HIDE``
+        """
+        if action in {'BOUNDS', 'WIRE'}:
+            return 0
+        if obj.type == 'MESH':
+            return mesh_tri_count(obj.data)
+        return self.budget_cost(context, obj)
+
     def draw(self, context: bpy.types.Context, layout: bpy.types.UILayout):
         """Draws object budget parameters in panel.
 
@@ -97,3 +140,9 @@ class TriBudget(BaseBudget):
         row.prop(wm, 'nl_budget_sort_order', expand=True, icon_only=True)
         layout.label(text='Only show up to {} triangles'.format(format_num(wm.nl_tri_budget)))
 
+        row = layout.row(heading='Disk Cache')
+        row.prop(wm, 'nl_use_disk_cache', text='')
+        sub = row.row()
+        sub.active = wm.nl_use_disk_cache
+        sub.prop(wm, 'nl_cache_dir', text='')
+
@@ -16,25 +16,27 @@
 import bpy
 
 from .BaseBudget import BaseBudget
+from .MeshStatsCache import MeshStatsCache
 from .stat_format_util import format_num
 
 
 class VertBudget(BaseBudget):
     """Budget manager by setting an upper limit of vertices visible in the scene."""
 
-    def __init__(self):
+    def __init__(self, mesh_stats: MeshStatsCache = None):
+        super().__init__(mesh_stats)
         self.collection_cache = {}
 
     def get_vert_count(self, obj: bpy.types.Object):
         """Retrieves triangle count for any given object.
 
         For instanced collections, it will recursively sum up all child mesh object triangle counts.
-        Uses caching in case the same collection is referenced multiple times.
+        Uses caching in case the same mesh or collection is referenced multiple times.
 
         :param obj: object to retrieve triangle data from
         """
         if obj.type == 'MESH':
-            return len(obj.data.vertices)
+            return self.shared_mesh_cost(obj, (), lambda: len(obj.data.vertices))
         elif obj.type == 'EMPTY' and obj.is_instancer and obj.instance_type == 'COLLECTION':
             col_name = obj.instance_collection.name
             if col_name in self.collection_cache:
@@ -44,6 +46,13 @@ class VertBudget(BaseBudget):
             return instance_cost
         return 0
 
+    def invalidate_collection(self, collection_name: str):
+        """Forgets the cached cost of an instanced collection, if any.
+
+        :param collection_name: name of the collection
+        """
+        self.collection_cache.pop(collection_name, None)
+
     def budget_limit(self, context: bpy.types.Context) -> int:
         """Returns the user-specified upper limit of vertices for the scene.
 
@@ -59,6 +68,18 @@ class VertBudget(BaseBudget):
         """
         return self.get_vert_count(obj)
 
+    def degraded_cost(self, context: bpy.types.Context, obj: bpy.types.Object, action: str) -> int:
+        """Calculates and returns the cost of an object shown with reduced detail instead of being hidden.
+
+        Bounding boxes have no cost. Vertex counts already ignore modifiers and wireframes draw every vertex,
+        so objects shown any other way cost as much as when fully shown.
+
+        :param context: Blender context
+        :param obj: Blender object's cost to be counted
+        :param action: one of ``obj_config.over_budget_actions`` besides ``HIDE``
+        """
+        return 0 if action == 'BOUNDS' else self.budget_cost(context, obj)
+
     def draw(self, context: bpy.types.Context, layout: bpy.types.UILayout):
         """Draws object budget parameters in panel.
 
@@ -17,8 +17,9 @@ from typing import Type
 
 import bpy
 
-from . import BaseBudget, ObjBudget, VertBudget, TriBudget
+from . import BaseBudget, ObjBudget, VertBudget, TriBudget, MeshStatsCache
 from .BaseBudget import BaseBudget
+from .MeshStatsCache import MeshStatsCache, disk_cache_path
 from .ObjBudget import ObjBudget
 from .TriBudget import TriBudget
 from .VertBudget import VertBudget
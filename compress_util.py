@@ -3,10 +3,12 @@ import zipfile
 import ast
 
 allowed_file_extensions = {'.py', 'LICENSE', '.md'}
+excluded_dirs = {'benchmark', 'doc', 'tests'}
 
 
 def zipdir(path, ziph: zipfile.ZipFile, zip_subdir_name):
     for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d not in excluded_dirs]
         for file in files:
             if any(file.endswith(ext) for ext in allowed_file_extensions):
                 orig_hier = os.path.join(root, file)
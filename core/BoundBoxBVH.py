@@ -0,0 +1,166 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Sequence
+
+import numpy as np
+
+from .cull_util import box_corners
+
+
+class BoundBoxBVH:
+    """Bounding volume hierarchy over cached bounding boxes.
+
+    Each node covers a contiguous range of ``order``, so a whole subtree can be accepted or rejected at once.
+    Queries walk the tree one level at a time, testing every node of a level together.
+    """
+
+    def __init__(self, corners: np.ndarray, leaf_size: int = 16):
+        """Builds the tree by splitting box centers at the median of their longest axis.
+
+        :param corners: array of bounding box corners, shape (N, 8, 3).
+        :param leaf_size: maximum number of boxes in a leaf node.
+        """
+        self.corners = corners
+        self.order = np.arange(len(corners))
+
+        starts, ends, lefts, rights = [], [], [], []
+
+        def add_node(start, end):
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            return len(starts) - 1
+
+        centers = corners.mean(axis=1)
+        stack = [add_node(0, len(corners))] if len(corners) else []
+        while stack:
+            node = stack.pop()
+            start, end = starts[node], ends[node]
+            if end - start <= leaf_size:
+                continue
+
+            indices = self.order[start:end]
+            node_centers = centers[indices]
+            axis = np.argmax(node_centers.max(axis=0) - node_centers.min(axis=0))
+            mid = (end - start) // 2
+            self.order[start:end] = indices[np.argpartition(node_centers[:, axis], mid)]
+
+            lefts[node] = add_node(start, start + mid)
+            rights[node] = add_node(start + mid, end)
+            stack.extend((lefts[node], rights[node]))
+
+        self.node_start = np.array(starts, dtype=np.int64)
+        self.node_end = np.array(ends, dtype=np.int64)
+        self.node_left = np.array(lefts, dtype=np.int64)
+        self.node_right = np.array(rights, dtype=np.int64)
+        self.refit()
+
+    def refit(self):
+        """Recomputes node bounds from ``corners`` without changing the tree's structure.
+
+        Call after corners have moved in place.
+        """
+        node_count = len(self.node_start)
+        self.node_min = np.zeros((node_count, 3))
+        self.node_max = np.zeros((node_count, 3))
+        if node_count == 0:
+            return
+
+        sorted_corners = self.corners[self.order]
+        box_min, box_max = sorted_corners.min(axis=1), sorted_corners.max(axis=1)
+
+        # leaves partition the boxes, so each leaf's bounds is one reduction over its range
+        leaves = np.flatnonzero(self.node_left < 0)
+        leaves = leaves[np.argsort(self.node_start[leaves])]
+        self.node_min[leaves] = np.minimum.reduceat(box_min, self.node_start[leaves])
+        self.node_max[leaves] = np.maximum.reduceat(box_max, self.node_start[leaves])
+
+        # children are always created after their parent
+        for node in np.flatnonzero(self.node_left >= 0)[::-1]:
+            left, right = self.node_left[node], self.node_right[node]
+            self.node_min[node] = np.minimum(self.node_min[left], self.node_min[right])
+            self.node_max[node] = np.maximum(self.node_max[left], self.node_max[right])
+
+    def _node_indices(self, nodes: np.ndarray) -> np.ndarray:
+        """Returns indices of all boxes under the given nodes.
+
+        :param nodes: node indices.
+        """
+        starts = self.node_start[nodes]
+        lengths = self.node_end[nodes] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.order[offsets + np.arange(lengths.sum())]
+
+    def _classify(self, nodes: np.ndarray, camera_location: np.ndarray, max_dist: float,
+                  perspective_matrix: np.ndarray, frustum_scale: tuple[float, float]) -> tuple[np.ndarray, np.ndarray]:
+        """Returns masks of nodes (entirely outside, entirely inside) the view frustum and maximum distance.
+
+        Tests are done in clip space, where every contained box corner lies in the same half-spaces as the node.
+
+        :param nodes: node indices.
+        :param camera_location: camera's world location.
+        :param max_dist: maximum allowed distance between points and camera.
+        :param perspective_matrix: 4x4 view-projection matrix of the region.
+        :param frustum_scale: horizontal and vertical scale of the frustum's sides.
+        """
+        node_min, node_max = self.node_min[nodes], self.node_max[nodes]
+        projected = box_corners(node_min, node_max) @ perspective_matrix[:, :3].T + perspective_matrix[:, 3]
+        x, y, w = projected[..., 0] / frustum_scale[0], projected[..., 1] / frustum_scale[1], projected[..., 3]
+
+        outside = (np.all(w <= 0.0, axis=1)
+                   | np.all(x + w < 0.0, axis=1) | np.all(w - x < 0.0, axis=1)
+                   | np.all(y + w < 0.0, axis=1) | np.all(w - y < 0.0, axis=1))
+        inside = np.all((w > 0.0) & (np.abs(x) <= w) & (np.abs(y) <= w), axis=1)
+
+        sq_max_dist = max_dist * max_dist
+        nearest_offsets = np.clip(camera_location, node_min, node_max) - camera_location
+        farthest_offsets = np.maximum(np.abs(node_min - camera_location), np.abs(node_max - camera_location))
+        outside |= np.einsum('ij,ij->i', nearest_offsets, nearest_offsets) >= sq_max_dist
+        inside &= np.einsum('ij,ij->i', farthest_offsets, farthest_offsets) < sq_max_dist
+        return outside, inside
+
+    def query(self, camera_location: Sequence[float], max_dist: float, perspective_matrix: np.ndarray,
+              frustum_scale: tuple[float, float] = (1.0, 1.0)) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns box indices as a tuple of (visible, needing an exact test, culled) arrays.
+
+        Whole subtrees entirely within or outside the view frustum and maximum distance are resolved
+        without testing their boxes.
+
+        :param camera_location: camera's world location.
+        :param max_dist: maximum allowed distance between points and camera.
+        :param perspective_matrix: 4x4 view-projection matrix of the region.
+        :param frustum_scale: horizontal and vertical scale of the frustum's sides, e.g. to add a margin.
+        """
+        camera_location = np.asarray(camera_location, dtype=np.float64)
+        perspective_matrix = np.asarray(perspective_matrix, dtype=np.float64)
+
+        inside_nodes, partial_nodes, outside_nodes = [], [], []
+        frontier = np.zeros(1 if len(self.node_start) else 0, dtype=np.int64)
+        while frontier.size:
+            outside, inside = self._classify(frontier, camera_location, max_dist, perspective_matrix,
+                                             frustum_scale)
+            outside_nodes.append(frontier[outside])
+            inside_nodes.append(frontier[inside & ~outside])
+
+            partial = frontier[~(outside | inside)]
+            is_leaf = self.node_left[partial] < 0
+            partial_nodes.append(partial[is_leaf])
+            internal = partial[~is_leaf]
+            frontier = np.concatenate((self.node_left[internal], self.node_right[internal]))
+
+        return tuple(self._node_indices(np.concatenate(nodes)) if nodes else np.zeros(0, dtype=np.int64)
+                     for nodes in (inside_nodes, partial_nodes, outside_nodes))
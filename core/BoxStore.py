@@ -0,0 +1,233 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Hashable, Sequence
+
+import numpy as np
+
+from .cull_util import transformed_box_corners
+
+
+def grow(array: np.ndarray, size: int) -> np.ndarray:
+    """Returns the array if it holds at least ``size`` rows, otherwise a copy with at least twice as many rows.
+
+    :param array: array to grow along its first axis
+    :param size: number of rows needed
+    """
+    if size <= len(array):
+        return array
+    grown = np.zeros((max(size, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class BoxStore:
+    """Bounding boxes of objects kept in flat arrays: one local box per key, shared by every object using that key
+    (e.g. the same mesh or instanced collection), and one world matrix per object.
+
+    World-space corners are derived from both on demand, for one object or many at once.
+    Rows of removed objects and dropped keys are reused, so the arrays do not grow as objects are recached.
+    """
+
+    def __init__(self):
+        self.local_boxes = np.zeros((0, 2, 3))
+        """Minimum and maximum corner of each local box, shape (L, 2, 3)."""
+        self.local_refs = np.zeros(0, dtype=np.int64)
+        """Number of objects using each local box."""
+        self.local_rows = {}
+        """Row of each local box in ``local_boxes``, keyed by its key."""
+        self.local_keys = []
+        """Key of each row in ``local_boxes``, or None if the key was dropped."""
+        self.free_local_rows = []
+
+        self.matrices = np.zeros((0, 4, 4))
+        """World matrix of each object, shape (O, 4, 4)."""
+        self.obj_locals = np.zeros(0, dtype=np.int64)
+        """Row in ``local_boxes`` of each object's local box."""
+        self.obj_rows = {}
+        """Row of each object in ``matrices``, keyed by its name."""
+        self.free_obj_rows = []
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the arrays, in bytes."""
+        return self.local_boxes.nbytes + self.local_refs.nbytes + self.matrices.nbytes + self.obj_locals.nbytes
+
+    def __contains__(self, obj_name: str) -> bool:
+        return obj_name in self.obj_rows
+
+    def __len__(self) -> int:
+        return len(self.obj_rows)
+
+    def has_local(self, key: Hashable) -> bool:
+        """Returns True if a local box is stored for the key, False otherwise.
+
+        :param key: key of the local box
+        """
+        return key in self.local_rows
+
+    def set_local(self, key: Hashable, box_min: Sequence[float], box_max: Sequence[float]):
+        """Stores or replaces a local box, which every object using the key follows.
+
+        :param key: key of the local box
+        :param box_min: minimum corner in local space
+        :param box_max: maximum corner in local space
+        """
+        row = self.local_row(key)
+        self.local_boxes[row, 0] = box_min
+        self.local_boxes[row, 1] = box_max
+
+    def set_locals(self, keys: Sequence[Hashable], box_min: np.ndarray, box_max: np.ndarray) -> np.ndarray:
+        """Stores or replaces many local boxes at once and returns their rows in ``local_boxes``.
+        If a key is repeated, its last box is kept.
+
+        :param keys: key of each local box
+        :param box_min: minimum corner of each box in local space, shape (N, 3)
+        :param box_max: maximum corner of each box in local space, shape (N, 3)
+        """
+        rows = np.fromiter((self.local_row(key) for key in keys), dtype=np.int64, count=len(keys))
+        self.local_boxes[rows, 0] = box_min
+        self.local_boxes[rows, 1] = box_max
+        return rows
+
+    def local_row(self, key: Hashable) -> int:
+        """Returns the row of a key's local box, allocating one if the key is not stored yet.
+
+        :param key: key of the local box
+        """
+        row = self.local_rows.get(key)
+        if row is None:
+            if self.free_local_rows:
+                row = self.free_local_rows.pop()
+                self.local_keys[row] = key
+            else:
+                row = len(self.local_keys)
+                self.local_keys.append(key)
+                self.local_boxes = grow(self.local_boxes, row + 1)
+                self.local_refs = grow(self.local_refs, row + 1)
+            self.local_rows[key] = row
+        return row
+
+    def drop_local(self, key: Hashable):
+        """Forgets a key. Its local box is kept for the objects still using it, until they are set again or removed.
+
+        :param key: key of the local box
+        """
+        row = self.local_rows.pop(key, None)
+        if row is not None:
+            self.local_keys[row] = None
+            if self.local_refs[row] == 0:
+                self.free_local_rows.append(row)
+
+    def rename_local(self, old_key: Hashable, new_key: Hashable):
+        """Moves a local box to a new key.
+
+        :param old_key: current key of the local box
+        :param new_key: key to move it to
+        """
+        row = self.local_rows.pop(old_key, None)
+        if row is not None:
+            self.local_rows[new_key] = row
+            self.local_keys[row] = new_key
+
+    def release_local_row(self, row: int):
+        """Stops an object using a local box, freeing the row once unused and its key dropped.
+
+        :param row: row in ``local_boxes``
+        """
+        self.local_refs[row] -= 1
+        if self.local_refs[row] == 0 and self.local_keys[row] is None:
+            self.free_local_rows.append(row)
+
+    def set_obj(self, obj_name: str, key: Hashable, matrix: Sequence[Sequence[float]]):
+        """Stores or replaces an object's world matrix and the key of its local box, which must be stored.
+
+        :param obj_name: name of the object
+        :param key: key of the object's local box
+        :param matrix: world matrix of the object, 4x4
+        """
+        self.remove_obj(obj_name)
+        local_row = self.local_rows[key]
+        row = self.obj_row(obj_name)
+        self.obj_locals[row] = local_row
+        self.local_refs[local_row] += 1
+        self.matrices[row] = matrix
+
+    def set_objs(self, obj_names: Sequence[str], local_rows: np.ndarray, matrices: np.ndarray):
+        """Stores or replaces many objects at once.
+
+        :param obj_names: name of each object, without repeats
+        :param local_rows: row in ``local_boxes`` of each object's local box, as returned by ``set_locals``
+        :param matrices: world matrix of each object, shape (N, 4, 4)
+        """
+        if self.obj_rows:
+            for obj_name in obj_names:
+                self.remove_obj(obj_name)
+        allocated = len(self.obj_rows) + len(self.free_obj_rows)
+        reused = min(len(obj_names), len(self.free_obj_rows))
+        added = len(obj_names) - reused
+        rows = np.concatenate((np.array(self.free_obj_rows[len(self.free_obj_rows) - reused:], dtype=np.int64),
+                               np.arange(allocated, allocated + added, dtype=np.int64)))
+        del self.free_obj_rows[len(self.free_obj_rows) - reused:]
+        self.matrices = grow(self.matrices, allocated + added)
+        self.obj_locals = grow(self.obj_locals, allocated + added)
+        self.obj_rows.update(zip(obj_names, rows.tolist()))
+        self.obj_locals[rows] = local_rows
+        np.add.at(self.local_refs, local_rows, 1)
+        self.matrices[rows] = matrices
+
+    def obj_row(self, obj_name: str) -> int:
+        """Allocates and returns a row in ``matrices`` for an object that is not stored.
+
+        :param obj_name: name of the object
+        """
+        if self.free_obj_rows:
+            row = self.free_obj_rows.pop()
+        else:
+            row = len(self.obj_rows)
+            self.matrices = grow(self.matrices, row + 1)
+            self.obj_locals = grow(self.obj_locals, row + 1)
+        self.obj_rows[obj_name] = row
+        return row
+
+    def remove_obj(self, obj_name: str):
+        """Forgets an object, if stored.
+
+        :param obj_name: name of the object
+        """
+        row = self.obj_rows.pop(obj_name, None)
+        if row is not None:
+            self.release_local_row(self.obj_locals[row])
+            self.free_obj_rows.append(row)
+
+    def rename_obj(self, old_name: str, new_name: str):
+        """Moves an object's entry to its new name.
+
+        :param old_name: previous name of the object
+        :param new_name: current name of the object
+        """
+        row = self.obj_rows.pop(old_name, None)
+        if row is not None:
+            self.obj_rows[new_name] = row
+
+    def world_corners(self, obj_names: Sequence[str]) -> np.ndarray:
+        """Returns the world-space corners of stored objects' boxes, shape (N, 8, 3),
+        in Blender's ``bound_box`` order.
+
+        :param obj_names: names of stored objects
+        """
+        rows = np.fromiter((self.obj_rows[name] for name in obj_names), dtype=np.int64, count=len(obj_names))
+        boxes = self.local_boxes[self.obj_locals[rows]]
+        return transformed_box_corners(boxes[:, 0], boxes[:, 1], self.matrices[rows])
@@ -0,0 +1,225 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Stand-in scene for profiling the culling core under plain Python, without Blender.
+
+Run from the add-on's directory::
+
+    python -m core.StandInScene --size 100000 --profile
+"""
+
+
+import argparse
+import cProfile
+import math
+import pstats
+import time
+from typing import Optional
+
+import numpy as np
+
+from .BoundBoxBVH import BoundBoxBVH
+from .cull_util import box_corners
+from .pass_profile import PassProfile, pass_stages
+from .select_util import Hysteresis, Selection, select_visible, sort_orders
+
+
+def look_at_view_matrix(eye: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """Returns the 4x4 view matrix of a camera at ``eye`` looking at ``target``, with Z up.
+
+    :param eye: camera location
+    :param target: point the camera looks at
+    """
+    forward = target - eye
+    forward /= np.linalg.norm(forward)
+    right = np.cross(forward, (0.0, 0.0, 1.0))
+    if np.linalg.norm(right) < 1e-6:
+        right = np.array((1.0, 0.0, 0.0))
+    right /= np.linalg.norm(right)
+    up = np.cross(right, forward)
+
+    view_matrix = np.identity(4)
+    view_matrix[0, :3], view_matrix[1, :3], view_matrix[2, :3] = right, up, -forward
+    view_matrix[:3, 3] = -view_matrix[:3, :3] @ eye
+    return view_matrix
+
+
+def perspective_projection(fov: float, aspect: float, near: float, far: float) -> np.ndarray:
+    """Returns an OpenGL-style perspective projection matrix, as used by the 3D view.
+
+    :param fov: horizontal field of view in radians
+    :param aspect: width divided by height
+    :param near: near clip distance
+    :param far: far clip distance
+    """
+    f = 1.0 / math.tan(fov / 2.0)
+    return np.array([
+        (f, 0.0, 0.0, 0.0),
+        (0.0, f * aspect, 0.0, 0.0),
+        (0.0, 0.0, (far + near) / (near - far), 2.0 * far * near / (near - far)),
+        (0.0, 0.0, -1.0, 0.0),
+    ])
+
+
+class StandInScene:
+    """Random boxes with budget costs, standing in for a Blender scene's cached objects.
+
+    Holds the same arrays as ``SceneCache``, so the culling core runs on it unchanged.
+    """
+
+    def __init__(self, size: int, seed: int = 0, obj_spacing: float = 4.0,
+                 box_size_range: tuple[float, float] = (0.5, 4.0), max_cost: int = 50000):
+        """
+        :param size: number of objects
+        :param seed: random seed
+        :param obj_spacing: average distance between neighboring objects
+        :param box_size_range: minimum and maximum box size per axis
+        :param max_cost: maximum budget cost per object
+        """
+        rng = np.random.default_rng(seed)
+        self.extent = obj_spacing * size ** (1.0 / 3.0)
+        box_min = rng.uniform(0.0, self.extent, (size, 3))
+        box_max = box_min + rng.uniform(*box_size_range, (size, 3))
+
+        self.corners = box_corners(box_min, box_max)
+        """Bounding box corners of each object, shape (N, 8, 3)."""
+        self.origins = (box_min + box_max) / 2.0
+        self.costs = rng.integers(1, max_cost, size).astype(np.float64)
+        self.bvh = BoundBoxBVH(self.corners)
+
+    def orbit_view(self, angle: float, fov: float = math.radians(60.0),
+                   aspect: float = 16.0 / 9.0) -> tuple[np.ndarray, np.ndarray]:
+        """Returns a tuple of (camera location, perspective matrix) of a view orbiting the scene's center.
+
+        :param angle: angle around the center in radians
+        :param fov: horizontal field of view in radians
+        :param aspect: width divided by height of the view
+        """
+        center = np.full(3, self.extent / 2.0)
+        eye = center + self.extent * np.array((math.cos(angle), math.sin(angle), 0.5 * math.sin(2.0 * angle)))
+        projection = perspective_projection(fov, aspect, 0.1, 10.0 * self.extent)
+        return eye, projection @ look_at_view_matrix(eye, center)
+
+    def select_visible(self, camera_location: np.ndarray, perspective_matrix: np.ndarray, max_dist: float,
+                       budget_limit: float, sort_order: Optional[str] = None, use_bvh: bool = True,
+                       occluder_count: int = 0, min_screen_size: float = 0.0,
+                       hysteresis: Optional[Hysteresis] = None, region_size: tuple[int, int] = (1920, 1080),
+                       degraded_costs: Optional[np.ndarray] = None,
+                       profile: Optional[PassProfile] = None) -> Selection:
+        """Returns indices of the objects to show fully and with reduced detail, see ``select_util.select_visible``.
+
+        :param camera_location: camera's world location
+        :param perspective_matrix: 4x4 view-projection matrix of the region
+        :param max_dist: maximum allowed distance between points and camera
+        :param budget_limit: maximum total cost of shown objects
+        :param sort_order: one of ``sort_orders``, or None to keep the objects' order
+        :param use_bvh: whether to cull with the tree instead of testing every box
+        :param occluder_count: maximum number of boxes used as occluders, or 0 to skip occlusion culling
+        :param min_screen_size: minimum radius in pixels of an object's projected bounding sphere
+        :param hysteresis: margins keeping objects in their current state
+        :param region_size: region width and height in pixels
+        :param degraded_costs: budget cost of each object shown with reduced detail, or None to hide
+            objects that do not fit
+        :param profile: if given, records the time of each stage and the number of boxes tested
+        """
+        return select_visible(self.corners, self.costs, self.origins, camera_location, max_dist,
+                              perspective_matrix, *region_size, budget_limit, sort_order,
+                              self.bvh if use_bvh else None, occluder_count, min_screen_size, hysteresis,
+                              degraded_costs=degraded_costs, profile=profile)
+
+    def count_state_changes(self, views: list[tuple[np.ndarray, np.ndarray]], max_dist: float, budget_limit: float,
+                            sort_order: Optional[str] = None, hysteresis: Optional[Hysteresis] = None,
+                            min_visible_time: float = 0.0, frame_time: float = 1.0 / 30.0) -> int:
+        """Returns how many times objects were hidden or revealed while moving through a sequence of views.
+
+        :param views: tuples of (camera location, perspective matrix), one per update
+        :param max_dist: maximum allowed distance between points and camera
+        :param budget_limit: maximum total cost of shown objects
+        :param sort_order: one of ``sort_orders``, or None to keep the objects' order
+        :param hysteresis: margins keeping objects in their current state, whose visibility is filled in per update
+        :param min_visible_time: minimum time in seconds revealed objects stay visible, with hysteresis
+        :param frame_time: time in seconds between updates
+        """
+        shown = np.zeros(len(self.corners), dtype=bool)
+        revealed_times = np.full(len(self.corners), -np.inf)
+        state_changes = 0
+        for frame, (camera_location, perspective_matrix) in enumerate(views):
+            now = frame * frame_time
+            frame_hysteresis = None
+            if hysteresis is not None:
+                held = shown & (now - revealed_times < min_visible_time)
+                frame_hysteresis = hysteresis._replace(shown=shown, held=held)
+
+            visible = np.zeros(len(self.corners), dtype=bool)
+            visible[self.select_visible(camera_location, perspective_matrix, max_dist, budget_limit, sort_order,
+                                        hysteresis=frame_hysteresis).shown] = True
+            state_changes += int(np.count_nonzero(visible != shown))
+            revealed_times[visible & ~shown] = now
+            shown = visible
+        return state_changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times the culling core on a stand-in scene.')
+    parser.add_argument('--size', type=int, default=100000, help='number of objects')
+    parser.add_argument('--views', type=int, default=8, help='number of views orbiting the scene')
+    parser.add_argument('--max-distance', type=float, default=100.0, help='maximum distance of shown objects')
+    parser.add_argument('--budget', type=float, default=3000000.0, help='maximum total cost of shown objects')
+    parser.add_argument('--sort', choices=sort_orders, default='descending', help='priority of objects')
+    parser.add_argument('--occluders', type=int, default=0, help='number of occluders, 0 disables occlusion')
+    parser.add_argument('--min-screen-size', type=float, default=0.0,
+                        help='minimum projected radius in pixels, 0 disables screen size culling')
+    parser.add_argument('--no-bvh', action='store_true', help='test every box instead of culling with the tree')
+    parser.add_argument('--profile', action='store_true', help='print cProfile statistics')
+    parser.add_argument('--navigate', action='store_true',
+                        help='count state changes while jittering the view, with and without hysteresis')
+    args = parser.parse_args()
+
+    build_start = time.perf_counter()
+    scene = StandInScene(args.size)
+    print('Built {} objects in {:.2f}s'.format(args.size, time.perf_counter() - build_start))
+
+    views = [scene.orbit_view(math.tau * i / args.views) for i in range(args.views)]
+    profiler = cProfile.Profile() if args.profile else None
+    profiles = []
+    for camera_location, perspective_matrix in views:
+        profile = PassProfile()
+        if profiler is not None:
+            profiler.enable()
+        scene.select_visible(camera_location, perspective_matrix, args.max_distance, args.budget, args.sort,
+                             use_bvh=not args.no_bvh, occluder_count=args.occluders,
+                             min_screen_size=args.min_screen_size, profile=profile)
+        if profiler is not None:
+            profiler.disable()
+        profile.finish()
+        profiles.append(profile)
+
+    for stage in pass_stages[:-1]:
+        print('{:>9}: {:.3f} ms'.format(stage, np.median([p.stage_times[stage] for p in profiles]) * 1000.0))
+    print('{:>9}: {:.3f} ms'.format('total', np.median([p.total_time for p in profiles]) * 1000.0))
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+
+    if args.navigate:
+        frame_count, frame_time = 300, 1.0 / 30.0
+        nav_views = [scene.orbit_view(0.3 + 0.002 * i + 0.01 * math.sin(i * 0.7)) for i in range(frame_count)]
+        hysteresis = Hysteresis(np.zeros(0, dtype=bool), distance_exit=2.0, frustum_exit=50.0, budget_band=0.05)
+        for label, frame_hysteresis in (('without hysteresis', None), ('with hysteresis', hysteresis)):
+            state_changes = scene.count_state_changes(nav_views, args.max_distance, args.budget, args.sort,
+                                                      frame_hysteresis, 0.5, frame_time)
+            print('State changes per second {}: {:.1f}'.format(label, state_changes / (frame_count * frame_time)))
+
+
+if __name__ == '__main__':
+    main()
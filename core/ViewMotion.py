@@ -0,0 +1,115 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from collections import deque
+
+import numpy as np
+
+
+def rotation_log(rotation: np.ndarray) -> np.ndarray:
+    """Returns the rotation vector (axis times angle in radians) of a 3x3 rotation matrix.
+
+    :param rotation: rotation matrix
+    """
+    skew = np.array((rotation[2, 1] - rotation[1, 2], rotation[0, 2] - rotation[2, 0], rotation[1, 0] - rotation[0, 1]))
+    angle = np.arccos(np.clip((np.trace(rotation) - 1.0) / 2.0, -1.0, 1.0))
+    if angle < 1e-6:
+        return skew / 2.0
+    if np.pi - angle < 1e-6:
+        # half turn: the axis is the rotation's eigenvector with eigenvalue 1
+        axis = np.sqrt(np.maximum((np.diag(rotation) + 1.0) / 2.0, 0.0))
+        return axis * angle
+    return skew * angle / (2.0 * np.sin(angle))
+
+
+def rotation_exp(rotation_vector: np.ndarray) -> np.ndarray:
+    """Returns the 3x3 rotation matrix of a rotation vector (axis times angle in radians).
+
+    :param rotation_vector: rotation vector
+    """
+    angle = np.linalg.norm(rotation_vector)
+    if angle < 1e-9:
+        return np.identity(3)
+    x, y, z = rotation_vector / angle
+    cross = np.array(((0.0, -z, y), (z, 0.0, -x), (-y, x, 0.0)))
+    return np.identity(3) + np.sin(angle) * cross + (1.0 - np.cos(angle)) * cross @ cross
+
+
+class ViewMotion:
+    """Recent view matrices of a 3D view, used to extrapolate where the view is heading."""
+
+    def __init__(self, window: float = 0.5, max_samples: int = 32):
+        """
+        :param window: time in seconds before the latest sample over which velocity is measured
+        :param max_samples: number of samples kept
+        """
+        self.window = window
+        self.samples = deque(maxlen=max_samples)
+        """Tuples of (time in seconds, 4x4 view matrix)."""
+
+    def add(self, timestamp: float, view_matrix: np.ndarray):
+        """Records a view matrix, skipping it if the view has not changed since the last sample.
+
+        :param timestamp: time in seconds
+        :param view_matrix: 4x4 world-to-view matrix
+        """
+        view_matrix = np.array(view_matrix, dtype=np.float64)
+        if self.samples and np.array_equal(self.samples[-1][1], view_matrix):
+            return
+        self.samples.append((timestamp, view_matrix))
+
+    def velocity(self, now: float) -> tuple[np.ndarray, np.ndarray]:
+        """Returns a tuple of (linear velocity, angular velocity as a rotation vector) of the camera in world space,
+        both per second, measured over the sampling window.
+
+        Unchanged views are not recorded, so a view that has not changed for longer than the window is still.
+
+        :param now: current time in seconds
+        """
+        if len(self.samples) < 2 or now - self.samples[-1][0] > self.window:
+            return np.zeros(3), np.zeros(3)
+
+        end_time, end_view = self.samples[-1]
+        start_time, start_view = next((time, view) for time, view in self.samples
+                                      if end_time - time <= self.window)
+        elapsed = end_time - start_time
+        if elapsed <= 0.0:
+            return np.zeros(3), np.zeros(3)
+
+        start_camera, end_camera = np.linalg.inv(start_view), np.linalg.inv(end_view)
+        linear = (end_camera[:3, 3] - start_camera[:3, 3]) / elapsed
+        angular = rotation_log(end_camera[:3, :3] @ start_camera[:3, :3].T) / elapsed
+        return linear, angular
+
+    def predict(self, view_matrix: np.ndarray, lookahead: float, now: float) -> np.ndarray:
+        """Returns the view matrix expected after moving at the current velocity for the given time.
+
+        :param view_matrix: current 4x4 world-to-view matrix
+        :param lookahead: time in seconds to extrapolate
+        :param now: current time in seconds
+        """
+        linear, angular = self.velocity(now)
+        camera = np.linalg.inv(np.asarray(view_matrix, dtype=np.float64))
+        camera[:3, :3] = rotation_exp(angular * lookahead) @ camera[:3, :3]
+        camera[:3, 3] += linear * lookahead
+        return np.linalg.inv(camera)
+
+    def is_moving(self, now: float) -> bool:
+        """Returns True if the view moved during the sampling window, False otherwise.
+
+        :param now: current time in seconds
+        """
+        linear, angular = self.velocity(now)
+        return bool(linear.any() or angular.any())
@@ -0,0 +1,87 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+
+
+class VisibilityBake:
+    """Visibility of a fixed set of objects over a range of frames, stored as per-frame changes.
+
+    Each frame keeps the indices of the objects whose visibility flipped since the previous frame,
+    so stepping forward one frame costs only as much as the objects that changed.
+    The full visibility is kept as packed bits every ``keyframe_interval`` frames,
+    so jumping to any frame only replays the changes since the nearest earlier keyframe.
+    """
+
+    def __init__(self, frame_start: int, obj_count: int, keyframe_interval: int = 50):
+        """
+        :param frame_start: first baked frame
+        :param obj_count: number of objects
+        :param keyframe_interval: number of frames between full copies of the visibility
+        """
+        self.frame_start = frame_start
+        self.obj_count = obj_count
+        self.keyframe_interval = keyframe_interval
+        self.changes = []
+        """Indices of the objects whose visibility flipped on each frame, the first frame against all hidden."""
+        self.keyframes = []
+        """Packed visibility of every ``keyframe_interval``-th frame."""
+        self.last_visible = np.zeros(obj_count, dtype=bool)
+
+    @property
+    def frame_end(self) -> int:
+        """Last baked frame, or the frame before ``frame_start`` if nothing is baked yet."""
+        return self.frame_start + len(self.changes) - 1
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the baked changes and keyframes, in bytes."""
+        return sum(c.nbytes for c in self.changes) + sum(k.nbytes for k in self.keyframes)
+
+    def covers(self, frame: int) -> bool:
+        """Returns True if the frame was baked, False otherwise.
+
+        :param frame: frame number
+        """
+        return self.frame_start <= frame <= self.frame_end
+
+    def add_frame(self, visible: np.ndarray):
+        """Appends the visibility of the frame after the last baked one.
+
+        :param visible: visibility of each object, shape (obj_count,)
+        """
+        if len(self.changes) % self.keyframe_interval == 0:
+            self.keyframes.append(np.packbits(visible))
+        self.changes.append(np.flatnonzero(visible != self.last_visible).astype(np.int32))
+        self.last_visible = visible.copy()
+
+    def changed(self, frame: int) -> np.ndarray:
+        """Returns indices of the objects whose visibility flipped between the previous frame and this one.
+
+        :param frame: baked frame number, after ``frame_start``
+        """
+        return self.changes[frame - self.frame_start]
+
+    def visible_at(self, frame: int) -> np.ndarray:
+        """Returns the visibility of each object on a baked frame.
+
+        :param frame: baked frame number
+        """
+        offset = frame - self.frame_start
+        keyframe_idx = offset // self.keyframe_interval
+        visible = np.unpackbits(self.keyframes[keyframe_idx], count=self.obj_count).astype(bool)
+        for changed in self.changes[keyframe_idx * self.keyframe_interval + 1:offset + 1]:
+            visible[changed] = ~visible[changed]
+        return visible
@@ -0,0 +1,146 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import Sequence
+
+import numpy as np
+
+box_corner_signs = np.array([(-1.0, -1.0, -1.0), (-1.0, -1.0, 1.0), (-1.0, 1.0, 1.0), (-1.0, 1.0, -1.0),
+                             (1.0, -1.0, -1.0), (1.0, -1.0, 1.0), (1.0, 1.0, 1.0), (1.0, 1.0, -1.0)]) > 0
+"""Which corners of a box take the maximum coordinate per axis, in Blender's ``bound_box`` corner order."""
+
+
+def box_corners(box_min: np.ndarray, box_max: np.ndarray) -> np.ndarray:
+    """Expands axis-aligned boxes into their corners, shape (N, 8, 3), in Blender's ``bound_box`` order.
+
+    :param box_min: minimum coordinates of each box, shape (N, 3).
+    :param box_max: maximum coordinates of each box, shape (N, 3).
+    """
+    return np.where(box_corner_signs, box_max[:, np.newaxis, :], box_min[:, np.newaxis, :])
+
+
+def transformed_box_corners(box_min: np.ndarray, box_max: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+    """Expands local axis-aligned boxes into their world-space corners, shape (N, 8, 3),
+    in Blender's ``bound_box`` order.
+
+    :param box_min: minimum local coordinates of each box, shape (N, 3).
+    :param box_max: maximum local coordinates of each box, shape (N, 3).
+    :param matrices: world matrix of each box, shape (N, 4, 4).
+    """
+    corners = box_corners(box_min, box_max)
+    return corners @ matrices[:, :3, :3].transpose(0, 2, 1) + matrices[:, np.newaxis, :3, 3]
+
+
+def close_to_camera_mask(camera_location: Sequence[float], corners: np.ndarray, max_dist: float) -> np.ndarray:
+    """Returns a boolean mask of boxes with any corner closer to the camera than the maximum distance.
+
+    :param camera_location: camera's world location.
+    :param corners: array of bounding box corners, shape (N, 8, 3).
+    :param max_dist: maximum allowed distance between points and camera.
+    """
+    offsets = corners - np.asarray(camera_location, dtype=np.float64)
+    sq_dists = np.einsum('ijk,ijk->ij', offsets, offsets)
+    return np.any(sq_dists < max_dist * max_dist, axis=1)
+
+
+def project_corners(corners: np.ndarray, perspective_matrix: np.ndarray,
+                    width: float, height: float) -> tuple[np.ndarray, np.ndarray]:
+    """Projects all corners to region space in a single matrix multiply.
+
+    Matches ``bpy_extras.view3d_utils.location_3d_to_region_2d``:
+    corners behind the view (``w <= 0``) have no region location and are flagged in the returned mask.
+
+    Returns a tuple of (region coordinates of shape (N, 8, 2), mask of corners in front of the view of shape (N, 8)).
+
+    :param corners: array of bounding box corners, shape (N, 8, 3).
+    :param perspective_matrix: 4x4 view-projection matrix of the region.
+    :param width: region width in pixels.
+    :param height: region height in pixels.
+    """
+    perspective_matrix = np.asarray(perspective_matrix, dtype=np.float64)
+    projected = corners @ perspective_matrix[:, :3].T + perspective_matrix[:, 3]
+    w = projected[..., 3]
+    in_front = w > 0.0
+    safe_w = np.where(in_front, w, 1.0)
+    half_size = np.array((width / 2.0, height / 2.0))
+    region_coords = half_size + half_size * (projected[..., :2] / safe_w[..., np.newaxis])
+    return region_coords, in_front
+
+
+def visible_to_camera_mask(corners: np.ndarray, perspective_matrix: np.ndarray,
+                           width: float, height: float, margin: float = 0.0) -> np.ndarray:
+    """Returns a boolean mask of boxes whose projected corners are not all on one side outside the region.
+
+    Boxes with every corner behind the view are not visible.
+
+    :param corners: array of bounding box corners, shape (N, 8, 3).
+    :param perspective_matrix: 4x4 view-projection matrix of the region.
+    :param width: region width in pixels.
+    :param height: region height in pixels.
+    :param margin: pixels added around the region, or removed from it if negative.
+    """
+    region_coords, in_front = project_corners(corners, perspective_matrix, width, height)
+    behind = ~in_front
+    xs, ys = region_coords[..., 0], region_coords[..., 1]
+
+    outside = (np.all((xs < -margin) | behind, axis=1)
+               | np.all((ys < -margin) | behind, axis=1)
+               | np.all((xs > width + margin) | behind, axis=1)
+               | np.all((ys > height + margin) | behind, axis=1))
+    return np.any(in_front, axis=1) & ~outside
+
+
+def screen_radii(corners: np.ndarray, perspective_matrix: np.ndarray, width: float, height: float) -> np.ndarray:
+    """Returns the radius in pixels of each box's bounding sphere, projected into the region.
+
+    Uses the same projection as ``project_corners``. Spheres reaching the view plane are infinitely large.
+
+    :param corners: array of bounding box corners, shape (N, 8, 3).
+    :param perspective_matrix: 4x4 view-projection matrix of the region.
+    :param width: region width in pixels.
+    :param height: region height in pixels.
+    """
+    perspective_matrix = np.asarray(perspective_matrix, dtype=np.float64)
+    box_min, box_max = corners.min(axis=1), corners.max(axis=1)
+    centers = (box_min + box_max) / 2.0
+    radii = np.linalg.norm(box_max - box_min, axis=1) / 2.0
+
+    # rows of the view-projection matrix scale world lengths to clip space along each screen axis
+    pixel_scale = max(np.linalg.norm(perspective_matrix[0, :3]) * width / 2.0,
+                      np.linalg.norm(perspective_matrix[1, :3]) * height / 2.0)
+    w = centers @ perspective_matrix[3, :3] + perspective_matrix[3, 3]
+    w_scale = np.linalg.norm(perspective_matrix[3, :3])
+    with np.errstate(divide='ignore'):
+        return np.where(w - radii * w_scale > 0.0, radii * pixel_scale / w, np.inf)
+
+
+def visibility_mask(camera_location: Sequence[float], corners: np.ndarray, max_dist: float,
+                    perspective_matrix: np.ndarray, width: float, height: float, margin: float = 0.0) -> np.ndarray:
+    """Returns a boolean mask of boxes both close to the camera and visible in the region.
+
+    Only boxes within the maximum distance are projected.
+
+    :param camera_location: camera's world location.
+    :param corners: array of bounding box corners, shape (N, 8, 3).
+    :param max_dist: maximum allowed distance between points and camera.
+    :param perspective_matrix: 4x4 view-projection matrix of the region.
+    :param width: region width in pixels.
+    :param height: region height in pixels.
+    :param margin: pixels added around the region, or removed from it if negative.
+    """
+    mask = close_to_camera_mask(camera_location, corners, max_dist)
+    close_indices = np.flatnonzero(mask)
+    mask[close_indices] = visible_to_camera_mask(corners[close_indices], perspective_matrix, width, height, margin)
+    return mask
@@ -0,0 +1,153 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy as np
+
+depth_buffer_width = 128
+"""Width in pixels of the occlusion depth buffer. Its height follows the region's aspect ratio."""
+min_occluder_area = 0.005
+"""Minimum fraction of the view an object's projected box must cover to be used as an occluder."""
+near_w = 1e-6
+"""Boxes with a corner this close to or behind the view plane neither occlude nor get occluded."""
+
+
+def convex_hull(points: np.ndarray) -> np.ndarray:
+    """Returns the convex hull of 2D points in counter-clockwise order.
+
+    :param points: array of 2D points, shape (N, 2).
+    """
+    pts = sorted(map(tuple, points.tolist()))
+    if len(pts) <= 2:
+        return np.array(pts)
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for p in pts:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    for p in reversed(pts):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return np.array(lower[:-1] + upper[:-1])
+
+
+def rasterize_hull(depth_buffer: np.ndarray, hull: np.ndarray, depth: float):
+    """Writes a depth into every pixel lying entirely inside a convex polygon, keeping the nearest depth.
+
+    Pixels only partially covered are left untouched, so the polygon's coverage is never overestimated.
+
+    :param depth_buffer: depth buffer of shape (height, width), updated in place.
+    :param hull: counter-clockwise polygon in pixel coordinates, shape (N, 2).
+    :param depth: depth written to covered pixels.
+    """
+    if len(hull) < 3:
+        return
+    height, width = depth_buffer.shape
+    x0, y0 = np.maximum(np.ceil(hull.min(axis=0)).astype(int), 0)
+    x1, y1 = np.minimum(np.floor(hull.max(axis=0)).astype(int), (width, height))
+    if x1 <= x0 or y1 <= y0:
+        return
+
+    # pixel corners of the polygon's bounding rectangle, and whether each is inside every edge
+    xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+    edge_starts, edge_ends = hull, np.roll(hull, -1, axis=0)
+    edge_dirs = edge_ends - edge_starts
+    inside = np.ones(xs.shape, dtype=bool)
+    for (ax, ay), (dx, dy) in zip(edge_starts, edge_dirs):
+        inside &= dx * (ys - ay) - dy * (xs - ax) >= 0.0
+
+    covered = inside[:-1, :-1] & inside[1:, :-1] & inside[:-1, 1:] & inside[1:, 1:]
+    region = depth_buffer[y0:y1, x0:x1]
+    region[covered] = np.minimum(region[covered], depth)
+
+
+def depth_pyramid(depth_buffer: np.ndarray) -> list[np.ndarray]:
+    """Returns successively halved copies of the depth buffer, each texel keeping the farthest depth below it.
+
+    :param depth_buffer: depth buffer of shape (height, width).
+    """
+    levels = [depth_buffer]
+    while levels[-1].shape != (1, 1):
+        level = levels[-1]
+        height, width = level.shape
+        padded = np.pad(level, ((0, height % 2), (0, width % 2)), constant_values=np.inf)
+        levels.append(padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).max(axis=(1, 3)))
+    return levels
+
+
+def occlusion_mask(corners: np.ndarray, perspective_matrix: np.ndarray, aspect: float,
+                   occluder_count: int) -> np.ndarray:
+    """Returns a boolean mask of boxes hidden behind the boxes of the largest objects on screen.
+
+    The largest projected boxes are treated as solid and rasterized into a low-resolution depth buffer,
+    each at its farthest depth over only the pixels it fully covers.
+    Every box is then tested against the buffer's depth pyramid, at the level where its projected
+    rectangle spans at most 2x2 texels, and is occluded if its nearest depth is behind all of them.
+
+    :param corners: array of bounding box corners, shape (N, 8, 3).
+    :param perspective_matrix: 4x4 view-projection matrix of the region.
+    :param aspect: region width divided by height.
+    :param occluder_count: maximum number of boxes rasterized as occluders.
+    """
+    occluded = np.zeros(len(corners), dtype=bool)
+    if len(corners) == 0 or occluder_count <= 0:
+        return occluded
+
+    perspective_matrix = np.asarray(perspective_matrix, dtype=np.float64)
+    projected = corners @ perspective_matrix[:, :3].T + perspective_matrix[:, 3]
+    w = projected[..., 3]
+    testable = np.flatnonzero(np.all(w > near_w, axis=1))
+    if len(testable) == 0:
+        return occluded
+
+    ndc = projected[testable, :, :3] / w[testable, :, np.newaxis]
+    width = depth_buffer_width
+    height = max(1, int(round(width / aspect)))
+    pixels = (ndc[..., :2] + 1.0) / 2.0 * (width, height)
+    depths = ndc[..., 2]
+    rect_min, rect_max = pixels.min(axis=1), pixels.max(axis=1)
+
+    clipped_size = np.clip(rect_max, 0, (width, height)) - np.clip(rect_min, 0, (width, height))
+    areas = clipped_size.prod(axis=1)
+    occluders = np.flatnonzero(areas >= min_occluder_area * width * height)
+    if len(occluders) == 0:
+        return occluded
+    if len(occluders) > occluder_count:
+        occluders = occluders[np.argpartition(-areas[occluders], occluder_count - 1)[:occluder_count]]
+
+    depth_buffer = np.full((height, width), np.inf)
+    for idx in occluders:
+        rasterize_hull(depth_buffer, convex_hull(pixels[idx]), depths[idx].max())
+    levels = depth_pyramid(depth_buffer)
+
+    x0, y0 = np.clip(np.floor(rect_min), 0, (width - 1, height - 1)).astype(int).T
+    x1, y1 = np.clip(np.floor(rect_max), 0, (width - 1, height - 1)).astype(int).T
+    span = np.maximum(x1 - x0, y1 - y0)
+    box_levels = np.minimum(np.ceil(np.log2(span + 1)).astype(int), len(levels) - 1)
+
+    farthest = np.empty(len(testable))
+    for level_idx in np.unique(box_levels):
+        in_level = box_levels == level_idx
+        level = levels[level_idx]
+        lx0, lx1 = x0[in_level] >> level_idx, x1[in_level] >> level_idx
+        ly0, ly1 = y0[in_level] >> level_idx, y1[in_level] >> level_idx
+        farthest[in_level] = np.maximum.reduce([level[ly0, lx0], level[ly0, lx1], level[ly1, lx0], level[ly1, lx1]])
+
+    occluded[testable] = depths.min(axis=1) > farthest
+    return occluded
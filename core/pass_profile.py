@@ -0,0 +1,91 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import csv
+import json
+import time
+from collections import deque
+
+pass_stages = ('cull', 'occlusion', 'sort', 'budget', 'apply')
+"""Stages of a visibility pass, in the order they run."""
+
+profile_history = deque(maxlen=256)
+"""Ring buffer of the most recent recorded visibility passes."""
+
+
+class PassProfile:
+    """Wall time of each stage of one visibility pass, and how many objects it touched."""
+
+    def __init__(self):
+        self.timestamp = time.time()
+        self.start_time = self.mark_time = time.perf_counter()
+        self.stage_times = dict.fromkeys(pass_stages, 0.0)
+        """Wall time in seconds of each stage."""
+        self.total_time = 0.0
+        self.tested = 0
+        """Number of bounding boxes tested individually against the view."""
+        self.candidates = 0
+        """Number of objects close enough to and visible from the viewport camera."""
+        self.occluded = 0
+        """Number of candidates hidden behind occluders."""
+        self.revealed = 0
+        self.hidden = 0
+
+    def mark(self, stage: str):
+        """Records the time since the previous stage ended as the given stage's time.
+
+        :param stage: name of the stage that just ended, one of ``pass_stages``
+        """
+        now = time.perf_counter()
+        self.stage_times[stage] += now - self.mark_time
+        self.mark_time = now
+
+    def finish(self):
+        """Records the total pass time and adds the profile to the history."""
+        self.total_time = time.perf_counter() - self.start_time
+        profile_history.append(self)
+
+    def as_dict(self) -> dict:
+        """Returns the profile as a flat dictionary, with times in milliseconds."""
+        row = {'timestamp': self.timestamp, 'total_ms': self.total_time * 1000.0}
+        row.update({stage + '_ms': stage_time * 1000.0 for stage, stage_time in self.stage_times.items()})
+        row.update({'tested': self.tested, 'candidates': self.candidates, 'occluded': self.occluded,
+                    'revealed': self.revealed, 'hidden': self.hidden})
+        return row
+
+    def summary_lines(self) -> list[str]:
+        """Returns a short human-readable description of the profile."""
+        return [
+            'Pass: {:.2f} ms'.format(self.total_time * 1000.0),
+            ' '.join('{} {:.2f}'.format(stage, self.stage_times[stage] * 1000.0) for stage in pass_stages),
+            'Tested {}, candidates {}, occluded {}'.format(self.tested, self.candidates, self.occluded),
+            'Revealed {}, hidden {}'.format(self.revealed, self.hidden),
+        ]
+
+
+def export_profiles(filepath: str):
+    """Writes all recorded visibility passes to a JSON file, or a CSV file if the path ends with ``.csv``.
+
+    :param filepath: path of the file to write
+    """
+    rows = [profile.as_dict() for profile in profile_history]
+    with open(filepath, 'w', newline='') as f:
+        if filepath.lower().endswith('.csv'):
+            fieldnames = rows[0].keys() if rows else PassProfile().as_dict().keys()
+            writer = csv.DictWriter(f, fieldnames=list(fieldnames))
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, f, indent=1)
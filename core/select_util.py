@@ -0,0 +1,390 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import functools
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .BoundBoxBVH import BoundBoxBVH
+from .cull_util import screen_radii, visibility_mask
+from .occlusion_util import occlusion_mask
+from .pass_profile import PassProfile
+
+sort_orders = ('distance', 'ascending', 'descending', 'screen_size', 'value')
+"""Ways to prioritize objects within the budget.
+
+``distance`` shows the closest objects first. Following the budget panel's labels,
+``ascending`` shows the highest costs first and ``descending`` the lowest, each tied by distance.
+``screen_size`` shows the objects covering the most of the view first.
+``value`` shows the objects covering the most of the view per unit of cost first,
+skipping objects that do not fit in the remaining budget instead of stopping at them."""
+
+
+min_order_count = 256
+"""Fewest leading boxes ordered at once when only those within the budget are needed."""
+
+
+class Hysteresis(NamedTuple):
+    """Margins keeping objects in their current state near the culling and budget boundaries,
+    so they do not flip between hidden and visible on every small view change."""
+    shown: np.ndarray
+    """Visibility last applied to each box."""
+    held: Optional[np.ndarray] = None
+    """Mask of boxes that must stay visible, e.g. because they were revealed too recently."""
+    distance_enter: float = 0.0
+    """How much closer than the maximum distance a hidden box must be to be revealed."""
+    distance_exit: float = 0.0
+    """How much farther than the maximum distance a visible box must be to be hidden."""
+    frustum_enter: float = 0.0
+    """How many pixels inside the region a hidden box must reach to be revealed."""
+    frustum_exit: float = 0.0
+    """How many pixels outside the region a visible box must be to be hidden."""
+    budget_band: float = 0.0
+    """Fraction of the budget visible boxes may exceed it by before being hidden."""
+
+
+class Selection(NamedTuple):
+    """Indices of the boxes to show, each in priority order."""
+    shown: np.ndarray
+    """Boxes shown fully."""
+    degraded: np.ndarray
+    """Boxes that do not fit in the budget, shown with reduced detail instead of being hidden."""
+
+
+def cull_indices(corners: np.ndarray, camera_location: Sequence[float], max_dist: float,
+                 perspective_matrix: np.ndarray, width: float, height: float,
+                 bvh: Optional[BoundBoxBVH] = None, margin: float = 0.0,
+                 profile: Optional[PassProfile] = None) -> np.ndarray:
+    """Returns sorted indices of boxes close enough to and visible from the camera.
+
+    With a tree, whole subtrees are resolved at once, so only boxes in partially visible leaves are tested.
+
+    :param corners: array of bounding box corners, shape (N, 8, 3).
+    :param camera_location: camera's world location.
+    :param max_dist: maximum allowed distance between points and camera.
+    :param perspective_matrix: 4x4 view-projection matrix of the region.
+    :param width: region width in pixels.
+    :param height: region height in pixels.
+    :param bvh: tree built over ``corners``, every box is tested if not given.
+    :param margin: pixels added around the region, or removed from it if negative.
+    :param profile: if given, records the number of boxes tested individually.
+    """
+    perspective_matrix = np.asarray(perspective_matrix, dtype=np.float64)
+    if bvh is None:
+        if profile is not None:
+            profile.tested = len(corners)
+        return np.flatnonzero(visibility_mask(camera_location, corners, max_dist, perspective_matrix,
+                                              width, height, margin))
+
+    frustum_scale = (1.0 + 2.0 * margin / width, 1.0 + 2.0 * margin / height)
+    inside, partial, _outside = bvh.query(camera_location, max_dist, perspective_matrix, frustum_scale)
+    if profile is not None:
+        profile.tested = len(partial)
+    partial_mask = visibility_mask(camera_location, corners[partial], max_dist, perspective_matrix,
+                                   width, height, margin)
+    return np.sort(np.concatenate((inside, partial[partial_mask])))
+
+
+def hysteresis_cull_indices(corners: np.ndarray, camera_location: Sequence[float], max_dist: float,
+                            perspective_matrix: np.ndarray, width: float, height: float, hysteresis: Hysteresis,
+                            bvh: Optional[BoundBoxBVH] = None, profile: Optional[PassProfile] = None) -> np.ndarray:
+    """Returns sorted indices of boxes close enough to and visible from the camera,
+    testing visible boxes against the exit margins and hidden boxes against the enter margins.
+
+    :param corners: array of bounding box corners, shape (N, 8, 3).
+    :param camera_location: camera's world location.
+    :param max_dist: maximum allowed distance between points and camera.
+    :param perspective_matrix: 4x4 view-projection matrix of the region.
+    :param width: region width in pixels.
+    :param height: region height in pixels.
+    :param hysteresis: current visibility and margins.
+    :param bvh: tree built over ``corners``, every box is tested if not given.
+    :param profile: if given, records the number of boxes tested individually.
+    """
+    candidates = cull_indices(corners, camera_location, max_dist + hysteresis.distance_exit, perspective_matrix,
+                              width, height, bvh, hysteresis.frustum_exit, profile)
+    shown = hysteresis.shown[candidates]
+    entering = np.flatnonzero(~shown)
+    shown[entering] = visibility_mask(camera_location, corners[candidates[entering]],
+                                      max(max_dist - hysteresis.distance_enter, 0.0), perspective_matrix,
+                                      width, height, -hysteresis.frustum_enter)
+    return candidates[shown]
+
+
+def box_distances(camera_location: Sequence[float], corners: np.ndarray,
+                  origins: Optional[np.ndarray] = None) -> np.ndarray:
+    """Returns the shortest distance between the camera and each box's corners, and origin if given.
+
+    :param camera_location: camera's world location, or locations of several cameras, shape (K, 3),
+        in which case the nearest camera is used.
+    :param corners: array of bounding box corners, shape (N, 8, 3).
+    :param origins: object origins, shape (N, 3).
+    """
+    points = corners if origins is None else np.concatenate((corners, origins[:, np.newaxis, :]), axis=1)
+    squared = np.full(len(points), np.inf)
+    for location in np.atleast_2d(np.asarray(camera_location, dtype=np.float64)):
+        offsets = points - location
+        squared = np.minimum(squared, np.einsum('ijk,ijk->ij', offsets, offsets).min(axis=1, initial=np.inf))
+    return np.sqrt(squared)
+
+
+def partial_lexsort(keys: Sequence[np.ndarray], count: Optional[int] = None) -> np.ndarray:
+    """Returns the leading indices of ``np.lexsort(keys)``, at least ``count`` of them unless there are fewer keys.
+
+    Only the entries whose primary (last) key is within the ``count`` smallest are sorted, including every tie
+    of the largest one, so the result is exactly the start of the full sort's order.
+
+    :param keys: sort keys, the last being the primary one, each of shape (N,).
+    :param count: minimum number of indices returned, or None to sort everything.
+    """
+    primary = keys[-1]
+    if count is None or count >= len(primary):
+        return np.lexsort(keys)
+    threshold = np.partition(primary, count - 1)[count - 1]
+    subset = np.flatnonzero(primary <= threshold)
+    return subset[np.lexsort([key[subset] for key in keys])]
+
+
+def priority_keys(camera_location: Sequence[float], corners: np.ndarray, costs: np.ndarray,
+                  origins: np.ndarray, sort_order: str,
+                  screen_sizes: Optional[np.ndarray] = None) -> tuple[np.ndarray, ...]:
+    """Returns the keys boxes are sorted by to be given budget, in ``np.lexsort`` order (primary key last).
+
+    Distances are computed for every box at once.
+
+    :param camera_location: camera's world location, or locations of several cameras, see ``box_distances``.
+    :param corners: array of bounding box corners, shape (N, 8, 3).
+    :param costs: budget cost of each box, shape (N,).
+    :param origins: object origins, shape (N, 3).
+    :param sort_order: one of ``sort_orders``.
+    :param screen_sizes: projected size of each box, required to sort by screen size or value, shape (N,).
+    """
+    if sort_order == 'screen_size':
+        return (-screen_sizes,)
+    if sort_order == 'value':
+        # coverage already falls off with the square of the distance, which only breaks ties
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value_per_cost = np.where(costs > 0.0, np.square(screen_sizes) / costs, np.inf)
+        return box_distances(camera_location, corners), -value_per_cost
+    if sort_order == 'distance':
+        return (box_distances(camera_location, corners, origins),)
+    if sort_order not in sort_orders:
+        raise ValueError('Unknown sort order: {}'.format(sort_order))
+
+    cost_keys = -costs if sort_order == 'ascending' else costs
+    return box_distances(camera_location, corners), cost_keys
+
+
+def budget_split(costs: np.ndarray, budget_limit: float, shown: Optional[np.ndarray] = None,
+                 budget_band: float = 0.0) -> int:
+    """Returns how many of the leading costs fit within the budget, stopping at the first one that does not.
+
+    Visible boxes may exceed the budget by the dead band before being hidden,
+    while hidden boxes are only revealed within the budget itself.
+
+    :param costs: non-negative budget costs, in priority order.
+    :param budget_limit: maximum total cost.
+    :param shown: visibility last applied to each box, in the same order as ``costs``.
+    :param budget_band: fraction of the budget visible boxes may exceed it by.
+    """
+    cumulative_costs = np.cumsum(costs)
+    if shown is None or budget_band <= 0.0:
+        return int(np.searchsorted(cumulative_costs, budget_limit, side='right'))
+
+    over_budget = cumulative_costs > np.where(shown, budget_limit * (1.0 + budget_band), budget_limit)
+    return int(np.argmax(over_budget)) if over_budget.any() else len(costs)
+
+
+def knapsack_fill(costs: np.ndarray, budget_limit: float, shown: Optional[np.ndarray] = None,
+                  budget_band: float = 0.0) -> np.ndarray:
+    """Returns indices of the costs that fit within the budget, taken in order and skipping those that do not fit.
+
+    Visible boxes may exceed the budget by the dead band, as in ``budget_split``.
+
+    :param costs: non-negative budget costs, in priority order.
+    :param budget_limit: maximum total cost.
+    :param shown: visibility last applied to each box, in the same order as ``costs``.
+    :param budget_band: fraction of the budget visible boxes may exceed it by.
+    """
+    # everything before the first cost that does not fit is taken without a loop
+    prefix = budget_split(costs, budget_limit, shown, budget_band)
+    limits = np.full(len(costs), float(budget_limit))
+    if shown is not None and budget_band > 0.0:
+        limits[shown] = budget_limit * (1.0 + budget_band)
+
+    taken = list(range(prefix))
+    total = float(costs[:prefix].sum())
+    if prefix < len(costs):
+        min_remaining = np.minimum.accumulate(costs[::-1])[::-1]
+        max_limit = limits.max()
+        for idx in range(prefix + 1, len(costs)):
+            if total + min_remaining[idx] > max_limit:
+                break
+            if total + costs[idx] <= limits[idx]:
+                taken.append(idx)
+                total += costs[idx]
+    return np.array(taken, dtype=np.int64)
+
+
+def initial_order_count(costs: np.ndarray, budget_limit: float) -> int:
+    """Returns how many leading boxes to order first when only those within the budget are needed,
+    about twice as many as fit in the budget at the average cost.
+
+    :param costs: budget costs of the candidate boxes.
+    :param budget_limit: maximum total cost.
+    """
+    if len(costs) == 0:
+        return 0
+    mean_cost = float(costs.mean())
+    estimate = 2.0 * budget_limit / mean_cost if mean_cost > 0.0 else float(len(costs))
+    return int(min(max(estimate, min_order_count), len(costs)))
+
+
+def select_visible(corners: np.ndarray, costs: np.ndarray, origins: np.ndarray,
+                   camera_location: Sequence[float], max_dist: float,
+                   perspective_matrix: np.ndarray, width: float, height: float,
+                   budget_limit: float, sort_order: Optional[str] = None,
+                   bvh: Optional[BoundBoxBVH] = None, occluder_count: int = 0, min_screen_size: float = 0.0,
+                   hysteresis: Optional[Hysteresis] = None,
+                   extra_views: Sequence[tuple[Sequence[float], np.ndarray, float, float]] = (),
+                   degraded_costs: Optional[np.ndarray] = None,
+                   profile: Optional[PassProfile] = None) -> Selection:
+    """Returns indices of the boxes to show fully and with reduced detail.
+
+    Boxes are culled by distance, view and projected size, then optionally by occlusion,
+    sorted by priority, then shown until the budget runs out.
+    Boxes visible from any extra view, such as other 3D views or where a view is heading,
+    compete for the same budget. They take their largest size on screen and their distance to the nearest camera,
+    and are only occlusion culled if occluded in every view they are visible from.
+    If reduced costs are given, the remaining boxes are degraded at those costs with whatever budget is left.
+
+    :param corners: array of bounding box corners, shape (N, 8, 3).
+    :param costs: budget cost of each box, shape (N,).
+    :param origins: object origins, shape (N, 3).
+    :param camera_location: camera's world location.
+    :param max_dist: maximum allowed distance between points and camera.
+    :param perspective_matrix: 4x4 view-projection matrix of the region.
+    :param width: region width in pixels.
+    :param height: region height in pixels.
+    :param budget_limit: maximum total cost of shown boxes.
+    :param sort_order: one of ``sort_orders``, or None to keep the boxes' order.
+    :param bvh: tree built over ``corners``, every box is tested if not given.
+    :param occluder_count: maximum number of boxes used as occluders, or 0 to skip occlusion culling.
+    :param min_screen_size: minimum radius in pixels of a box's projected bounding sphere.
+    :param hysteresis: if given, margins keeping boxes in their current state, see ``Hysteresis``.
+        Held boxes are shown after the budgeted ones, even beyond the budget.
+    :param extra_views: tuples of (camera location, perspective matrix, width, height) of other views
+        boxes are culled against.
+    :param degraded_costs: budget cost of each box shown with reduced detail, shape (N,), or None to hide
+        boxes that do not fit.
+    :param profile: if given, records the time of each stage and the number of boxes tested.
+    """
+    views = [(camera_location, perspective_matrix, width, height), *extra_views]
+    view_candidates = []
+    tested = 0
+    for view_location, view_matrix, view_width, view_height in views:
+        if hysteresis is None:
+            view_candidates.append(cull_indices(corners, view_location, max_dist, view_matrix,
+                                                view_width, view_height, bvh, profile=profile))
+        else:
+            view_candidates.append(hysteresis_cull_indices(corners, view_location, max_dist, view_matrix,
+                                                           view_width, view_height, hysteresis, bvh, profile))
+        if profile is not None:
+            tested += profile.tested
+    candidates = functools.reduce(np.union1d, view_candidates)
+    # which views each candidate is visible from
+    in_views = np.ones((1, len(candidates)), dtype=bool)
+    if extra_views:
+        in_views = np.stack([np.isin(candidates, view_cands) for view_cands in view_candidates])
+
+    screen_sizes = None
+    if min_screen_size > 0.0 or sort_order in {'screen_size', 'value'}:
+        screen_sizes = np.zeros(len(candidates))
+        for (_view_location, view_matrix, view_width, view_height), in_view in zip(views, in_views):
+            screen_sizes[in_view] = np.maximum(screen_sizes[in_view], screen_radii(
+                corners[candidates[in_view]], view_matrix, view_width, view_height))
+        if min_screen_size > 0.0:
+            large_enough = screen_sizes >= min_screen_size
+            candidates, screen_sizes = candidates[large_enough], screen_sizes[large_enough]
+            in_views = in_views[:, large_enough]
+    if profile is not None:
+        profile.tested = tested
+        profile.candidates = len(candidates)
+        profile.mark('cull')
+
+    if occluder_count > 0:
+        occluded = np.ones(len(candidates), dtype=bool)
+        for (_view_location, view_matrix, view_width, view_height), in_view in zip(views, in_views):
+            occluded[in_view] &= occlusion_mask(corners[candidates[in_view]], view_matrix,
+                                                view_width / view_height, occluder_count)
+        candidates = candidates[~occluded]
+        if screen_sizes is not None:
+            screen_sizes = screen_sizes[~occluded]
+        if profile is not None:
+            profile.occluded = int(np.count_nonzero(occluded))
+    if profile is not None:
+        profile.mark('occlusion')
+
+    budget_band = 0.0 if hysteresis is None else hysteresis.budget_band
+    if sort_order is None:
+        shown = None if hysteresis is None else hysteresis.shown[candidates]
+        selected = candidates[:budget_split(costs[candidates], budget_limit, shown, budget_band)]
+        if profile is not None:
+            profile.mark('sort')
+    else:
+        camera_locations = np.array([view[0] for view in views], dtype=np.float64)
+        # degraded boxes are picked from everything left over, which needs the full order
+        count = None if degraded_costs is not None else initial_order_count(costs[candidates], budget_limit)
+        keys = priority_keys(camera_locations, corners[candidates], costs[candidates], origins[candidates],
+                             sort_order, screen_sizes)
+        while True:
+            order = partial_lexsort(keys, count)
+            ordered = candidates[order]
+            shown = None if hysteresis is None else hysteresis.shown[ordered]
+            if sort_order == 'value':
+                selected = ordered[knapsack_fill(costs[ordered], budget_limit, shown, budget_band)]
+                is_complete = len(ordered) == len(candidates)
+                if not is_complete:
+                    # boxes left unordered would all be skipped if not even the cheapest of them fits
+                    unordered = np.ones(len(candidates), dtype=bool)
+                    unordered[order] = False
+                    max_limit = budget_limit * (1.0 + budget_band) if shown is not None else budget_limit
+                    is_complete = costs[selected].sum() + costs[candidates[unordered]].min() > max_limit
+            else:
+                split = budget_split(costs[ordered], budget_limit, shown, budget_band)
+                selected = ordered[:split]
+                is_complete = len(ordered) == len(candidates) or split < len(ordered)
+            if is_complete:
+                break
+            count = 4 * len(ordered)
+        candidates = ordered
+        if profile is not None:
+            profile.mark('sort')
+    if hysteresis is not None and hysteresis.held is not None:
+        held = np.flatnonzero(hysteresis.held)
+        selected = np.concatenate((selected, held[~np.isin(held, selected)]))
+
+    degraded = np.zeros(0, dtype=np.int64)
+    if degraded_costs is not None:
+        remaining = candidates[~np.isin(candidates, selected)]
+        remaining_budget = max(budget_limit - float(costs[selected].sum()), 0.0)
+        if sort_order == 'value':
+            degraded = remaining[knapsack_fill(degraded_costs[remaining], remaining_budget)]
+        else:
+            degraded = remaining[:budget_split(degraded_costs[remaining], remaining_budget)]
+    if profile is not None:
+        profile.mark('budget')
+    return Selection(selected, degraded)
@@ -13,13 +13,19 @@
 #     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from typing import Iterable
+from typing import Iterable, Optional
 
+import blf
 import bpy
-from mathutils import Vector
+import functools
 import time
-import bpy_extras
+import numpy as np
 from .budget import budget_factory
+from .core.select_util import Hysteresis, select_visible
+from .obj_config import display_types, heavy_modifier_types, over_budget_actions
+from .core.ViewMotion import ViewMotion
+from .core.pass_profile import PassProfile, profile_history
+from .SceneCache import SceneCache
 
 
 def vert_count(obj: bpy.types.Object, collection_vert_count_cache: dict) -> int:
@@ -39,156 +45,337 @@ def vert_count(obj: bpy.types.Object, collection_vert_count_cache: dict) -> int:
     return 0
 
 
-def close_to_camera(camera_location: Vector, locs: list[Vector], max_dist: float) -> bool:
-    """Checks if any of points are close enough to the camera.
+def apply_group_visibility(scene_cache: SceneCache, visible: np.ndarray):
+    """Hides collections whose objects should all be hidden as a whole, and reveals hidden collections
+    with any object that should be visible, leaving their objects to be revealed or hidden one by one.
 
-    :param camera_location: camera's world location.
-    :param locs: list of points representing the object's bounding box.
-    :param max_dist: maximum allowed distance between points and camera.
+    :param scene_cache: cache of viable objects and their collections, updated in place.
+    :param visible: desired visibility of each viable object.
     """
-    return any((loc - camera_location).length < max_dist for loc in locs)
+    groups = scene_cache.groups
+    any_visible = groups.any_visible(visible)
+    for group_idx in np.flatnonzero(any_visible == groups.hidden):
+        layer_coll, members = groups.layer_colls[group_idx], groups.group_members(group_idx)
+        hide = not any_visible[group_idx]
+        try:
+            if hide and len(layer_coll.collection.objects) != len(members):
+                continue  # objects were linked or unlinked since, so the collection no longer matches the group
+            layer_coll.hide_viewport = hide
+        except Exception as e:
+            print('Could not {} collection: {}'.format('hide' if hide else 'unhide', e))
+            continue
+        groups.hidden[group_idx] = hide
+        scene_cache.toggled.update(scene_cache.viable_objs[idx].as_pointer() for idx in members)
 
 
-def dist_to_camera(camera_location: Vector, locs: list[Vector]) -> float:
-    """Returns shortest distance between a list of points and a camera.
+def apply_visibility(scene_cache: SceneCache, visible: np.ndarray, use_groups: bool = False) -> tuple[int, int]:
+    """Reveals or hides only the objects whose visibility differs from the state last applied.
 
-    :param camera_location: camera's world location.
-    :param locs: list of points representing the object's bounding box.
+    Returns a tuple of (revealed, hidden) object counts.
+
+    :param scene_cache: cache of viable objects and the visibility last applied to them, updated in place.
+    :param visible: desired visibility of each viable object.
+    :param use_groups: whether to hide collections whose objects should all be hidden as a whole.
     """
-    return min((loc - camera_location).length for loc in locs)
+    now = time.time()
+    scene_cache.visibility_version += 1
+    if use_groups:
+        apply_group_visibility(scene_cache, visible)
+    elif scene_cache.groups.hidden.any():
+        scene_cache.release_groups()
+
+    hide_flags = scene_cache.hide_flags
+    free = scene_cache.groups.free_mask()
+    for idx in np.flatnonzero(free & (hide_flags == visible)):
+        o = scene_cache.viable_objs[idx]
+        try:
+            o.hide_set(not visible[idx])
+        except Exception as e:
+            print('Could not {} {}: {}'.format('unhide' if visible[idx] else 'hide', o.name, e))
+        else:
+            hide_flags[idx] = not visible[idx]
+            scene_cache.toggled.add(o.as_pointer())
 
+    shown = scene_cache.shown
+    applied = free & ~hide_flags
+    revealed, hidden = applied & ~shown, shown & ~applied
+    scene_cache.revealed_times[revealed] = now
+    shown[:] = applied
+    return int(np.count_nonzero(revealed)), int(np.count_nonzero(hidden))
 
-def is_visible_to_camera(context: bpy.types.Context, location_coords: list[Vector]) -> bool:
-    """Determines if the 3D coordinates are visible from the viewport camera.
 
-    :param context: Blender context.
-    :param location_coords: list of 3D points in world space.
-    """
-    region_3d = context.space_data.region_3d
-    region = context.region
-    region_relative_locs = [bpy_extras.view3d_utils.location_3d_to_region_2d(region, region_3d, location_coord)
-                            for location_coord in location_coords]
+def degrade_display(obj: bpy.types.Object, action: str) -> tuple[str, dict[str, bool]]:
+    """Reduces how much detail an object is displayed with in the viewport,
+    and returns a tuple of (display type, modifier viewport visibility by name) to restore it with.
 
-    region_xs = [loc[0]
-                 for loc in region_relative_locs
-                 if loc is not None]
-    region_ys = [loc[1]
-                 for loc in region_relative_locs
-                 if loc is not None]
+    The display type is never raised, e.g. objects already displayed as bounds are not switched to wireframe.
 
-    # empty lists, ie all are invisible or behind camera
-    if len(region_xs) == 0 or len(region_ys) == 0:
-        return False
+    :param obj: object to degrade
+    :param action: one of ``obj_config.over_budget_actions`` besides ``HIDE``
+    """
+    original = (obj.display_type, {})
+    if action == 'MODIFIERS':
+        for mod in obj.modifiers:
+            if mod.type in heavy_modifier_types and mod.show_viewport:
+                original[1][mod.name] = True
+                mod.show_viewport = False
+    elif display_types.index(action) < display_types.index(obj.display_type):
+        obj.display_type = action
+    return original
+
+
+def restore_display(obj: bpy.types.Object, original: tuple[str, dict[str, bool]]):
+    """Restores the display settings an object had before being degraded.
+
+    :param obj: degraded object
+    :param original: tuple returned by ``degrade_display``
+    """
+    display_type, modifiers = original
+    if obj.display_type != display_type:
+        obj.display_type = display_type
+    for name, show_viewport in modifiers.items():
+        mod = obj.modifiers.get(name)
+        if mod is not None:
+            mod.show_viewport = show_viewport
+
+
+def apply_degradation(scene_cache: SceneCache, degraded: np.ndarray, visible: np.ndarray) -> int:
+    """Degrades or restores only the visible objects whose detail differs from the state last applied,
+    and returns how many changed. Hidden objects keep their state until revealed or until ``restore_degraded``.
+
+    :param scene_cache: cache of viable objects and the detail last applied to them, updated in place.
+    :param degraded: whether each viable object should be shown with reduced detail.
+    :param visible: visibility of each viable object.
+    """
+    action_idx = over_budget_actions.index(scene_cache.degrade_action)
+    target = np.where(degraded, action_idx, 0).astype(np.int8)
+    changed = np.flatnonzero(visible & (scene_cache.degraded != target))
+    applied = 0
+    for idx in changed:
+        o = scene_cache.viable_objs[idx]
+        pointer = o.as_pointer()
+        try:
+            if pointer in scene_cache.display_originals:
+                restore_display(o, scene_cache.display_originals.pop(pointer)[1])
+            if target[idx]:
+                scene_cache.display_originals[pointer] = (o, degrade_display(o, scene_cache.degrade_action))
+        except Exception as e:
+            print('Could not {} {}: {}'.format('degrade' if target[idx] else 'restore', o.name, e))
+        else:
+            scene_cache.degraded[idx] = target[idx]
+            scene_cache.toggled.add(pointer)
+            applied += 1
+    return applied
 
-    if all(x < 0 for x in region_xs) or all(y < 0 for y in region_ys):
-        return False
-    if all(x > region.width for x in region_xs) or all(y > region.height for y in region_ys):
-        return False
-    return True
 
+def restore_degraded(scene_cache: SceneCache):
+    """Restores the original display settings of every object degraded so far, including removed ones.
 
-def filter_viable_objs(context: bpy.types.Context, viewport_location: Vector, max_distance: float,
-                       viable_objs: set[bpy.types.Object], bb_cache: dict) -> Iterable[bpy.types.Object]:
+    :param scene_cache: cache of viable objects and the detail last applied to them, updated in place.
     """
+    for o, original in scene_cache.display_originals.values():
+        try:
+            restore_display(o, original)
+        except ReferenceError:
+            pass
+        except Exception as e:
+            print('Could not restore {}: {}'.format(o.name, e))
+    scene_cache.display_originals = {}
+    scene_cache.degraded[:] = 0
 
-    :param context: Blender context.
-    :param viewport_location: 3D location of the viewport's camera.
-    :param max_distance: maximum allowed distance between points and camera.
-    :param viable_objs: list of objects to be filtered.
-    :param bb_cache: cache of object names to their bounding boxes.
-    """
-    for o in viable_objs:
-        bb_locs = bb_cache.get(o.name_full)
-        if close_to_camera(viewport_location, bb_locs, max_distance) and is_visible_to_camera(context, bb_locs):
-            yield o
-        elif not o.hide_get():
-            try:
-                o.hide_set(True)
-            except Exception as e:
-                print('Could not hide {}: {}'.format(o.name, e))
 
+def view_regions(context: bpy.types.Context, all_views: bool) -> list[tuple[bpy.types.Region, bpy.types.RegionView3D]]:
+    """Returns the 3D view regions objects are culled against, as (region, region data) tuples.
 
-def parse_optimal_objs(context, viable_objects, budget_cache: dict) -> int:
-    """Returns index of ``viable_objects`` where viable objects beyond budget.
+    The operator's region comes first, followed by the regions of every other 3D view in every window,
+    including each region of a quad view.
 
     :param context: Blender context
-    :param viable_objects: list of objects to be parsed.
-    :param budget_cache: cache of object names to their budget costs.
-    """
-    my_budget = budget_factory(context)().budget_limit(context)
-    curr_count = 0
-    for idx, o in enumerate(viable_objects):
-        o_cost = budget_cache.get(o.name_full, 0)
-        above_budget = (curr_count + o_cost) > my_budget
-        if above_budget:
-            return idx
-
-        if o.hide_get():
-            try:
-                o.hide_set(False)
-            except Exception as e:
-                print('Could not unhide {}: {}'.format(o.name, e))
-        curr_count += o_cost
-    return len(viable_objects)
-
-
-def viewport_handler(context, viable_objs, budget_cache: dict, bb_cache: dict):
-    """Blender viewport handler to filter and hide objects.
+    :param all_views: whether to include other 3D views, or only the operator's region
+    """
+    regions = [(context.region, context.region_data)]
+    if not all_views:
+        return regions
+    main_pointer = context.region_data.as_pointer()
+    for window in context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type != 'VIEW_3D':
+                continue
+            for region in area.regions:
+                if (region.type == 'WINDOW' and region.data is not None and region.width > 1 and region.height > 1
+                        and region.data.as_pointer() != main_pointer):
+                    regions.append((region, region.data))
+    return regions
+
+
+def region_view(region: bpy.types.Region, region_3d: bpy.types.RegionView3D,
+                view_matrix: Optional[np.ndarray] = None) -> tuple[np.ndarray, np.ndarray, int, int]:
+    """Returns a tuple of (camera location, perspective matrix, width, height) of a 3D view region.
+
+    :param region: 3D view region
+    :param region_3d: 3D view data of the region
+    :param view_matrix: world-to-view matrix to use instead of the region's, e.g. a predicted one
+    """
+    if view_matrix is None:
+        view_matrix = np.array(region_3d.view_matrix)
+    return (np.linalg.inv(view_matrix)[:3, 3], np.array(region_3d.window_matrix) @ view_matrix,
+            region.width, region.height)
+
+
+def camera_view(depsgraph: bpy.types.Depsgraph, camera: bpy.types.Object) -> tuple[np.ndarray, np.ndarray, int, int]:
+    """Returns a tuple of (camera location, perspective matrix, width, height) of a camera object,
+    at the scene's render resolution.
+
+    :param depsgraph: dependency graph of the scene being rendered or played back
+    :param camera: camera object
+    """
+    render = depsgraph.scene.render
+    scale = render.resolution_percentage / 100.0
+    width, height = max(int(render.resolution_x * scale), 1), max(int(render.resolution_y * scale), 1)
+    projection = camera.calc_matrix_camera(depsgraph, x=width, y=height,
+                                           scale_x=render.pixel_aspect_x, scale_y=render.pixel_aspect_y)
+    camera_matrix = np.array(camera.matrix_world)
+    return camera_matrix[:3, 3], np.array(projection) @ np.linalg.inv(camera_matrix), width, height
+
+
+def predicted_views(context: bpy.types.Context, regions: list[tuple[bpy.types.Region, bpy.types.RegionView3D]],
+                    view_motions: dict[int, ViewMotion], now: float) -> list[tuple[np.ndarray, np.ndarray, int, int]]:
+    """Returns the views expected after the prediction time for regions that keep moving as they did,
+    as a list of tuples returned by ``region_view``, empty if prediction is off or every view is still.
 
     :param context: Blender context
-    :param viable_objs: list of objects that can be potentially revealed or hidden in the viewport.
-    :param budget_cache: cache of object names to their budget costs.
-    :param bb_cache: cache of object names to their bounding boxes.
+    :param regions: 3D view regions, see ``view_regions``
+    :param view_motions: recent view matrices of each region, keyed by region data pointer
+    :param now: current time in seconds
     """
     wm = context.window_manager
+    if not wm.nl_use_prediction:
+        return []
+    views = []
+    for region, region_3d in regions:
+        view_motion = view_motions.get(region_3d.as_pointer())
+        if view_motion is not None and view_motion.is_moving(now):
+            view_matrix = view_motion.predict(np.array(region_3d.view_matrix), wm.nl_prediction_time, now)
+            views.append(region_view(region, region_3d, view_matrix))
+    return views
+
+
+def budget_sort_order(wm: bpy.types.WindowManager) -> Optional[str]:
+    """Returns the order objects are given budget in, one of ``select_util.sort_orders``,
+    or None if budgeting is off.
+
+    :param wm: window manager holding the add-on's settings
+    """
+    if not wm.nl_use_budget:
+        return None
+    if wm.nl_sort_by_screen_size:
+        return 'screen_size'
+    return 'distance' if wm.nl_budget_option == 'objects' else wm.nl_budget_sort_order
 
-    viewport_location = context.region_data.view_matrix.to_translation()
-
-    max_distance = wm.nl_max_distance
 
-    filtered_objs = list(filter_viable_objs(context, viewport_location, max_distance, viable_objs, bb_cache))
-    if wm.nl_use_budget:
-        if wm.nl_budget_option != 'objects':
-            budget_sort_reverse = -1 if wm.nl_budget_sort_order == 'ascending' else 1
-            filtered_objs.sort(key=lambda obj: (
-                budget_sort_reverse * budget_cache.get(obj.name_full, 0),
-                dist_to_camera(viewport_location, bb_cache.get(obj.name_full, []))
-            ))
-        else:
-            filtered_objs.sort(key=lambda obj: dist_to_camera(viewport_location, bb_cache.get(obj.name_full, []) + [obj.matrix_world.to_translation()]))
+def hysteresis_settings(wm: bpy.types.WindowManager, shown: np.ndarray, revealed_times: np.ndarray,
+                        now: float) -> Optional[Hysteresis]:
+    """Returns the margins keeping objects in their current state, or None if stabilizing is off.
 
-    split_index = parse_optimal_objs(context, filtered_objs, budget_cache)
+    :param wm: window manager holding the add-on's settings
+    :param shown: visibility last applied to each object
+    :param revealed_times: time in seconds each object was last revealed
+    :param now: current time in seconds
+    """
+    if not wm.nl_use_hysteresis:
+        return None
+    held = None
+    if wm.nl_min_visible_time > 0.0:
+        held = shown & (now - revealed_times < wm.nl_min_visible_time)
+    return Hysteresis(shown, held, wm.nl_distance_enter_margin, wm.nl_distance_exit_margin,
+                      wm.nl_frustum_enter_margin, wm.nl_frustum_exit_margin, wm.nl_budget_dead_band)
 
-    objs_to_reveal = (o for o in filtered_objs[:split_index] if o.hide_get())
 
-    for o in objs_to_reveal:
-        try:
-            o.hide_set(False)
-        except Exception as e:
-            print('Could not unhide {}: {}'.format(o.name, e))
+def viewport_handler(context, scene_cache: SceneCache, profile: Optional[PassProfile] = None,
+                     view_motions: Optional[dict[int, ViewMotion]] = None):
+    """Blender viewport handler to filter and hide objects.
 
-    if split_index >= len(filtered_objs):
-        return
+    Objects are culled against every open 3D view if enabled, sharing one budget, or only the operator's otherwise.
 
-    objs_to_hide = (o for o in filtered_objs[split_index:] if not o.hide_get())
+    :param context: Blender context
+    :param scene_cache: cache of objects that can be potentially revealed or hidden in the viewport,
+        with their budget costs and bounding boxes.
+    :param profile: if given, records the time of each stage and the number of objects tested, revealed and hidden.
+    :param view_motions: recent view matrices of each region keyed by region data pointer,
+        to also reveal objects the views are moving towards.
+    """
+    wm = context.window_manager
+    regions = view_regions(context, wm.nl_use_all_views)
+    main_view, *other_views = [region_view(region, region_3d) for region, region_3d in regions]
+
+    sort_order = budget_sort_order(wm)
+    budget_limit = budget_factory(context)().budget_limit(context)
+    scene_cache.set_degrade_action(context, wm.nl_over_budget_action)
+    degraded_costs = None if wm.nl_over_budget_action == 'HIDE' else scene_cache.degraded_costs
+
+    now = time.time()
+    hysteresis = hysteresis_settings(wm, scene_cache.shown, scene_cache.revealed_times, now)
+
+    camera_location, perspective_matrix, width, height = main_view
+    extra_views = other_views + predicted_views(context, regions, view_motions or {}, now)
+    selection = select_visible(scene_cache.corners, scene_cache.costs, scene_cache.origins,
+                               camera_location, wm.nl_max_distance, perspective_matrix,
+                               width, height, budget_limit, sort_order,
+                               scene_cache.ensure_bvh(), wm.nl_occluder_count if wm.nl_use_occlusion else 0,
+                               wm.nl_min_screen_size if wm.nl_use_screen_size else 0.0, hysteresis,
+                               extra_views, degraded_costs, profile)
+
+    degraded = np.zeros(len(scene_cache.viable_objs), dtype=bool)
+    degraded[selection.degraded] = True
+    visible = degraded.copy()
+    visible[selection.shown] = True
+    revealed, hidden = apply_visibility(scene_cache, visible, wm.nl_use_collection_hiding)
+    apply_degradation(scene_cache, degraded, scene_cache.shown)
+    if profile is not None:
+        profile.revealed, profile.hidden = revealed, hidden
+        profile.mark('apply')
+
+
+def draw_profile_overlay(context: bpy.types.Context):
+    """Draws timings of the most recent visibility pass in the top left corner of the region.
 
-    for o in objs_to_hide:
-        try:
-            o.hide_set(True)
-        except Exception as e:
-            print('Could not hide {}: {}'.format(o.name, e))
+    :param context: Blender context
+    """
+    if not profile_history:
+        return
+    font_id = 0
+    font_size = 11
+    if bpy.app.version >= (4, 0, 0):
+        blf.size(font_id, font_size)
+    else:
+        blf.size(font_id, font_size, 72)
+    blf.color(font_id, 1.0, 1.0, 1.0, 0.8)
+
+    line_height = font_size * context.preferences.system.ui_scale * 1.5
+    y = context.region.height - 3.0 * line_height
+    for line in profile_history[-1].summary_lines():
+        blf.position(font_id, 20.0, y, 0.0)
+        blf.draw(font_id, line)
+        y -= line_height
 
 
 def viewport_draw_handler(self: bpy.types.Operator):
     """Blender draw handler that runs every time the viewport refreshes.
 
-    Tracks the last time the viewport has updated.
+    Tracks the last time the viewport has updated, and draws the profiling overlay if enabled.
 
     :param self: Blender modal operator using the draw handler
     """
     self.last_call = time.time()
     self.has_updated = False
 
+    context = bpy.context
+    if context.region_data is not None:
+        view_motion = self.view_motions.setdefault(context.region_data.as_pointer(), ViewMotion())
+        view_motion.add(self.last_call, context.region_data.view_matrix)
+    if context.window_manager.nl_profile and context.window_manager.nl_profile_overlay:
+        draw_profile_overlay(context)
+
 
 def add_viewport_handler(self: bpy.types.Operator):
     """Adds viewport handler to the 3D view and returns it.
@@ -205,3 +392,37 @@ def remove_viewport_handler(handler):
 
     """
     bpy.types.SpaceView3D.draw_handler_remove(handler, 'WINDOW')
+
+
+def depsgraph_update_handler(self: bpy.types.Operator, _scene: bpy.types.Scene, depsgraph: bpy.types.Depsgraph):
+    """Blender handler that runs after every depsgraph update.
+
+    Patches the caches of objects that were moved, edited, added, removed or renamed.
+
+    :param self: Blender modal operator owning the caches
+    :param _scene: scene that was updated
+    :param depsgraph: dependency graph that was updated
+    """
+    try:
+        self.scene_cache.patch(bpy.context, depsgraph)
+    except Exception as e:
+        print('Could not update nView Live caches: {}'.format(e))
+
+
+def add_depsgraph_handler(self: bpy.types.Operator):
+    """Adds depsgraph update handler and returns it.
+
+    :param self: modal operator owning the caches.
+    """
+    handler = functools.partial(depsgraph_update_handler, self)
+    bpy.app.handlers.depsgraph_update_post.append(handler)
+    return handler
+
+
+def remove_depsgraph_handler(handler):
+    """Removes depsgraph update handler.
+
+    :param handler: handler to be removed.
+    """
+    if handler in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(handler)
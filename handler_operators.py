@@ -14,46 +14,72 @@
 
 
 import bpy
+from bpy_extras.io_utils import ExportHelper
 import time
 
 from .obj_config import obj_types
 from .ObjType import ObjType
-from .coll_util import find_instanced_objs_in_colls
-from .frame_handler import viewport_handler, add_viewport_handler, remove_viewport_handler
-from .budget import budget_factory
-from .BoundBoxCache import BoundBoxCache
+from .frame_handler import (viewport_handler, add_viewport_handler, remove_viewport_handler,
+                            add_depsgraph_handler, remove_depsgraph_handler, restore_degraded)
+from .bake_handler import (BakedVisibility, visibility_bakes, bake_visibility, is_frame_baked,
+                           add_frame_change_handler, remove_frame_change_handler)
+from .core.pass_profile import PassProfile, export_profiles, profile_history
+from .SceneCache import SceneCache
 
 allowed_navigation_types = {'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE', 'RIGHTMOUSE', 'LEFTMOUSE'}
 
+cache_chunk_size = 64
+"""Number of objects cached at a time."""
+cache_tick_interval = 0.02
+"""Time in seconds between timer ticks building the caches."""
+cache_tick_time_limit = 0.05
+"""Time in seconds spent building the caches per timer tick, before handing control back to the UI."""
+timer_jitter = 0.01
+"""Time in seconds a timer tick may arrive early."""
 
-def build_obj_budget_cost_cache(all_objs: list[bpy.types.Object],
-                                context: bpy.types.Context, min_box_size: float) -> tuple[dict, dict]:
-    """Returns a tuple of (budget cache, bounding box cache), where the keys are object names.
 
-    :param all_objs: all objects in the scene.
-    :param context: Blender context.
-    :param min_box_size: minimum allowed bounding box size per object.
-    """
-    budgeter = budget_factory(context)()
-    budget_cache = {obj.name_full: budgeter.budget_cost(context, obj) for obj in all_objs}
-    bb_cache_calculator = BoundBoxCache()
-    bound_box_cache = {obj.name_full: bb_cache_calculator.bound_box_calc(obj, min_box_size)
-                       for obj in all_objs}
-    return budget_cache, bound_box_cache
+def build_nav_lookup(keyconfigs: bpy.types.KeyConfigurations) -> dict[str, list[tuple]]:
+    """Returns navigation keymap items of all keymaps, grouped by event type.
 
+    Navigation items are 3D viewport operators, and frame operators for animation playback.
+    Each item is a tuple of (event value, any modifier, shift, ctrl, alt, oskey).
 
-def is_nav_allowed(keyconfigs: bpy.types.KeyConfig, event: bpy.types.Event) -> bool:
+    :param keyconfigs: Blender keymap configurations.
+    """
+    nav_lookup = {}
+    for kc in keyconfigs:
+        for km in kc.keymaps:
+            for kmi in km.keymap_items:
+                if not kmi.active or kmi.key_modifier != 'NONE':
+                    continue
+                if kmi.idname.startswith('view3d') or (km.name == 'Frames' and kmi.idname.startswith('screen')):
+                    nav_lookup.setdefault(kmi.type, []).append(
+                        (kmi.value, kmi.any, int(kmi.shift), int(kmi.ctrl), int(kmi.alt), int(kmi.oskey)))
+    return nav_lookup
+
+
+def is_nav_allowed(nav_lookup: dict[str, list[tuple]], event: bpy.types.Event) -> bool:
     """Returns True if user event is for 3D viewport navigation, False otherwise.
 
-    :param keyconfigs: Blender keymap configuration.
+    :param nav_lookup: navigation keymap items grouped by event type, see ``build_nav_lookup``.
     :param event: user event (pressing a key, moving the mouse, etc.).
     """
-    keymaps = ((km.name, km.keymap_items.match_event(event))
-               for kc in keyconfigs
-               for km in kc.keymaps)
-    return any(km is not None and (km.idname.startswith('view3d')
-                                   or (km_name == 'Frames' and km.idname.startswith('screen')))
-               for km_name, km in keymaps)
+    event_modifiers = (event.shift, event.ctrl, event.alt, event.oskey)
+    return any(value in {'ANY', event.value}
+               and (any_modifier or all(modifier == -1 or bool(modifier) == event_modifier
+                                        for modifier, event_modifier in zip(modifiers, event_modifiers)))
+               for value, any_modifier, *modifiers in nav_lookup.get(event.type, ()))
+
+
+def update_tick_interval(run_delay: float, playback_mode: bool) -> float:
+    """Returns the time in seconds between timer ticks checking for visibility updates.
+
+    :param run_delay: user-specified delay before the visibility update.
+    :param playback_mode: whether the modal updates on a schedule instead of after the viewport stops refreshing.
+    """
+    if playback_mode:
+        return run_delay
+    return max(run_delay / 4.0, cache_tick_interval)
 
 
 class NL_OT_ViewportLive(bpy.types.Operator):
@@ -108,54 +134,116 @@ class NL_OT_ViewportLive(bpy.types.Operator):
         for obj_type in self.obj_types.values():
             col.prop(obj_type, 'enabled', text=obj_type.obj_name, toggle=True, icon=obj_type.icon)
 
-    def update_caches(self, context: bpy.types.Context):
-        """Updates bounding box and budget caches for objects.
+    def update_caches(self):
+        """Starts rebuilding bounding box and budget caches for objects.
+
+        Caches are built a chunk at a time by ``step_caches``, so the UI does not freeze on large scenes.
+        The builder is given ``bpy.context``, since it outlives the context passed to any single operator call.
+        """
+        valid_obj_types = {o_type.obj_type for o_type in self.obj_types.values() if o_type.enabled}
+        self.scene_cache = SceneCache(valid_obj_types, self.exclude_objs_in_instances, self.min_box_size)
+        self.cache_builder = self.scene_cache.iter_build(bpy.context, cache_chunk_size)
+
+    def step_caches(self, context: bpy.types.Context):
+        """Builds cache chunks until the per-tick time limit is reached, showing progress in the header.
 
         :param context: Blender context
         """
-        excluded_objs = set()
-        if self.exclude_objs_in_instances:
-            excluded_objs = {o.name_full for o in find_instanced_objs_in_colls(context.scene.collection)}
+        start_time = time.perf_counter()
+        try:
+            while time.perf_counter() - start_time < cache_tick_time_limit:
+                cached_count, total_count = next(self.cache_builder)
+        except StopIteration:
+            self.cache_builder = None
+            context.area.header_text_set(self.header_text())
 
-        valid_obj_types = {o_type.obj_type for o_type in self.obj_types.values() if o_type.enabled}
+            budgeter = self.scene_cache.budgeter
+            self.report({'INFO'}, 'Caching done, ready to use ({} mesh cost hits, {} misses)'.format(
+                budgeter.mesh_cache_hits, budgeter.mesh_cache_misses))
+            return
+
+        context.area.header_text_set('{} Caching {}/{} objects...'.format(
+            self.header_text(), cached_count, total_count))
 
-        self.viable_objs = {o
-                            for o in context.scene.objects
-                            if o.type in valid_obj_types
-                            and o.name_full not in excluded_objs
-                            and not o.hide_viewport}
+    def ensure_timer(self, context: bpy.types.Context):
+        """Adds the timer driving the modal, replacing it if its interval changed.
 
-        self.cost_cache, self.bb_cache = build_obj_budget_cost_cache(self.viable_objs, context, self.min_box_size)
-        self.report({'INFO'}, 'Caching done, ready to use')
+        It ticks quickly while caches are built, then at an interval based on the user's update delay.
+
+        :param context: Blender context
+        """
+        wm = context.window_manager
+        if self.cache_builder is not None:
+            interval = cache_tick_interval
+        else:
+            interval = update_tick_interval(wm.nl_run_delay, self.playback_mode)
+
+        if self._timer is not None:
+            if self._timer_interval == interval:
+                return
+            wm.event_timer_remove(self._timer)
+        self._timer = wm.event_timer_add(interval, window=context.window)
+        self._timer_interval = interval
+
+    def header_text(self) -> str:
+        """Returns the text shown in the 3D view header while the modal is running."""
+        if self.playback_mode:
+            return 'nView Live (playback mode) enabled. RMB, ESC: cancel'
+        return 'nView Live enabled. RMB, ESC: cancel'
 
     def cancel(self, context):
         """Cleanup function before canceling the modal operator."""
         context.window_manager.nl_is_running = False
         context.area.header_text_set(text=None)
         remove_viewport_handler(self._handler)
+        remove_depsgraph_handler(self._depsgraph_handler)
+        if self._frame_handler is not None:
+            remove_frame_change_handler(self._frame_handler)
+        if self._timer is not None:
+            context.window_manager.event_timer_remove(self._timer)
+        restore_degraded(self.scene_cache)
+        self.scene_cache.release_groups()
+        self.scene_cache.save_mesh_stats()
         return {'CANCELLED'}
 
     def modal(self, context, event):
-        """Code triggered on a regular basis while the modal is running."""
-        window_manager = context.window_manager
-        if is_nav_allowed(window_manager.keyconfigs, event):
+        """Code triggered by user events and timer ticks while the modal is running."""
+        if is_nav_allowed(self.nav_lookup, event):
             return {'PASS_THROUGH'}
 
         if event.type in {'ESC', 'RIGHTMOUSE'}:
             return self.cancel(context)
 
-        run_delay = window_manager.nl_run_delay
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        if self.cache_builder is not None:
+            try:
+                self.step_caches(context)
+            except Exception as e:
+                self.report({'ERROR'}, 'Exiting due to internal error while caching: {}'.format(str(e)))
+                return self.cancel(context)
+            # newly cached objects are culled on the next update
+            self.has_updated = False
+        self.ensure_timer(context)
+
+        run_delay = context.window_manager.nl_run_delay
         curr_time = time.time()
-        should_update_playback_mode = self.playback_mode and (curr_time - self.last_run) > run_delay
+        # baked frames are applied by the frame change handler instead
+        should_update_playback_mode = (self.playback_mode and (curr_time - self.last_run) > run_delay - timer_jitter
+                                       and not is_frame_baked(context.scene))
         should_update_normal_mode = ((curr_time - self.last_call) > run_delay and not self.has_updated)
         if should_update_playback_mode or should_update_normal_mode:
             self.last_run = curr_time
             self.has_updated = True
+            profile = PassProfile() if context.window_manager.nl_profile else None
             try:
-                viewport_handler(context, self.viable_objs, self.cost_cache, self.bb_cache)
+                viewport_handler(context, self.scene_cache, profile, self.view_motions)
             except Exception as e:
                 self.report({'ERROR'}, 'Exiting due to internal error: {}'.format(str(e)))
                 return self.cancel(context)
+            if profile is not None:
+                profile.finish()
 
         return {'PASS_THROUGH'}
 
@@ -172,16 +260,22 @@ class NL_OT_ViewportLive(bpy.types.Operator):
 
         wm.nl_is_running = True
 
-        self.update_caches(context)
-
-        if self.playback_mode:
-            header_text = 'nView Live (playback mode) enabled. RMB, ESC: cancel'
-        else:
-            header_text = 'nView Live enabled. RMB, ESC: cancel'
-
-        context.area.header_text_set(header_text)
+        self.update_caches()
+        context.area.header_text_set(self.header_text())
 
+        self.view_motions = {}
         self._handler = add_viewport_handler(self)
+        self._depsgraph_handler = add_depsgraph_handler(self)
+        self._frame_handler = None
+        if self.playback_mode:
+            baked = visibility_bakes.get(context.scene.name_full)
+            if baked is not None:
+                baked.reset()
+            self._frame_handler = add_frame_change_handler(self)
+        self.nav_lookup = build_nav_lookup(wm.keyconfigs)
+        self._timer = None
+        self._timer_interval = 0.0
+        self.ensure_timer(context)
         context.window_manager.modal_handler_add(self)
         return {'RUNNING_MODAL'}
 
@@ -194,3 +288,134 @@ class NL_OT_ViewportLive(bpy.types.Operator):
             new_type.icon = icon
             new_type.enabled = enabled
         return context.window_manager.invoke_props_dialog(self)
+
+
+class NL_OT_ExportProfile(bpy.types.Operator, ExportHelper):
+    """Exports timings of recent visibility passes to a JSON or CSV file."""
+    bl_idname = 'semagnum_nview_live.export_profile'
+    bl_label = 'Export Profile'
+    bl_description = 'Save timings of recent visibility passes to a JSON or CSV file'
+    bl_options = {'REGISTER'}
+
+    filename_ext = '.json'
+    filter_glob: bpy.props.StringProperty(default='*.json;*.csv', options={'HIDDEN'})
+
+    @classmethod
+    def poll(cls, _context):
+        return len(profile_history) > 0
+
+    def check(self, _context):
+        """Keeps a .csv extension instead of replacing it with the default .json extension."""
+        if self.filepath.lower().endswith('.csv'):
+            return False
+        return super().check(_context)
+
+    def execute(self, context):
+        """Writes the recorded passes to the chosen file."""
+        try:
+            export_profiles(self.filepath)
+        except OSError as e:
+            self.report({'ERROR'}, 'Could not export profile: {}'.format(e))
+            return {'CANCELLED'}
+        self.report({'INFO'}, 'Exported {} passes to {}'.format(len(profile_history), self.filepath))
+        return {'FINISHED'}
+
+
+class NL_OT_BakeVisibility(bpy.types.Operator):
+    """Culls objects against the scene camera on every frame, so playback mode only applies the changes."""
+    bl_idname = 'semagnum_nview_live.bake_visibility'
+    bl_label = 'Bake Camera Visibility'
+    bl_description = ('Cull objects against the scene camera on every frame of the scene\'s range, '
+                      'so playback mode applies the precomputed changes instead of culling live')
+    bl_options = {'REGISTER'}
+
+    min_box_size: bpy.props.FloatProperty(name='Minimum Bounding Box Size',
+                                          description='Minimum bounding box size for objects'
+                                                      'without a determinable size'
+                                                      '(such as lights or non-instancing empties)',
+                                          unit='LENGTH', subtype='DISTANCE',
+                                          default=0.1, min=0.001, soft_min=0.1, soft_max=1.0)
+    """Minimum bounding box size for objects without a determinable size (e.g. lights)."""
+
+    exclude_objs_in_instances: bpy.props.BoolProperty(name='Exclude instanced objects',
+                                                      description='Exclude objects in collection instances from '
+                                                                  'visibility tests (can make instances seem hidden '
+                                                                  'when they are not)',
+                                                      default=True)
+    """If True, any objects instanced in collections are omitted from the bake, as in the modal."""
+
+    obj_types: bpy.props.CollectionProperty(type=ObjType)
+    """Object types that are baked, which should match those of the modal playing the bake back."""
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene.camera is not None
+
+    def draw(self, _context: bpy.types.Context):
+        """Draws a UI panel for user to pick the same object settings as the modal before baking.
+
+        :param _context: Blender context
+        """
+        layout = self.layout
+        layout.prop(self, 'min_box_size')
+        layout.prop(self, 'exclude_objs_in_instances')
+
+        layout.label(text='Object types:')
+        col = layout.column(align=True)
+        for obj_type in self.obj_types.values():
+            col.prop(obj_type, 'enabled', text=obj_type.obj_name, toggle=True, icon=obj_type.icon)
+
+    def invoke(self, context, event):
+        """Opens dialog box for users to choose operator settings."""
+        self.obj_types.clear()
+        for obj_type, obj_name, icon, enabled in obj_types:
+            new_type = self.obj_types.add()
+            new_type.obj_type = obj_type
+            new_type.obj_name = obj_name
+            new_type.icon = icon
+            new_type.enabled = enabled
+        return context.window_manager.invoke_props_dialog(self)
+
+    def execute(self, context):
+        """Builds the caches, then bakes the scene's frame range."""
+        scene = context.scene
+        wm = context.window_manager
+        if self.obj_types:
+            valid_obj_types = {o_type.obj_type for o_type in self.obj_types.values() if o_type.enabled}
+        else:
+            valid_obj_types = {obj_type for obj_type, _obj_name, _icon, enabled in obj_types if enabled}
+        scene_cache = SceneCache(valid_obj_types, self.exclude_objs_in_instances, self.min_box_size)
+
+        wm.progress_begin(scene.frame_start, scene.frame_end)
+        try:
+            scene_cache.build(context)
+            bake = bake_visibility(context, scene_cache, scene.frame_start, scene.frame_end, wm.progress_update)
+        except Exception as e:
+            self.report({'ERROR'}, 'Could not bake visibility: {}'.format(e))
+            return {'CANCELLED'}
+        finally:
+            wm.progress_end()
+            scene_cache.save_mesh_stats()
+
+        visibility_bakes[scene.name_full] = BakedVisibility(scene_cache.viable_objs, bake)
+        change_count = sum(len(changed) for changed in bake.changes)
+        self.report({'INFO'}, 'Baked frames {}-{}: {} visibility changes ({:.1f} KB)'.format(
+            bake.frame_start, bake.frame_end, change_count, bake.nbytes / 1024.0))
+        return {'FINISHED'}
+
+
+class NL_OT_ClearBake(bpy.types.Operator):
+    """Removes the scene's baked visibility, so playback mode culls live again."""
+    bl_idname = 'semagnum_nview_live.clear_bake'
+    bl_label = 'Clear Bake'
+    bl_description = 'Remove the scene\'s baked visibility, so playback mode culls live again'
+    bl_options = {'REGISTER'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene.name_full in visibility_bakes
+
+    def execute(self, context):
+        """Removes the scene's bake."""
+        visibility_bakes.pop(context.scene.name_full, None)
+        return {'FINISHED'}
@@ -15,8 +15,10 @@
 
 import bpy
 
-from .handler_operators import NL_OT_ViewportLive
+from .bake_handler import visibility_bakes
+from .handler_operators import NL_OT_ViewportLive, NL_OT_ExportProfile, NL_OT_BakeVisibility, NL_OT_ClearBake
 from .budget import budget_factory
+from .core.pass_profile import pass_stages, profile_history
 
 
 class NL_PT_NViewLive(bpy.types.Panel):
@@ -33,10 +35,33 @@ class NL_PT_NViewLive(bpy.types.Panel):
         window_manager = context.window_manager
 
         layout.operator(NL_OT_ViewportLive.bl_idname)
+        row = layout.row(align=True)
+        row.operator(NL_OT_BakeVisibility.bl_idname, icon='RENDER_ANIMATION')
+        row.operator(NL_OT_ClearBake.bl_idname, text='', icon='X')
+        baked = visibility_bakes.get(context.scene.name_full)
+        if baked is not None:
+            layout.label(text='Baked frames {}-{}'.format(baked.bake.frame_start, baked.bake.frame_end))
 
         layout.separator()
         layout.prop(window_manager, 'nl_run_delay')
         layout.prop(window_manager, 'nl_max_distance')
+        layout.prop(window_manager, 'nl_use_all_views')
+        layout.prop(window_manager, 'nl_use_collection_hiding')
+        row = layout.row(align=True)
+        row.prop(window_manager, 'nl_use_screen_size')
+        sub = row.row(align=True)
+        sub.enabled = window_manager.nl_use_screen_size
+        sub.prop(window_manager, 'nl_min_screen_size')
+        row = layout.row(align=True)
+        row.prop(window_manager, 'nl_use_prediction')
+        sub = row.row(align=True)
+        sub.enabled = window_manager.nl_use_prediction
+        sub.prop(window_manager, 'nl_prediction_time')
+        row = layout.row(align=True)
+        row.prop(window_manager, 'nl_use_occlusion')
+        sub = row.row(align=True)
+        sub.enabled = window_manager.nl_use_occlusion
+        sub.prop(window_manager, 'nl_occluder_count')
         layout.operator('object.hide_view_clear', icon='HIDE_OFF')
 
 
@@ -67,3 +92,93 @@ class NL_PT_Budgeting(bpy.types.Panel):
         box = layout.box()
         budget_option = budget_factory(context, is_layout=True)()
         budget_option.draw(context, box)
+        layout.prop(window_manager, 'nl_sort_by_screen_size')
+        layout.prop(window_manager, 'nl_over_budget_action')
+
+
+class NL_PT_Stability(bpy.types.Panel):
+    """nView Live subpanel for hysteresis margins."""
+    bl_space_type = 'VIEW_3D'
+    bl_label = 'Stabilize'
+    bl_category = 'nView'
+    bl_region_type = 'UI'
+    bl_idname = 'NL_PT_stability'
+    bl_parent_id = 'NL_PT_nview_live'
+    bl_context = 'objectmode'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw_header(self, context):
+        self.layout.prop(context.window_manager, 'nl_use_hysteresis', text='')
+
+    def draw(self, context):
+        layout = self.layout
+        window_manager = context.window_manager
+        layout.enabled = window_manager.nl_use_hysteresis
+
+        col = layout.column(align=True)
+        col.prop(window_manager, 'nl_distance_enter_margin')
+        col.prop(window_manager, 'nl_distance_exit_margin')
+        col = layout.column(align=True)
+        col.prop(window_manager, 'nl_frustum_enter_margin')
+        col.prop(window_manager, 'nl_frustum_exit_margin')
+        layout.prop(window_manager, 'nl_min_visible_time')
+        layout.prop(window_manager, 'nl_budget_dead_band', slider=True)
+
+
+class NL_PT_Profiling(bpy.types.Panel):
+    """nView Live subpanel for timing visibility passes."""
+    bl_space_type = 'VIEW_3D'
+    bl_label = 'Profiling'
+    bl_category = 'nView'
+    bl_region_type = 'UI'
+    bl_idname = 'NL_PT_profiling'
+    bl_parent_id = 'NL_PT_nview_live'
+    bl_context = 'objectmode'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw_header(self, context):
+        self.layout.prop(context.window_manager, 'nl_profile', text='')
+
+    def draw(self, context):
+        layout = self.layout
+        window_manager = context.window_manager
+        layout.enabled = window_manager.nl_profile
+        layout.prop(window_manager, 'nl_profile_overlay')
+
+        if profile_history:
+            col = layout.column(align=True)
+            for line in profile_history[-1].summary_lines():
+                col.label(text=line)
+
+            col = layout.column(align=True)
+            col.label(text='Average of {} passes (ms):'.format(len(profile_history)))
+            for stage in pass_stages:
+                avg_time = sum(profile.stage_times[stage] for profile in profile_history) / len(profile_history)
+                col.label(text='{}: {:.2f}'.format(stage.capitalize(), avg_time * 1000.0))
+
+        layout.operator(NL_OT_ExportProfile.bl_idname, icon='EXPORT')
+
+
+class NL_PT_Render(bpy.types.Panel):
+    """nView Live subpanel for culling renders."""
+    bl_space_type = 'VIEW_3D'
+    bl_label = 'Render Culling'
+    bl_category = 'nView'
+    bl_region_type = 'UI'
+    bl_idname = 'NL_PT_render'
+    bl_parent_id = 'NL_PT_nview_live'
+    bl_context = 'objectmode'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw_header(self, context):
+        self.layout.prop(context.scene, 'nl_render_cull', text='')
+
+    def draw(self, context):
+        layout = self.layout
+        scene = context.scene
+        layout.enabled = scene.nl_render_cull
+        layout.prop(scene, 'nl_render_max_distance')
+        layout.prop(scene, 'nl_render_overscan', slider=True)
+        if not scene.render.use_lock_interface:
+            layout.label(text='Lock the interface when rendering from the UI', icon='ERROR')
+            layout.prop(scene.render, 'use_lock_interface')
@@ -3,3 +3,16 @@ obj_types = [('MESH', 'Mesh', 'OUTLINER_OB_MESH', True),
              ('LIGHT', 'Light', 'OUTLINER_OB_LIGHT', False),
              ]
 """List of object types that can be hidden or revealed by nView Live."""
+
+over_budget_actions = ('HIDE', 'BOUNDS', 'WIRE', 'MODIFIERS')
+"""What happens to objects in view that do not fit in the budget, indexed by ``SceneCache.degraded``.
+
+``HIDE`` hides them, ``BOUNDS`` and ``WIRE`` set their display type,
+and ``MODIFIERS`` turns off their ``heavy_modifier_types`` in the viewport."""
+
+heavy_modifier_types = {'ARRAY', 'BEVEL', 'BOOLEAN', 'MIRROR', 'MULTIRES', 'NODES', 'REMESH', 'SCREW', 'SKIN',
+                        'SOLIDIFY', 'SUBSURF', 'WIREFRAME'}
+"""Modifier types generating enough geometry to be worth turning off for objects over budget."""
+
+display_types = ('BOUNDS', 'WIRE', 'SOLID', 'TEXTURED')
+"""Object display types, from least to most detailed."""
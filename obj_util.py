@@ -0,0 +1,71 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from typing import NamedTuple
+
+import bpy
+import numpy as np
+
+
+class ObjectArrays(NamedTuple):
+    """Attributes of many objects, read at once."""
+    names: list[str]
+    """Full name of each object."""
+    types: np.ndarray
+    """Type of each object, as strings."""
+    matrices: np.ndarray
+    """World matrix of each object, shape (N, 4, 4)."""
+    bound_boxes: np.ndarray
+    """Local bounding box corners of each object, shape (N, 8, 3)."""
+    hide_viewport: np.ndarray
+    """Whether each object is disabled in viewports."""
+    is_instancer: np.ndarray
+    """Whether each object instances other objects."""
+
+    def subset(self, indices: np.ndarray) -> 'ObjectArrays':
+        """Returns the attributes of some of the objects.
+
+        :param indices: indices of the objects to keep
+        """
+        return ObjectArrays([self.names[idx] for idx in indices], self.types[indices], self.matrices[indices],
+                            self.bound_boxes[indices], self.hide_viewport[indices], self.is_instancer[indices])
+
+
+def object_arrays(objs: bpy.types.bpy_prop_collection) -> ObjectArrays:
+    """Reads the attributes needed to cache objects' bounding boxes, with one ``foreach_get`` per numeric attribute.
+
+    Names and types are strings, which ``foreach_get`` cannot read, so they are read one object at a time.
+
+    :param objs: collection of objects, e.g. ``scene.objects``
+    """
+    count = len(objs)
+    matrices = np.empty(count * 16, dtype=np.float32)
+    objs.foreach_get('matrix_world', matrices)
+    bound_boxes = np.empty(count * 24, dtype=np.float32)
+    objs.foreach_get('bound_box', bound_boxes)
+    hide_viewport = np.empty(count, dtype=bool)
+    objs.foreach_get('hide_viewport', hide_viewport)
+    is_instancer = np.empty(count, dtype=bool)
+    objs.foreach_get('is_instancer', is_instancer)
+
+    return ObjectArrays(
+        [o.name_full for o in objs],
+        np.array([o.type for o in objs], dtype=object),
+        # matrices are read column by column
+        matrices.reshape(-1, 4, 4).transpose(0, 2, 1).astype(np.float64),
+        bound_boxes.reshape(-1, 8, 3).astype(np.float64),
+        hide_viewport,
+        is_instancer,
+    )
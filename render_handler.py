@@ -0,0 +1,310 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Render-time culling: objects the scene camera cannot see are excluded from renders with ``hide_render``,
+only while each frame renders. Handlers are persistent, so it also works in ``blender --background`` renders.
+
+Blender runs ``render_pre`` before it updates the scene for the frame, so culling waits for ``frame_change_post``,
+which receives the render's dependency graph once the frame is evaluated. Changes made there are evaluated again
+before the frame renders.
+"""
+
+
+import bpy
+from bpy.app.handlers import persistent
+from mathutils import Euler, Matrix, Quaternion
+import numpy as np
+
+from .BoundBoxCache import BoundBoxCache
+from .coll_util import find_instanced_objs_in_colls
+from .core.BoundBoxBVH import BoundBoxBVH
+from .core.select_util import cull_indices
+from .frame_handler import camera_view
+
+render_obj_types = {'MESH', 'EMPTY'}
+"""Object types that can be excluded from renders. Lights are never excluded, since they light what is in view."""
+render_min_box_size = 0.1
+"""Minimum bounding box size for objects without a determinable size."""
+
+
+def is_render_cullable(obj: bpy.types.Object, excluded_objs: set[str]) -> bool:
+    """Returns True if the object can be excluded from renders, False otherwise.
+
+    Objects already excluded, inside instanced collections, or whose render visibility is animated are left alone.
+
+    :param obj: object to check
+    :param excluded_objs: names of objects in instanced collections
+    """
+    if obj.type not in render_obj_types or obj.hide_render or obj.name_full in excluded_objs:
+        return False
+    if obj.type == 'EMPTY' and not (obj.is_instancer and obj.instance_type == 'COLLECTION'):
+        return False
+    anim_data = obj.animation_data
+    return not (anim_data is not None and anim_data.action is not None
+                and any(fc.data_path == 'hide_render' for fc in anim_data.action.fcurves))
+
+
+def shutter_offsets(render: bpy.types.RenderSettings) -> tuple[float, ...]:
+    """Returns the times in frames, relative to the current frame, at which the shutter opens and closes,
+    or an empty tuple without motion blur.
+
+    :param render: scene render settings
+    """
+    if not render.use_motion_blur:
+        return ()
+    shutter = render.motion_blur_shutter
+    position = getattr(render, 'motion_blur_position', 'CENTER')
+    if position == 'START':
+        return (shutter,)
+    if position == 'END':
+        return (-shutter,)
+    return -shutter / 2.0, shutter / 2.0
+
+
+def animated_values(obj: bpy.types.Object, data_path: str, frame: float) -> list[float]:
+    """Returns an object's array property on a given frame, from its action's F-curves where there are any,
+    or its current values otherwise.
+
+    :param obj: animated object
+    :param data_path: path of the property, e.g. ``location``
+    :param frame: frame to evaluate, may be fractional
+    """
+    values = list(getattr(obj, data_path))
+    anim_data = obj.animation_data
+    if anim_data is not None and anim_data.action is not None:
+        for fcurve in anim_data.action.fcurves:
+            if fcurve.data_path == data_path and fcurve.array_index < len(values):
+                values[fcurve.array_index] = fcurve.evaluate(frame)
+    return values
+
+
+def matrix_world_at(obj: bpy.types.Object, frame: float) -> Matrix:
+    """Returns an object's world matrix on a given frame, from the keyframed transforms of it and its parents.
+
+    Constraints, drivers and delta transforms are not evaluated, so the result can differ from ``matrix_world``,
+    but changes between frames follow the keyframes.
+
+    :param obj: animated object
+    :param frame: frame to evaluate, may be fractional
+    """
+    if obj.rotation_mode == 'QUATERNION':
+        rotation = Quaternion(animated_values(obj, 'rotation_quaternion', frame)).normalized().to_matrix()
+    elif obj.rotation_mode == 'AXIS_ANGLE':
+        angle, *axis = animated_values(obj, 'rotation_axis_angle', frame)
+        rotation = Quaternion(axis, angle).to_matrix()
+    else:
+        rotation = Euler(animated_values(obj, 'rotation_euler', frame), obj.rotation_mode).to_matrix()
+    basis = (Matrix.Translation(animated_values(obj, 'location', frame)) @ rotation.to_4x4()
+             @ Matrix.Diagonal(animated_values(obj, 'scale', frame) + [1.0]))
+    if obj.parent is None:
+        return basis
+    return matrix_world_at(obj.parent, frame) @ obj.matrix_parent_inverse @ basis
+
+
+def shutter_matrices(camera: bpy.types.Object, frame: float, offsets: tuple[float, ...]) -> list[np.ndarray]:
+    """Returns the camera's world matrix when the shutter opens and closes, for each offset where it moved.
+
+    The keyframed motion between the frame and each offset is applied to the camera's current world matrix,
+    so the first frame of a render, or a single frame, is widened as much as any other.
+
+    :param camera: scene camera
+    :param frame: frame being rendered
+    :param offsets: times in frames, relative to ``frame``, at which the shutter opens and closes
+    """
+    camera_world = np.array(camera.matrix_world)
+    if not offsets:
+        return []
+    current_inverse = matrix_world_at(camera, frame).inverted_safe()
+    matrices = []
+    for offset in offsets:
+        motion = np.array(matrix_world_at(camera, frame + offset) @ current_inverse)
+        if not np.allclose(motion, np.identity(4)):
+            matrices.append(motion @ camera_world)
+    return matrices
+
+
+class RenderCull:
+    """Bounding boxes of a scene's objects that can be excluded from renders, and those excluded so far."""
+
+    def __init__(self, scene: bpy.types.Scene):
+        """
+        :param scene: scene being rendered
+        """
+        excluded_objs = {o.name_full for o in find_instanced_objs_in_colls(scene.collection)}
+        self.objs = [o for o in scene.objects if is_render_cullable(o, excluded_objs)]
+        self.bb_calculator = BoundBoxCache()
+        self.matrices = None
+        """World matrix of each object when its box was last calculated, None until the first frame is culled."""
+        self.corners = None
+        self.bvh = None
+        self.culled = []
+        """Objects excluded from the frame being rendered."""
+
+    def refresh_boxes(self, depsgraph: bpy.types.Depsgraph):
+        """Calculates the bounding boxes of the objects as evaluated for the frame,
+        recalculating only those that moved since the last frame.
+
+        :param depsgraph: dependency graph evaluated for the frame being rendered
+        """
+        objs_eval = [o.evaluated_get(depsgraph) for o in self.objs]
+        if self.corners is None:
+            self.matrices = [o.matrix_world.copy() for o in objs_eval]
+            self.corners = self.bb_calculator.corners(objs_eval, render_min_box_size)
+            self.bvh = BoundBoxBVH(self.corners)
+            return
+        moved = False
+        for idx, o in enumerate(objs_eval):
+            if o.matrix_world != self.matrices[idx]:
+                self.matrices[idx] = o.matrix_world.copy()
+                self.bb_calculator.invalidate(o.name_full)
+                self.corners[idx] = self.bb_calculator.bound_box_calc(o, render_min_box_size)
+                moved = True
+        if moved:
+            self.bvh.refit()
+
+    def visible_mask(self, scene: bpy.types.Scene, depsgraph: bpy.types.Depsgraph) -> np.ndarray:
+        """Returns whether each object is close enough to and inside the camera's view,
+        widened by the overscan margin and over the motion blur shutter's range.
+
+        :param scene: scene being rendered
+        :param depsgraph: dependency graph evaluated for the frame being rendered
+        """
+        camera = scene.camera.evaluated_get(depsgraph)
+        camera_location, perspective_matrix, width, height = camera_view(depsgraph, camera)
+        projection = perspective_matrix @ np.array(camera.matrix_world)
+
+        views = [(camera_location, perspective_matrix)]
+        frame = scene.frame_current + scene.frame_subframe
+        for shutter_world in shutter_matrices(camera, frame, shutter_offsets(scene.render)):
+            views.append((shutter_world[:3, 3], projection @ np.linalg.inv(shutter_world)))
+
+        max_dist = scene.nl_render_max_distance if scene.nl_render_max_distance > 0.0 else np.inf
+        margin = scene.nl_render_overscan * max(width, height)
+        visible = np.zeros(len(self.objs), dtype=bool)
+        for location, matrix in views:
+            visible[cull_indices(self.corners, location, max_dist, matrix, width, height, self.bvh, margin)] = True
+        return visible
+
+    def cull(self, scene: bpy.types.Scene, depsgraph: bpy.types.Depsgraph) -> int:
+        """Excludes objects the camera cannot see from the current frame's render, and returns how many.
+
+        :param scene: scene being rendered
+        :param depsgraph: dependency graph evaluated for the frame being rendered
+        """
+        self.restore()
+        self.refresh_boxes(depsgraph)
+        visible = self.visible_mask(scene, depsgraph)
+        for idx in np.flatnonzero(~visible):
+            o = self.objs[idx]
+            try:
+                o.hide_render = True
+            except Exception as e:
+                print('Could not exclude {} from render: {}'.format(o.name, e))
+            else:
+                self.culled.append(o)
+        return len(self.culled)
+
+    def restore(self):
+        """Includes every object excluded by ``cull`` in renders again."""
+        for o in self.culled:
+            try:
+                o.hide_render = False
+            except ReferenceError:
+                pass
+        self.culled = []
+
+
+render_culls: dict[str, RenderCull] = {}
+"""Render culling of each scene being rendered, keyed by scene name."""
+
+
+@persistent
+def render_pre_handler(scene: bpy.types.Scene, *_args):
+    """Blender handler that runs before each frame is rendered, before the scene is updated for it.
+    Marks the scene as rendering, so ``frame_change_post_handler`` culls it once the frame is evaluated.
+
+    :param scene: scene being rendered
+    """
+    if not scene.nl_render_cull or scene.camera is None or scene.name_full in render_culls:
+        return
+    try:
+        render_culls[scene.name_full] = RenderCull(scene)
+    except Exception as e:
+        print('Could not cull render: {}'.format(e))
+
+
+@persistent
+def frame_change_post_handler(scene: bpy.types.Scene, depsgraph: bpy.types.Depsgraph = None):
+    """Blender handler that runs once a frame is evaluated, excluding objects the camera cannot see
+    from the frame being rendered. Does nothing outside renders.
+
+    :param scene: scene whose frame changed
+    :param depsgraph: dependency graph evaluated for the frame
+    """
+    render_cull = render_culls.get(scene.name_full)
+    if render_cull is None or depsgraph is None or scene.camera is None:
+        return
+    try:
+        culled = render_cull.cull(scene, depsgraph)
+        print('nView Live: excluded {}/{} objects from frame {}'.format(
+            culled, len(render_cull.objs), scene.frame_current))
+    except Exception as e:
+        print('Could not cull render: {}'.format(e))
+
+
+@persistent
+def render_post_handler(scene: bpy.types.Scene, *_args):
+    """Blender handler that runs after each frame is rendered, restoring excluded objects.
+
+    :param scene: scene being rendered
+    """
+    render_cull = render_culls.get(scene.name_full)
+    if render_cull is not None:
+        render_cull.restore()
+
+
+@persistent
+def render_end_handler(scene: bpy.types.Scene, *_args):
+    """Blender handler that runs once a render job completes or is cancelled, restoring excluded objects
+    and forgetting the cached boxes.
+
+    :param scene: scene being rendered
+    """
+    render_cull = render_culls.pop(scene.name_full, None)
+    if render_cull is not None:
+        render_cull.restore()
+
+
+render_handlers = [
+    (bpy.app.handlers.render_pre, render_pre_handler),
+    (bpy.app.handlers.frame_change_post, frame_change_post_handler),
+    (bpy.app.handlers.render_post, render_post_handler),
+    (bpy.app.handlers.render_cancel, render_end_handler),
+    (bpy.app.handlers.render_complete, render_end_handler),
+]
+"""Handler lists and the render culling handlers added to them."""
+
+
+def add_render_handlers():
+    """Adds the render culling handlers, which stay registered across loaded files."""
+    for handlers, handler in render_handlers:
+        if handler not in handlers:
+            handlers.append(handler)
+
+
+def remove_render_handlers():
+    """Removes the render culling handlers."""
+    for handlers, handler in render_handlers:
+        if handler in handlers:
+            handlers.remove(handler)
@@ -0,0 +1,115 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Renders an animation with a moving camera in Blender and checks that render culling excluded no object the camera
+could see. Run inside Blender by ``test_render_cull.py``, which fails if this script exits with an error.
+"""
+
+
+import importlib.util
+import math
+import os
+import sys
+import tempfile
+
+import bpy
+from bpy_extras.object_utils import world_to_camera_view
+from mathutils import Vector
+
+addon_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+frame_count = 5
+
+
+def register_addon():
+    """Imports the add-on as the ``nviewlive`` package and registers it."""
+    spec = importlib.util.spec_from_file_location('nviewlive', os.path.join(addon_dir, '__init__.py'),
+                                                  submodule_search_locations=[addon_dir])
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules['nviewlive'] = addon
+    spec.loader.exec_module(addon)
+    addon.register()
+
+
+def build_scene(scene: bpy.types.Scene):
+    """Fills the scene with a row of cubes and a camera panning along them.
+
+    :param scene: empty scene
+    """
+    for idx in range(40):
+        bpy.ops.mesh.primitive_cube_add(size=1.0, location=(idx * 3.0 - 20.0, 15.0, 0.0))
+    camera = bpy.data.objects.new('Camera', bpy.data.cameras.new('Camera'))
+    scene.collection.objects.link(camera)
+    scene.camera = camera
+    camera.rotation_euler = (math.radians(90.0), 0.0, 0.0)
+    for frame, x in ((1, -20.0), (frame_count, 80.0)):
+        camera.location = (x, 0.0, 0.0)
+        camera.keyframe_insert('location', frame=frame)
+
+    scene.frame_start, scene.frame_end = 1, frame_count
+    scene.render.engine = 'BLENDER_WORKBENCH'
+    scene.render.resolution_x = scene.render.resolution_y = 32
+    scene.render.filepath = os.path.join(tempfile.mkdtemp(), 'frame_')
+    scene.nl_render_cull = True
+    scene.nl_render_overscan = 0.0
+
+
+def seen_objs(scene: bpy.types.Scene, frame: int) -> set[str]:
+    """Returns the names of meshes with a bounding box corner inside the camera's frame on a given frame.
+
+    :param scene: rendered scene
+    :param frame: rendered frame
+    """
+    scene.frame_set(frame)
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    camera = scene.camera.evaluated_get(depsgraph)
+    seen = set()
+    for o in scene.objects:
+        if o.type != 'MESH':
+            continue
+        o_eval = o.evaluated_get(depsgraph)
+        for corner in o_eval.bound_box:
+            x, y, z = world_to_camera_view(scene, camera, o_eval.matrix_world @ Vector(corner))
+            if z > 0.0 and 0.0 <= x <= 1.0 and 0.0 <= y <= 1.0:
+                seen.add(o.name_full)
+                break
+    return seen
+
+
+def main():
+    register_addon()
+    scene = bpy.context.scene
+    for o in list(scene.objects):
+        bpy.data.objects.remove(o)
+    build_scene(scene)
+
+    excluded = {}
+    """Names of objects excluded from each frame's render."""
+
+    def record_excluded(render_scene, *_args):
+        excluded[render_scene.frame_current] = {o.name_full for o in render_scene.objects if o.hide_render}
+
+    # runs before the add-on's own handler, which includes the objects again
+    bpy.app.handlers.render_post.insert(0, record_excluded)
+    bpy.ops.render.render(animation=True)
+
+    assert sorted(excluded) == list(range(1, frame_count + 1)), 'frames rendered: {}'.format(sorted(excluded))
+    assert all(excluded.values()), 'nothing was excluded from some frames: {}'.format(excluded)
+    for frame, excluded_names in excluded.items():
+        dropped = excluded_names & seen_objs(scene, frame)
+        assert not dropped, 'frame {} excluded objects in view: {}'.format(frame, sorted(dropped))
+    assert not any(o.hide_render for o in scene.objects), 'objects were not included again after the render'
+
+
+if __name__ == '__main__':
+    main()
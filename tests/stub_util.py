@@ -0,0 +1,104 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Stand-ins for Blender's modules and objects, so the add-on can be imported and tested without Blender.
+
+Run the tests with ``python -m unittest discover -s tests`` or ``python -m pytest tests`` from the add-on's directory.
+"""
+
+
+import importlib.util
+import os
+import sys
+import types
+from unittest import mock
+
+import numpy as np
+
+addon_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StubTypes(types.ModuleType):
+    """Stand-in for ``bpy.types``, returning a plain class for any Blender type."""
+
+    def __getattr__(self, name):
+        cls = type(name, (), {})
+        setattr(self, name, cls)
+        return cls
+
+
+def install_stubs():
+    """Replaces Blender's modules with stubs, unless they are already imported."""
+    if 'bpy' in sys.modules:
+        return
+    bpy = mock.MagicMock()
+    bpy.types = StubTypes('bpy.types')
+    bpy.app.handlers.persistent = lambda func: func
+    stubs = {'bpy': bpy, 'bpy.types': bpy.types, 'bpy.props': bpy.props, 'bpy.app': bpy.app,
+             'bpy.app.handlers': bpy.app.handlers, 'bpy_extras': mock.MagicMock(),
+             'bpy_extras.io_utils': types.SimpleNamespace(ExportHelper=type('ExportHelper', (), {})),
+             'blf': mock.MagicMock(), 'mathutils': mock.MagicMock()}
+    for name, module in stubs.items():
+        sys.modules.setdefault(name, module)
+
+
+def import_addon():
+    """Imports the add-on as the ``nviewlive`` package, with Blender's modules replaced by stubs."""
+    if 'nviewlive' in sys.modules:
+        return sys.modules['nviewlive']
+    install_stubs()
+    spec = importlib.util.spec_from_file_location('nviewlive', os.path.join(addon_dir, '__init__.py'),
+                                                  submodule_search_locations=[addon_dir])
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules['nviewlive'] = addon
+    spec.loader.exec_module(addon)
+    return addon
+
+
+class StubObject:
+    """Stand-in for a Blender mesh object, recording ``hide_set`` calls."""
+
+    def __init__(self, name: str):
+        self.name = self.name_full = name
+        self.type = 'MESH'
+        self.data = types.SimpleNamespace(name_full=name)
+        self.modifiers = []
+        self.is_instancer = False
+        self.instance_type = 'NONE'
+        self.location = np.array([float(len(name)), 0.0, 0.0])
+        self.hidden = False
+
+    def hide_set(self, hidden: bool):
+        self.hidden = hidden
+
+    def hide_get(self) -> bool:
+        return self.hidden
+
+    def as_pointer(self) -> int:
+        return id(self)
+
+
+class StubObjects(list):
+    """Stand-in for ``scene.objects``, reading attributes with ``foreach_get`` like Blender does."""
+
+    def foreach_get(self, attr: str, buffer: np.ndarray):
+        if attr == 'matrix_world':
+            matrices = np.tile(np.eye(4, dtype=np.float32), (len(self), 1, 1))
+            matrices[:, :3, 3] = [o.location for o in self]
+            buffer[:] = matrices.transpose(0, 2, 1).ravel()
+        elif attr == 'bound_box':
+            buffer[:] = np.tile(np.array([(x, y, z) for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)],
+                                         dtype=np.float32), (len(self), 1)).ravel()
+        else:
+            buffer[:] = False
@@ -0,0 +1,66 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Visibility passes on a scene cache that is still being built, with Blender's modules stubbed.
+
+Run with ``python -m unittest discover -s tests`` or ``python -m pytest tests`` from the add-on's directory.
+"""
+
+
+import types
+import unittest
+
+import numpy as np
+
+from stub_util import StubObject, StubObjects, import_addon
+
+
+class ApplyVisibilityTest(unittest.TestCase):
+
+    def setUp(self):
+        import_addon()
+        from nviewlive.SceneCache import SceneCache
+
+        self.objs = StubObjects(StubObject('Object.{}'.format(idx)) for idx in range(200))
+        self.context = types.SimpleNamespace(
+            scene=types.SimpleNamespace(name='Scene', objects=self.objs, collection=None),
+            view_layer=types.SimpleNamespace(layer_collection=types.SimpleNamespace(children=[])),
+            window_manager=types.SimpleNamespace(nl_use_budget=False, nl_budget_option='objects',
+                                                 nl_use_disk_cache=False, nl_over_budget_action='HIDE'))
+        self.scene_cache = SceneCache({'MESH'}, False, 0.1)
+
+    def test_partly_built_cache(self):
+        from nviewlive.frame_handler import apply_visibility
+
+        for use_groups in (False, True):
+            with self.subTest(use_groups=use_groups):
+                builder = self.scene_cache.iter_build(self.context, chunk_size=64)
+                cached, total = next(builder)
+                self.assertLess(cached, total)
+
+                visible = np.arange(cached) % 2 == 0
+                revealed, hidden = apply_visibility(self.scene_cache, visible, use_groups)
+                self.assertEqual((revealed, hidden), (0, cached // 2))
+                self.assertEqual([not o.hidden for o in self.objs[:cached]], visible.tolist())
+                self.assertTrue(all(not o.hidden for o in self.objs[cached:]))
+                np.testing.assert_array_equal(self.scene_cache.shown, visible)
+
+                for o in self.objs:
+                    o.hidden = False
+                for _ in builder:
+                    pass
+
+
+if __name__ == '__main__':
+    unittest.main()
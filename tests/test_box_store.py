@@ -0,0 +1,100 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Bounding boxes kept as shared local boxes and per-object world matrices."""
+
+
+import unittest
+
+import numpy as np
+
+from stub_util import import_addon
+
+
+def translation(x: float, y: float, z: float) -> np.ndarray:
+    """Returns a 4x4 translation matrix."""
+    matrix = np.identity(4)
+    matrix[:3, 3] = x, y, z
+    return matrix
+
+
+class BoxStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        import_addon()
+        from nviewlive.core.BoxStore import BoxStore
+
+        self.store = BoxStore()
+
+    def test_world_corners(self):
+        from nviewlive.core.cull_util import transformed_box_corners
+
+        rng = np.random.default_rng(4)
+        box_min = rng.uniform(-2.0, 0.0, (50, 3))
+        box_max = rng.uniform(0.0, 2.0, (50, 3))
+        matrices = np.tile(np.identity(4), (50, 1, 1))
+        matrices[:, :3, :3] = rng.uniform(-1.0, 1.0, (50, 3, 3))
+        matrices[:, :3, 3] = rng.uniform(-10.0, 10.0, (50, 3))
+        names = ['Object.{}'.format(idx) for idx in range(50)]
+
+        # every object uses one of 10 shared boxes, the last of each key's boxes being kept
+        keys = [idx % 10 for idx in range(50)]
+        rows = self.store.set_locals(keys, box_min, box_max)
+        self.store.set_objs(names, rows, matrices)
+        kept = np.arange(40, 50)[np.array(keys) % 10]
+        np.testing.assert_allclose(self.store.world_corners(names),
+                                   transformed_box_corners(box_min[kept], box_max[kept], matrices))
+
+    def test_shared_box_follows_key(self):
+        self.store.set_local('Mesh', (-1.0, -1.0, -1.0), (1.0, 1.0, 1.0))
+        self.store.set_obj('A', 'Mesh', translation(0.0, 0.0, 0.0))
+        self.store.set_obj('B', 'Mesh', translation(10.0, 0.0, 0.0))
+        self.store.set_local('Mesh', (-2.0, -2.0, -2.0), (2.0, 2.0, 2.0))
+        corners = self.store.world_corners(['A', 'B'])
+        np.testing.assert_allclose(corners.min(axis=1), ((-2.0, -2.0, -2.0), (8.0, -2.0, -2.0)))
+
+    def test_rows_are_reused(self):
+        self.store.set_local('Mesh', (-1.0, -1.0, -1.0), (1.0, 1.0, 1.0))
+        for idx in range(8):
+            self.store.set_obj('Object.{}'.format(idx), 'Mesh', translation(idx, 0.0, 0.0))
+        nbytes = self.store.nbytes
+        for _ in range(3):
+            for idx in range(8):
+                self.store.remove_obj('Object.{}'.format(idx))
+            self.store.drop_local('Mesh')
+            self.store.set_local('Mesh', (-1.0, -1.0, -1.0), (1.0, 1.0, 1.0))
+            for idx in range(8):
+                self.store.set_obj('Object.{}'.format(idx), 'Mesh', translation(idx, 0.0, 0.0))
+        self.assertEqual(self.store.nbytes, nbytes)
+        self.assertEqual(len(self.store), 8)
+
+    def test_dropped_key_kept_for_users(self):
+        self.store.set_local(('OBJECT', 'A'), (-1.0, -1.0, -1.0), (1.0, 1.0, 1.0))
+        self.store.set_obj('A', ('OBJECT', 'A'), translation(0.0, 0.0, 0.0))
+        self.store.drop_local(('OBJECT', 'A'))
+        self.assertFalse(self.store.has_local(('OBJECT', 'A')))
+        np.testing.assert_allclose(self.store.world_corners(['A']).max(axis=1), ((1.0, 1.0, 1.0),))
+
+    def test_rename(self):
+        self.store.set_local(('OBJECT', 'A'), (-1.0, -1.0, -1.0), (1.0, 1.0, 1.0))
+        self.store.set_obj('A', ('OBJECT', 'A'), translation(3.0, 0.0, 0.0))
+        self.store.rename_obj('A', 'B')
+        self.store.rename_local(('OBJECT', 'A'), ('OBJECT', 'B'))
+        self.assertNotIn('A', self.store)
+        self.assertTrue(self.store.has_local(('OBJECT', 'B')))
+        np.testing.assert_allclose(self.store.world_corners(['B']).min(axis=1), ((2.0, -1.0, -1.0),))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Culling with the bounding volume hierarchy, checked against testing every box."""
+
+
+import math
+import unittest
+
+import numpy as np
+
+from stub_util import import_addon
+
+
+class BoundBoxBVHTest(unittest.TestCase):
+
+    def setUp(self):
+        import_addon()
+        from nviewlive.core.StandInScene import StandInScene
+
+        self.scene = StandInScene(3000, seed=1)
+
+    def test_cull_matches_every_box(self):
+        from nviewlive.core.select_util import cull_indices
+
+        width, height = 1920, 1080
+        for view_idx in range(6):
+            camera_location, perspective_matrix = self.scene.orbit_view(math.tau * view_idx / 6)
+            for max_dist in (20.0, 60.0, np.inf):
+                for margin in (0.0, 100.0, -100.0):
+                    with self.subTest(view=view_idx, max_dist=max_dist, margin=margin):
+                        expected = cull_indices(self.scene.corners, camera_location, max_dist, perspective_matrix,
+                                                width, height, margin=margin)
+                        actual = cull_indices(self.scene.corners, camera_location, max_dist, perspective_matrix,
+                                              width, height, self.scene.bvh, margin)
+                        np.testing.assert_array_equal(actual, expected)
+
+    def test_query_partitions_boxes(self):
+        camera_location, perspective_matrix = self.scene.orbit_view(1.0)
+        inside, partial, outside = self.scene.bvh.query(camera_location, 40.0, perspective_matrix)
+        np.testing.assert_array_equal(np.sort(np.concatenate((inside, partial, outside))),
+                                      np.arange(len(self.scene.corners)))
+
+    def test_refit_follows_moved_boxes(self):
+        from nviewlive.core.select_util import cull_indices
+
+        camera_location, perspective_matrix = self.scene.orbit_view(0.5)
+        self.scene.corners[::7] += (15.0, -10.0, 5.0)
+        self.scene.bvh.refit()
+        expected = cull_indices(self.scene.corners, camera_location, 60.0, perspective_matrix, 1920, 1080)
+        actual = cull_indices(self.scene.corners, camera_location, 60.0, perspective_matrix, 1920, 1080,
+                              self.scene.bvh)
+        np.testing.assert_array_equal(actual, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Fingerprints and files of the persistent mesh statistics cache, with Blender's modules stubbed."""
+
+
+import os
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+from stub_util import import_addon
+
+
+class StubElements(list):
+    """Stand-in for a mesh element collection, e.g. ``mesh.vertices``, reading attributes with ``foreach_get``."""
+
+    def foreach_get(self, attr: str, buffer):
+        buffer[:] = [value for element in self for value in getattr(element, attr)]
+
+
+def element(**values) -> types.SimpleNamespace:
+    """Returns a mesh element whose attributes are sequences, as ``foreach_get`` flattens them."""
+    return types.SimpleNamespace(**{name: value if isinstance(value, tuple) else (value,)
+                                    for name, value in values.items()})
+
+
+def quad_object() -> types.SimpleNamespace:
+    """Returns a mesh object with a single quad, creased along its edges, and no modifiers."""
+    attributes = {'crease_edge': types.SimpleNamespace(data=StubElements(element(value=1.0) for _ in range(4)))}
+    mesh = types.SimpleNamespace(
+        vertices=StubElements(element(co=(x, y, 0.0)) for x, y in ((0, 0), (1, 0), (1, 1), (0, 1))),
+        polygons=StubElements([element(loop_total=4)]),
+        loops=StubElements(element(vertex_index=idx) for idx in range(4)),
+        attributes=attributes)
+    return types.SimpleNamespace(data=mesh, modifiers=[])
+
+
+class MeshStatsCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        import_addon()
+        patcher = mock.patch.object(sys.modules['bpy'].app, 'version', (4, 0, 0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fingerprint_follows_creases(self):
+        from nviewlive.budget.MeshStatsCache import mesh_fingerprint
+
+        obj = quad_object()
+        fingerprint = mesh_fingerprint(obj)
+        self.assertEqual(mesh_fingerprint(obj), fingerprint)
+        obj.data.attributes['crease_edge'].data[0].value = (0.0,)
+        self.assertNotEqual(mesh_fingerprint(obj), fingerprint)
+
+    def test_reads_vertex_groups(self):
+        from nviewlive.budget.MeshStatsCache import reads_vertex_groups
+
+        properties = [types.SimpleNamespace(identifier='vertex_group', type='STRING'),
+                      types.SimpleNamespace(identifier='invert_vertex_group', type='BOOLEAN')]
+        mask = types.SimpleNamespace(show_viewport=True, vertex_group='', invert_vertex_group=False,
+                                     bl_rna=types.SimpleNamespace(properties=properties))
+        obj = types.SimpleNamespace(modifiers=[mask])
+        self.assertFalse(reads_vertex_groups(obj))
+        mask.vertex_group = 'Group'
+        self.assertTrue(reads_vertex_groups(obj))
+        mask.show_viewport = False
+        self.assertFalse(reads_vertex_groups(obj))
+
+    def test_save_and_load(self):
+        from nviewlive.budget.MeshStatsCache import MeshStats, MeshStatsCache
+
+        stats = MeshStats(12, 8, (-1.0, -2.0, -3.0), (1.0, 2.0, 3.0))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            filepath = os.path.join(cache_dir, 'scene.nlcache')
+            mesh_stats = MeshStatsCache(filepath)
+            mesh_stats.entries[('Mesh', b'\x01' * 16)] = stats
+            mesh_stats.is_modified = True
+            mesh_stats.save()
+            self.assertEqual(MeshStatsCache(filepath).entries, {('Mesh', b'\x01' * 16): stats})
+
+
+if __name__ == '__main__':
+    unittest.main()
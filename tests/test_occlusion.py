@@ -0,0 +1,64 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Occlusion culling against the largest boxes on screen."""
+
+
+import math
+import unittest
+
+import numpy as np
+
+from stub_util import import_addon
+
+
+class OcclusionTest(unittest.TestCase):
+
+    def setUp(self):
+        import_addon()
+        from nviewlive.core.StandInScene import look_at_view_matrix, perspective_projection
+
+        # the camera looks down the Y axis
+        projection = perspective_projection(math.radians(60.0), 1.0, 0.1, 1000.0)
+        self.perspective_matrix = projection @ look_at_view_matrix(np.zeros(3), np.array((0.0, 1.0, 0.0)))
+
+    def occluded(self, box_min: list, box_max: list) -> np.ndarray:
+        from nviewlive.core.cull_util import box_corners
+        from nviewlive.core.occlusion_util import occlusion_mask
+
+        corners = box_corners(np.array(box_min, dtype=np.float64), np.array(box_max, dtype=np.float64))
+        return occlusion_mask(corners, self.perspective_matrix, 1.0, 4)
+
+    def test_box_behind_wall(self):
+        wall = ((-3.0, 10.0, -3.0), (3.0, 11.0, 3.0))
+        behind = ((-1.0, 30.0, -1.0), (1.0, 32.0, 1.0))
+        beside = ((12.0, 30.0, -1.0), (14.0, 32.0, 1.0))
+        in_front = ((-1.0, 3.0, -1.0), (1.0, 5.0, 1.0))
+        boxes = (wall, behind, beside, in_front)
+        occluded = self.occluded([box[0] for box in boxes], [box[1] for box in boxes])
+        np.testing.assert_array_equal(occluded, (False, True, False, False))
+
+    def test_box_crossing_view_plane(self):
+        wall = ((-3.0, 10.0, -3.0), (3.0, 11.0, 3.0))
+        crossing = ((-1.0, -1.0, -1.0), (1.0, 50.0, 1.0))
+        occluded = self.occluded([wall[0], crossing[0]], [wall[1], crossing[1]])
+        np.testing.assert_array_equal(occluded, (False, False))
+
+    def test_no_occluders(self):
+        occluded = self.occluded([(-1.0, 30.0, -1.0)], [(1.0, 32.0, 1.0)])
+        np.testing.assert_array_equal(occluded, (False,))
+
+
+if __name__ == '__main__':
+    unittest.main()
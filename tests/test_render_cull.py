@@ -0,0 +1,39 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Background renders with render culling, in a real Blender. Skipped unless ``blender`` is on the path,
+or the ``BLENDER`` environment variable names its executable.
+"""
+
+
+import os
+import shutil
+import subprocess
+import unittest
+
+script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blender_render_cull.py')
+blender = os.environ.get('BLENDER') or shutil.which('blender')
+
+
+@unittest.skipIf(blender is None, 'Blender is not installed')
+class RenderCullTest(unittest.TestCase):
+
+    def test_moving_camera(self):
+        result = subprocess.run([blender, '--background', '--factory-startup', '--python-exit-code', '1',
+                                 '--python', script_path], capture_output=True, text=True, timeout=600)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
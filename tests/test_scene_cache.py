@@ -0,0 +1,104 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Patching a built scene cache from depsgraph updates, with Blender's modules stubbed."""
+
+
+import sys
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from stub_util import StubObject, StubObjects, import_addon
+
+
+class PatchTest(unittest.TestCase):
+
+    def setUp(self):
+        import_addon()
+        from nviewlive.SceneCache import SceneCache
+
+        self.objs = StubObjects(StubObject('Object.{}'.format(idx)) for idx in range(100))
+        scene = sys.modules['bpy'].types.Scene()
+        scene.name, scene.objects, scene.collection = 'Scene', self.objs, None
+        self.context = types.SimpleNamespace(
+            scene=scene, visible_objects=list(self.objs),
+            view_layer=types.SimpleNamespace(layer_collection=types.SimpleNamespace(children=[])),
+            window_manager=types.SimpleNamespace(nl_use_budget=False, nl_budget_option='objects',
+                                                 nl_use_disk_cache=False, nl_over_budget_action='HIDE'))
+        self.scene_cache = SceneCache({'MESH'}, False, 0.1)
+        self.scene_cache.build(self.context)
+
+    def test_objects_revealed_outside_modal(self):
+        from nviewlive.frame_handler import apply_visibility
+
+        visible = np.arange(len(self.objs)) % 2 == 0
+        apply_visibility(self.scene_cache, visible)
+        self.scene_cache.toggled = set()
+
+        # like "Show Hidden objects": every object is revealed, and the scene is tagged
+        for o in self.objs:
+            o.hidden = False
+        self.patch_scene()
+        self.assertTrue(self.scene_cache.shown.all())
+
+        revealed, hidden = apply_visibility(self.scene_cache, visible)
+        self.assertEqual((revealed, hidden), (0, len(self.objs) // 2))
+        self.assertEqual([not o.hidden for o in self.objs], visible.tolist())
+
+    def test_scene_updated_without_visibility_change(self):
+        from nviewlive.frame_handler import apply_visibility
+
+        apply_visibility(self.scene_cache, np.arange(len(self.objs)) % 2 == 0)
+        self.patch_scene()
+
+        # like a selection change or a frame change: the scene is tagged, and nothing is revealed or hidden
+        self.scene_cache.toggled = set()
+        with mock.patch.object(StubObject, 'hide_get', side_effect=AssertionError('hide flags were re-read')):
+            self.patch_scene()
+
+    def test_baked_playback_after_live_pass(self):
+        from nviewlive.bake_handler import BakedVisibility
+        from nviewlive.core.VisibilityBake import VisibilityBake
+        from nviewlive.frame_handler import apply_visibility
+
+        rng = np.random.default_rng(3)
+        frames = [rng.random(len(self.objs)) < 0.5 for _ in range(3)]
+        bake = VisibilityBake(1, len(self.objs))
+        for visible in frames:
+            bake.add_frame(visible)
+        baked = BakedVisibility(list(self.objs), bake)
+
+        baked.apply(1, self.scene_cache)
+        # the modal culls live in between, e.g. while paused, then playback steps to the next baked frame
+        apply_visibility(self.scene_cache, rng.random(len(self.objs)) < 0.5)
+        baked.apply(2, self.scene_cache)
+        self.assertEqual([not o.hidden for o in self.objs], frames[1].tolist())
+        self.assertEqual(self.scene_cache.shown.tolist(), frames[1].tolist())
+
+        baked.apply(3, self.scene_cache)
+        self.assertEqual([not o.hidden for o in self.objs], frames[2].tolist())
+
+    def patch_scene(self):
+        """Patches the scene cache from a depsgraph update tagging the scene, counting its visible objects first."""
+        self.context.visible_objects = [o for o in self.objs if not o.hidden]
+        depsgraph = types.SimpleNamespace(scene=self.context.scene, updates=[types.SimpleNamespace(
+            id=self.context.scene, is_updated_geometry=False, is_updated_transform=False)])
+        self.scene_cache.patch(self.context, depsgraph)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Budget selection of visible boxes, checked against sorting every candidate and filling the budget one by one."""
+
+
+import math
+import unittest
+
+import numpy as np
+
+from stub_util import import_addon
+
+
+def reference_fill(costs: np.ndarray, limits: np.ndarray) -> np.ndarray:
+    """Returns indices of the costs that fit within their limits, taken one by one in order.
+
+    :param costs: budget costs, in priority order
+    :param limits: budget limit of each cost
+    """
+    taken, total = [], 0.0
+    for idx, cost in enumerate(costs):
+        if total + cost <= limits[idx]:
+            taken.append(idx)
+            total += cost
+    return np.array(taken, dtype=np.int64)
+
+
+class SelectVisibleTest(unittest.TestCase):
+
+    def setUp(self):
+        import_addon()
+        from nviewlive.core.StandInScene import StandInScene
+
+        self.scene = StandInScene(20000, seed=2)
+        self.width, self.height = 1920, 1080
+
+    def reference_selection(self, camera_location: np.ndarray, perspective_matrix: np.ndarray, max_dist: float,
+                            budget_limit: float, sort_order: str) -> np.ndarray:
+        """Returns the boxes to show, testing every box and sorting every candidate."""
+        from nviewlive.core.cull_util import screen_radii, visibility_mask
+        from nviewlive.core.select_util import budget_split, priority_keys
+
+        corners, costs = self.scene.corners, self.scene.costs
+        candidates = np.flatnonzero(visibility_mask(camera_location, corners, max_dist, perspective_matrix,
+                                                    self.width, self.height))
+        screen_sizes = screen_radii(corners[candidates], perspective_matrix, self.width, self.height)
+        keys = priority_keys(camera_location[np.newaxis], corners[candidates], costs[candidates],
+                             self.scene.origins[candidates], sort_order, screen_sizes)
+        ordered = candidates[np.lexsort(keys)]
+        if sort_order == 'value':
+            return ordered[reference_fill(costs[ordered], np.full(len(ordered), budget_limit))]
+        return ordered[:budget_split(costs[ordered], budget_limit)]
+
+    def test_matches_full_sort(self):
+        from nviewlive.core.select_util import sort_orders
+
+        for view_idx in range(4):
+            camera_location, perspective_matrix = self.scene.orbit_view(math.tau * view_idx / 4)
+            for sort_order in sort_orders:
+                for budget_limit in (2e5, 1e6, 1e8):
+                    with self.subTest(view=view_idx, sort_order=sort_order, budget_limit=budget_limit):
+                        expected = self.reference_selection(camera_location, perspective_matrix, 80.0,
+                                                            budget_limit, sort_order)
+                        selection = self.scene.select_visible(camera_location, perspective_matrix, 80.0,
+                                                              budget_limit, sort_order)
+                        np.testing.assert_array_equal(selection.shown, expected)
+                        self.assertEqual(len(selection.degraded), 0)
+
+    def test_degraded_fit_remaining_budget(self):
+        camera_location, perspective_matrix = self.scene.orbit_view(0.0)
+        degraded_costs = self.scene.costs / 10.0
+        selection = self.scene.select_visible(camera_location, perspective_matrix, 80.0, 1e6, 'distance',
+                                              degraded_costs=degraded_costs)
+        self.assertFalse(np.isin(selection.degraded, selection.shown).any())
+        self.assertLessEqual(self.scene.costs[selection.shown].sum() + degraded_costs[selection.degraded].sum(), 1e6)
+
+
+class KnapsackFillTest(unittest.TestCase):
+
+    def setUp(self):
+        import_addon()
+
+    def test_matches_one_by_one(self):
+        from nviewlive.core.select_util import knapsack_fill
+
+        rng = np.random.default_rng(3)
+        for trial in range(50):
+            costs = rng.integers(0, 100, rng.integers(1, 60)).astype(np.float64)
+            budget_limit = float(rng.integers(0, 1000))
+            shown = rng.random(len(costs)) < 0.5
+            for budget_band in (0.0, 0.1):
+                with self.subTest(trial=trial, budget_band=budget_band):
+                    limits = np.where(shown, budget_limit * (1.0 + budget_band), budget_limit)
+                    np.testing.assert_array_equal(knapsack_fill(costs, budget_limit, shown, budget_band),
+                                                  reference_fill(costs, limits))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Velocity of recorded view matrices, for predicting where a view is heading."""
+
+
+import unittest
+
+import numpy as np
+
+from stub_util import import_addon
+
+
+def view_at(x: float) -> np.ndarray:
+    """Returns the view matrix of a camera at a given position along the X axis.
+
+    :param x: camera position
+    """
+    camera = np.identity(4)
+    camera[0, 3] = x
+    return np.linalg.inv(camera)
+
+
+class ViewMotionTest(unittest.TestCase):
+
+    def setUp(self):
+        import_addon()
+        from nviewlive.core.ViewMotion import ViewMotion
+
+        self.view_motion = ViewMotion(window=0.5)
+        for step in range(5):
+            self.view_motion.add(step * 0.1, view_at(step * 1.0))
+
+    def test_moving_view(self):
+        linear, angular = self.view_motion.velocity(0.45)
+        np.testing.assert_allclose(linear, (10.0, 0.0, 0.0))
+        np.testing.assert_allclose(angular, 0.0, atol=1e-9)
+        self.assertTrue(self.view_motion.is_moving(0.45))
+        np.testing.assert_allclose(self.view_motion.predict(view_at(4.0), 0.2, 0.45), view_at(6.0), atol=1e-9)
+
+    def test_stopped_view(self):
+        # the view stays where it stopped, which records nothing new
+        self.view_motion.add(1.0, view_at(4.0))
+        self.assertFalse(self.view_motion.is_moving(1.0))
+        np.testing.assert_allclose(self.view_motion.predict(view_at(4.0), 0.2, 1.0), view_at(4.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
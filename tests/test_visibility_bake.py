@@ -0,0 +1,54 @@
+# Copyright (C) 2023 Spencer Magnusson
+# semagnum@gmail.com
+# Created by Spencer Magnusson
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Per-frame visibility stored as changes and keyframes."""
+
+
+import unittest
+
+import numpy as np
+
+from stub_util import import_addon
+
+
+class VisibilityBakeTest(unittest.TestCase):
+
+    def setUp(self):
+        import_addon()
+        from nviewlive.core.VisibilityBake import VisibilityBake
+
+        rng = np.random.default_rng(5)
+        self.frames = [rng.random(300) < 0.3 for _ in range(120)]
+        self.bake = VisibilityBake(10, 300, keyframe_interval=50)
+        for visible in self.frames:
+            self.bake.add_frame(visible)
+
+    def test_range(self):
+        self.assertEqual(self.bake.frame_end, 129)
+        self.assertTrue(self.bake.covers(10) and self.bake.covers(129))
+        self.assertFalse(self.bake.covers(9) or self.bake.covers(130))
+
+    def test_visible_at(self):
+        for offset, visible in enumerate(self.frames):
+            np.testing.assert_array_equal(self.bake.visible_at(10 + offset), visible)
+
+    def test_changed(self):
+        for offset in range(1, len(self.frames)):
+            np.testing.assert_array_equal(self.bake.changed(10 + offset),
+                                          np.flatnonzero(self.frames[offset] != self.frames[offset - 1]))
+        np.testing.assert_array_equal(self.bake.changed(10), np.flatnonzero(self.frames[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()